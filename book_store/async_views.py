@@ -0,0 +1,119 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.template.response import SimpleTemplateResponse
+from rest_framework import exceptions
+from rest_framework.views import APIView
+from .metrics import timer
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers are coroutines, for serving under ASGI.
+
+    Django runs the view directly on the event loop. Authentication uses the
+    aauthenticate() method of authenticators that provide one, so requests with
+    stateless tokens are authenticated without leaving the loop. Other
+    authenticators run in a thread. Throttles are checked with their
+    aallow_request() method when they provide one, so throttle stores doing
+    I/O are queried in a thread. The response is rendered in the view and
+    returned as a plain HttpResponse, which Django would otherwise render in a
+    thread. Responses providing a 'rendered_class' attribute are returned as an
+    instance of that HttpResponse subclass instead.
+
+    Handlers must not make blocking calls. They use the async ORM and the async
+    cache API, and run blocking work like file I/O with sync_to_async.
+
+    Methods:
+    - dispatch(self, request, *args, **kwargs): Async version of APIView.dispatch.
+    - aperform_authentication(self, request): Authenticates the request.
+    - acheck_throttles(self, request): Throttles the request, after the permissions are checked.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.aperform_authentication(request)
+            self.initial(request, *args, **kwargs)
+            await self.acheck_throttles(request)
+            handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            response = handler(request, *args, **kwargs)
+            if not isinstance(response, HttpResponse):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.detach_rendering(self.response)
+
+    async def aperform_authentication(self, request):
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, "aauthenticate"):
+                    user_auth_tuple = await authenticator.aauthenticate(request)
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+        request._not_authenticated()
+
+    def check_throttles(self, request):
+        # Called by initial(), the throttles are checked by acheck_throttles() instead.
+        pass
+
+    async def acheck_throttles(self, request):
+        durations = []
+        for throttle in self.get_throttles():
+            if hasattr(throttle, "aallow_request"):
+                allowed = await throttle.aallow_request(request, self)
+            else:
+                allowed = await sync_to_async(throttle.allow_request)(request, self)
+            if not allowed:
+                durations.append(throttle.wait())
+
+        if durations:
+            durations = [duration for duration in durations if duration is not None]
+            self.throttled(request, max(durations, default=None))
+
+    def detach_rendering(self, response):
+        if not isinstance(response, SimpleTemplateResponse):
+            return response
+        with timer("render"):
+            response.render()
+        rendered_class = getattr(response, "rendered_class", HttpResponse)
+        rendered = rendered_class(
+            response.content, status=response.status_code, headers=response.headers
+        )
+        rendered.cookies = response.cookies
+        # Keeps the unrendered data available like on DRF responses, e.g. for
+        # tests. Responses decoding it from their content on access skip this.
+        if "data" in vars(response):
+            rendered.data = response.data
+        return rendered
+
+
+async def get_request_data(request):
+    """
+    Returns the parsed body of a request, parsing it in a worker thread.
+
+    Multipart bodies with cover images are spooled to temporary files, so the
+    parsing does blocking file I/O.
+
+    Args:
+    - request: The DRF request object.
+
+    Returns:
+    - The parsed request data.
+    """
+
+    return await sync_to_async(lambda: request.data, thread_sensitive=False)()
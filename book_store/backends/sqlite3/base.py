@@ -0,0 +1,61 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+
+DEFAULT_PRAGMAS = {
+    # Readers no longer block the writer and vice versa.
+    "journal_mode": "WAL",
+    # Durable across application crashes, commits skip the fsync of the WAL.
+    "synchronous": "NORMAL",
+    # Milliseconds a connection waits for a lock before failing.
+    "busy_timeout": 5000,
+    # Page cache per connection, negative values are in KiB.
+    "cache_size": -20000,
+    "temp_store": "MEMORY",
+    # Bytes of the database file read through memory mapping.
+    "mmap_size": 128 * 1024 * 1024,
+}
+
+TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend applying pragmas to every new connection.
+
+    The pragmas are set with the 'pragmas' key of OPTIONS, merged over
+    DEFAULT_PRAGMAS. The 'transaction_mode' key sets how transactions begin;
+    with 'IMMEDIATE' a transaction takes the write lock when it starts, so a
+    concurrent writer waits for the busy timeout instead of failing with
+    'database is locked' when a deferred transaction upgrades its lock. All
+    other OPTIONS are passed to sqlite3.connect() as usual.
+
+    Methods:
+    - get_connection_params(self): Returns the arguments of sqlite3.connect().
+    - get_new_connection(self, conn_params): Opens a connection and applies the pragmas.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        options = self.settings_dict["OPTIONS"]
+        self.pragmas = {**DEFAULT_PRAGMAS, **options.get("pragmas", {})}
+        self.transaction_mode = options.get("transaction_mode", "DEFERRED").upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"transaction_mode must be one of {', '.join(TRANSACTION_MODES)}."
+            )
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("pragmas", None)
+        params.pop("transaction_mode", None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {self.transaction_mode}")
@@ -0,0 +1,443 @@
+import hmac
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+
+
+DEFAULT_METRICS = {
+    "ENABLED": True,
+    # Share of requests whose time is broken down into phases, from 0 to 1.
+    "SAMPLE_RATE": 0.0,
+    # Send the phases of sampled requests in a Server-Timing header.
+    "SERVER_TIMING": True,
+    # Client addresses allowed to read /metrics.
+    "ALLOWED_IPS": ["127.0.0.1", "::1"],
+    # Bearer token scrapers send to read /metrics. Without one, only staff
+    # members signed in to the admin can read them.
+    "TOKEN": None,
+}
+
+# Phases of a sampled request, in the order of the Server-Timing header.
+PHASES = ("db", "auth", "serialize", "render")
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+current_metrics = ContextVar("current_metrics", default=None)
+
+# Callables receiving every query timed by record_query(), see add_query_observer().
+query_observers = []
+
+
+def get_metrics_settings():
+    return {**DEFAULT_METRICS, **getattr(settings, "METRICS", {})}
+
+
+class RequestMetrics:
+    """
+    The measurements of a single sampled request.
+
+    Attributes:
+    - durations: Seconds spent per phase.
+    - queries: Number of SQL queries.
+
+    Methods:
+    - add(self, phase, duration): Adds seconds to a phase.
+    """
+
+    def __init__(self):
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self.active = set()
+
+    def add(self, phase, duration):
+        self.durations[phase] += duration
+
+
+@contextmanager
+def timer(phase):
+    """
+    Adds the time spent in the block to a phase of the current request.
+
+    Does nothing unless the request is sampled. Nested blocks of the same
+    phase are only counted once, blocks of different phases may overlap,
+    e.g. the queries made while serializing count for both.
+
+    Args:
+    - phase: One of PHASES.
+    """
+
+    metrics = current_metrics.get()
+    if metrics is None or phase in metrics.active:
+        yield
+        return
+    metrics.active.add(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(phase, time.perf_counter() - start)
+        metrics.active.discard(phase)
+
+
+class TimedSerializerMixin:
+    """
+    Serializer mixin adding the time spent converting data to the 'serialize' phase.
+
+    Covers to_representation() and to_internal_value(), also for every item
+    of a serializer with many=True.
+    """
+
+    def to_representation(self, instance):
+        with timer("serialize"):
+            return super().to_representation(instance)
+
+    def to_internal_value(self, data):
+        with timer("serialize"):
+            return super().to_internal_value(data)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper timing queries, the only one the project installs.
+
+    Counts and times the queries of sampled requests, and hands every
+    successful query with its duration in seconds to the query observers,
+    e.g. the slow-query log of the diagnostics app. Without observers, only
+    the queries of sampled requests are timed.
+    """
+
+    metrics = current_metrics.get()
+    if metrics is None and not query_observers:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        result = execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        if metrics is not None:
+            metrics.queries += 1
+            metrics.add("db", duration)
+    for observer in query_observers:
+        observer(sql, params, many, context, duration)
+    return result
+
+
+def add_query_observer(observer):
+    """
+    Registers a callable receiving every query timed by record_query().
+
+    Args:
+    - observer: Called with sql, params, many, context and the duration in seconds.
+    """
+
+    if observer not in query_observers:
+        query_observers.append(observer)
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    """
+    Signal handler for connection_created adding record_query() to a connection.
+
+    Connections of the current thread opened before the first request are
+    covered by MetricsMiddleware and DiagnosticsMiddleware.
+    """
+
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder, dispatch_uid="book_store_metrics")
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms of the current process, in the Prometheus text format.
+
+    Every process keeps its own registry, so each worker is scraped separately.
+
+    Methods:
+    - inc(self, name, labels, value=1): Increments a counter.
+    - observe(self, name, labels, value, buckets): Adds a value to a histogram.
+    - render(self): Returns the metrics in the Prometheus text format.
+    - clear(self): Resets every metric.
+    """
+
+    descriptions = {
+        "book_store_requests_total": ("counter", "Requests handled, by view, method and status."),
+        "book_store_request_duration_seconds": (
+            "histogram",
+            "Time spent handling requests, including the middleware, by view.",
+        ),
+        "book_store_sampled_requests_total": ("counter", "Requests broken down into phases."),
+        "book_store_phase_duration_seconds": (
+            "histogram",
+            "Time spent per phase of sampled requests, by view and phase.",
+        ),
+        "book_store_db_queries_total": ("counter", "SQL queries made by sampled requests."),
+        "book_store_response_size_bytes": (
+            "histogram",
+            "Size of the response bodies of sampled requests, by view.",
+        ),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.counters = defaultdict(float)
+            self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[name, labels] += value
+
+    def observe(self, name, labels, value, buckets):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[name, labels] = [buckets, [0] * len(buckets), 0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[1][index] += 1
+                    break
+            histogram[2] += value
+            histogram[3] += 1
+
+    def render(self):
+        with self.lock:
+            samples = defaultdict(list)
+            for (name, labels), value in self.counters.items():
+                samples[name].append(f"{name}{format_labels(labels)} {format_value(value)}")
+            for (name, labels), (buckets, counts, total, count) in self.histograms.items():
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    bucket_labels = format_labels((*labels, ("le", format_value(bound))))
+                    samples[name].append(f"{name}_bucket{bucket_labels} {cumulative}")
+                samples[name].append(
+                    f"{name}_bucket{format_labels((*labels, ('le', '+Inf')))} {count}"
+                )
+                samples[name].append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+                samples[name].append(f"{name}_count{format_labels(labels)} {count}")
+
+        lines = []
+        for name, (kind, description) in self.descriptions.items():
+            if name in samples:
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+                lines += samples[name]
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def format_value(value):
+    return repr(float(value))
+
+
+registry = MetricsRegistry()
+
+
+def get_view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    view_class = getattr(match.func, "view_class", None)
+    return view_class.__name__ if view_class is not None else match.view_name
+
+
+class MetricsMiddleware:
+    """
+    Middleware recording the time and size of every request per view.
+
+    Every request is counted and its duration is recorded per view. A share
+    of SAMPLE_RATE requests is sampled: their SQL queries are counted and
+    timed, and the time spent authenticating, serializing and rendering is
+    measured, see timer(). The phases of sampled requests are sent in a
+    Server-Timing header, and all metrics are exposed in the Prometheus
+    format by metrics_view(). Unsampled requests only pay for two clock
+    reads and a counter update.
+
+    Must be the first middleware, so the durations include all others.
+
+    Methods:
+    - process_template_response(self, request, response): Times the rendering of the response.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        options = get_metrics_settings()
+        if not options["ENABLED"]:
+            return self.get_response(request)
+        metrics = self.start_sample(options)
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        self.record(request, response, metrics, time.perf_counter() - start, options)
+        return response
+
+    async def __acall__(self, request):
+        options = get_metrics_settings()
+        if not options["ENABLED"]:
+            return await self.get_response(request)
+        metrics = self.start_sample(options)
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        self.record(request, response, metrics, time.perf_counter() - start, options)
+        return response
+
+    def start_sample(self, options):
+        if random.random() >= options["SAMPLE_RATE"]:
+            return None
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection=connection)
+        return RequestMetrics()
+
+    def process_template_response(self, request, response):
+        metrics = current_metrics.get()
+        if metrics is None or response.is_rendered:
+            return response
+        start = time.perf_counter()
+
+        def record_rendering(response):
+            metrics.add("render", time.perf_counter() - start)
+
+        response.add_post_render_callback(record_rendering)
+        return response
+
+    def record(self, request, response, metrics, duration, options):
+        view = get_view_name(request)
+        registry.inc(
+            "book_store_requests_total",
+            (("view", view), ("method", request.method), ("status", response.status_code)),
+        )
+        registry.observe(
+            "book_store_request_duration_seconds", (("view", view),), duration, DURATION_BUCKETS
+        )
+        if metrics is None:
+            return
+
+        registry.inc("book_store_sampled_requests_total", (("view", view),))
+        registry.inc("book_store_db_queries_total", (("view", view),), metrics.queries)
+        for phase, phase_duration in metrics.durations.items():
+            registry.observe(
+                "book_store_phase_duration_seconds",
+                (("view", view), ("phase", phase)),
+                phase_duration,
+                DURATION_BUCKETS,
+            )
+        if not response.streaming:
+            registry.observe(
+                "book_store_response_size_bytes",
+                (("view", view),),
+                len(response.content),
+                SIZE_BUCKETS,
+            )
+        if options["SERVER_TIMING"]:
+            response["Server-Timing"] = format_server_timing(metrics, duration)
+
+
+def format_server_timing(metrics, duration):
+    """
+    Builds the Server-Timing header of a sampled request.
+
+    Args:
+    - metrics: The RequestMetrics of the request.
+    - duration: The total time in seconds.
+
+    Returns:
+    - str: The header value, with durations in milliseconds.
+    """
+
+    entries = [f'db;dur={metrics.durations["db"] * 1000:.2f};desc="{metrics.queries} queries"']
+    entries += [
+        f"{phase};dur={metrics.durations[phase] * 1000:.2f}" for phase in PHASES if phase != "db"
+    ]
+    entries.append(f"total;dur={duration * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def has_metrics_access(request, token):
+    """
+    Returns whether a request may read the metrics.
+
+    Behind a reverse proxy every client has the address of the proxy, so the
+    address alone does not identify a scraper. The request must also carry the
+    configured bearer token, or come from a staff member signed in to the admin.
+
+    Args:
+    - request: The HTTP request object.
+    - token: The TOKEN setting, None if no token is configured.
+
+    Returns:
+    - bool: Whether the metrics may be returned.
+    """
+
+    user = getattr(request, "user", None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+    if not token:
+        return False
+    scheme, _, credentials = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(
+        credentials.strip().encode(), token.encode()
+    )
+
+
+def metrics_view(request):
+    """
+    Returns the metrics of this process in the Prometheus text format.
+
+    Only clients listed in ALLOWED_IPS that send the TOKEN or are signed in as
+    staff may read them, others get a 404.
+
+    Args:
+    - request: The HTTP request object.
+
+    Returns:
+    - HttpResponse: The metrics.
+    """
+
+    metrics_settings = get_metrics_settings()
+    if request.META.get("REMOTE_ADDR") not in metrics_settings["ALLOWED_IPS"]:
+        raise Http404()
+    if not has_metrics_access(request, metrics_settings["TOKEN"]):
+        raise Http404()
+    return HttpResponse(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
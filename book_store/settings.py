@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -44,17 +45,23 @@ INSTALLED_APPS = [
     "rest_framework_simplejwt",
     "users",
     "books",
+    "diagnostics",
 ]
 
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CustomJWTAuthentication",
     ),
     "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
-        "rest_framework_xml.renderers.XMLRenderer",
+        "books.renderers.FastJSONRenderer",
+        "books.renderers.StreamingXMLRenderer",
     ],
+    "DEFAULT_THROTTLE_CLASSES": ["book_store.throttling.TokenBucketThrottle"],
+    # Number of reverse proxies in front of the application. With 0, anonymous
+    # throttle buckets are keyed by REMOTE_ADDR and X-Forwarded-For, which the
+    # client controls, is ignored. Behind one proxy, set BOOK_STORE_NUM_PROXIES=1.
+    "NUM_PROXIES": int(os.environ.get("BOOK_STORE_NUM_PROXIES", 0)),
 }
 
 SIMPLE_JWT = {
@@ -63,16 +70,28 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_LIFETIME": timedelta(days=30),
     "SLIDING_TOKEN_REFRESH_LIFETIME_LATE_USER": timedelta(days=1),
     "SLIDING_TOKEN_LIFETIME_LATE_USER": timedelta(days=30),
+    "TOKEN_OBTAIN_SERIALIZER": "users.serializers.CustomTokenObtainPairSerializer",
+    "TOKEN_USER_CLASS": "users.authentication.CustomTokenUser",
+}
+
+# Access tokens carrying the user claims authenticate requests without a user
+# query, and validated tokens are cached in memory per process.
+TOKEN_AUTHENTICATION = {
+    "STATELESS": os.environ.get("BOOK_STORE_STATELESS_TOKENS", "1") == "1",
+    "CACHE_SIZE": 1024,
 }
 
 MIDDLEWARE = [
+    "book_store.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "diagnostics.middleware.DiagnosticsMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "books.routers.ReplicaRoutingMiddleware",
 ]
 
 ROOT_URLCONF = "book_store.urls"
@@ -95,15 +114,250 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "book_store.wsgi.application"
 
+ASGI_APPLICATION = "book_store.asgi.application"
+
+# Serve the book list, detail and user book views with their async versions
+# (books/async_views.py). Only worthwhile when running under an ASGI server.
+ASYNC_VIEWS = os.environ.get("BOOK_STORE_ASYNC_VIEWS", "0") == "1"
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# BOOK_STORE_DATABASE selects the profile: "sqlite" (default) or "postgresql".
+# SQLite connections run in WAL mode with the pragmas of
+# book_store/backends/sqlite3/base.py, so readers do not block the writer, and
+# writers queue for the lock. WAL mode is stored in the database file, so the
+# db.sqlite3 checked into the repository keeps the rollback journal unless
+# BOOK_STORE_DB_JOURNAL_MODE says otherwise; databases named with
+# BOOK_STORE_DB_NAME use WAL. PostgreSQL connections are kept open for
+# BOOK_STORE_DB_CONN_MAX_AGE seconds and checked before reuse. Set
+# BOOK_STORE_DB_POOLER=1 when connecting through a transaction pooler like
+# PgBouncer, which does not support server-side cursors. PostgreSQL requires psycopg.
+
+SQLITE_NAME = os.environ.get("BOOK_STORE_DB_NAME")
+
+DATABASE_PROFILES = {
+    "sqlite": {
+        "ENGINE": "book_store.backends.sqlite3",
+        "NAME": SQLITE_NAME or BASE_DIR / "db.sqlite3",
+        "CONN_MAX_AGE": int(os.environ.get("BOOK_STORE_DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "timeout": 20,
+            "transaction_mode": "IMMEDIATE",
+            "pragmas": {
+                "busy_timeout": 20000,
+                "journal_mode": os.environ.get(
+                    "BOOK_STORE_DB_JOURNAL_MODE", "WAL" if SQLITE_NAME else "DELETE"
+                ),
+            },
+        },
+    },
+    "postgresql": {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("BOOK_STORE_DB_NAME", "book_store"),
+        "USER": os.environ.get("BOOK_STORE_DB_USER", "book_store"),
+        "PASSWORD": os.environ.get("BOOK_STORE_DB_PASSWORD", ""),
+        "HOST": os.environ.get("BOOK_STORE_DB_HOST", "127.0.0.1"),
+        "PORT": os.environ.get("BOOK_STORE_DB_PORT", "5432"),
+        "CONN_MAX_AGE": int(os.environ.get("BOOK_STORE_DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
+        "DISABLE_SERVER_SIDE_CURSORS": os.environ.get("BOOK_STORE_DB_POOLER") == "1",
+        "OPTIONS": {"connect_timeout": 5},
+    },
+}
+
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+    "default": DATABASE_PROFILES[os.environ.get("BOOK_STORE_DATABASE", "sqlite")],
+}
+
+# Read replicas
+# BOOK_STORE_DB_REPLICAS lists copies of the primary, as comma-separated SQLite
+# files or PostgreSQL hosts. Anonymous reads of the public book endpoints are
+# routed to them (see books/routers.py). Clients read from the primary for
+# REPLICA_MAX_LAG seconds after a write, and responses read from a replica are
+# not cached before the last write is that old. "python manage.py
+# sync_replicas" copies the primary into SQLite replicas.
+
+DATABASE_REPLICAS = []
+REPLICA_LOCATIONS = os.environ.get("BOOK_STORE_DB_REPLICAS", "")
+REPLICA_LOCATION_KEY = "NAME" if DATABASES["default"]["ENGINE"].endswith("sqlite3") else "HOST"
+for index, location in enumerate(filter(None, map(str.strip, REPLICA_LOCATIONS.split(",")))):
+    alias = f"replica{index + 1}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        REPLICA_LOCATION_KEY: location,
+        "TEST": {"MIRROR": "default"},
     }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["books.routers.ReplicaRouter"]
+
+REPLICA_MAX_LAG = float(os.environ.get("BOOK_STORE_REPLICA_MAX_LAG", 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# BOOK_STORE_CACHE selects the backend: "locmem" (default), "file" or "redis".
+# The "books" alias holds rendered book responses, which are invalidated when
+# books or authors change (see books/cache.py). A write only reaches the cache
+# of the process handling it, so with locmem the entries of other processes
+# expire after BOOK_STORE_CACHE_TIMEOUT seconds (default 60). The shared
+# backends keep them until they are invalidated. Deployments with more than
+# one worker process must use a shared backend for current responses.
+
+CACHE_PROFILES = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "book-store",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get("BOOK_STORE_CACHE_DIR", BASE_DIR / "cache"),
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    "redis": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("BOOK_STORE_REDIS_URL", "redis://127.0.0.1:6379"),
+    },
+}
+
+CACHE_NAME = os.environ.get("BOOK_STORE_CACHE", "locmem")
+CACHE_PROFILE = CACHE_PROFILES[CACHE_NAME]
+CACHE_TIMEOUT = os.environ.get("BOOK_STORE_CACHE_TIMEOUT", "60" if CACHE_NAME == "locmem" else "")
+
+CACHES = {
+    "default": CACHE_PROFILE,
+    "books": {
+        **CACHE_PROFILE,
+        "KEY_PREFIX": "books",
+        "TIMEOUT": int(CACHE_TIMEOUT) if CACHE_TIMEOUT else None,
+    },
+}
+
+
+# Cover images
+# Uploaded covers are resized into the listed widths and formats by a pool of
+# background workers (see books/covers.py). EAGER processes them synchronously.
+
+COVER_PROCESSING = {
+    "WIDTHS": [160, 480],
+    "FORMATS": ["webp", "avif"],
+    "QUALITY": 80,
+    "WORKERS": int(os.environ.get("BOOK_STORE_COVER_WORKERS", 2)),
+    "EAGER": False,
+}
+
+
+# Metrics
+# MetricsMiddleware (book_store/metrics.py) counts and times every request per
+# view. BOOK_STORE_METRICS_SAMPLE_RATE sets the share of requests whose SQL,
+# authentication, serialization and rendering time is measured and sent in a
+# Server-Timing header. Everything is exposed at /metrics for local scrapers
+# sending BOOK_STORE_METRICS_TOKEN as bearer token, and for staff members.
+
+METRICS = {
+    "ENABLED": os.environ.get("BOOK_STORE_METRICS", "1") == "1",
+    "SAMPLE_RATE": float(os.environ.get("BOOK_STORE_METRICS_SAMPLE_RATE", 0)),
+    "SERVER_TIMING": True,
+    "ALLOWED_IPS": ["127.0.0.1", "::1"],
+    "TOKEN": os.environ.get("BOOK_STORE_METRICS_TOKEN") or None,
+}
+
+
+# Diagnostics
+# Queries slower than BOOK_STORE_SLOW_QUERY_MS milliseconds are logged in the
+# background and listed in the admin, an empty value disables the log. Staff
+# members profile a request by sending an X-Profile header or a ?profile=1
+# query parameter, see diagnostics/middleware.py.
+
+SLOW_QUERY_MS = os.environ.get("BOOK_STORE_SLOW_QUERY_MS", "200")
+
+DIAGNOSTICS = {
+    "SLOW_QUERY_MS": float(SLOW_QUERY_MS) if SLOW_QUERY_MS else None,
+    "MAX_SLOW_QUERIES": 10000,
+    "MAX_PROFILE_REPORTS": 500,
+    "LOG_PARAMS": os.environ.get("BOOK_STORE_LOG_QUERY_PARAMS") == "1",
+    "PROFILE_HEADER": "X-Profile",
+    "PROFILE_PARAM": "profile",
+    "EXPLAIN": True,
+}
+
+
+# Throttling
+# Requests take tokens from a bucket per user, or per client address when
+# anonymous, and get a 429 response once it is empty (see
+# book_store/throttling.py). Searches and listings cost more than detail reads,
+# and signup and token requests have their own, smaller bucket per address.
+# BOOK_STORE_THROTTLE_STORE selects where buckets are kept: "memory" (per
+# process, default), "sqlite" (shared by the processes of a host) or "redis"
+# (requires the redis package). Tests turn throttling off in their base classes
+# (book_store/testing.py).
+
+THROTTLING = {
+    "ENABLED": os.environ.get("BOOK_STORE_THROTTLING", "1") == "1",
+    "STORE": os.environ.get("BOOK_STORE_THROTTLE_STORE", "memory"),
+    "SQLITE_PATH": os.environ.get("BOOK_STORE_THROTTLE_DB", BASE_DIR / "throttle.sqlite3"),
+    "REDIS_URL": os.environ.get("BOOK_STORE_REDIS_URL", "redis://127.0.0.1:6379"),
+    "RATES": {
+        "anon": {"CAPACITY": 60, "REFILL_RATE": 1.0},
+        "user": {"CAPACITY": 120, "REFILL_RATE": 2.0},
+        "auth": {"CAPACITY": 10, "REFILL_RATE": 0.2},
+    },
+    "COSTS": {"default": 1, "detail": 1, "list": 2, "search": 5, "export": 20, "bulk": 1},
+}
+
+
+# Catalogue store
+# BOOK_STORE_CATALOGUE=1 serves book listings and searches from an in-memory
+# snapshot of all books per process (see books/catalogue.py), kept in sync on
+# every write and checked against the database for writes of other processes.
+# BOOK_STORE_CATALOGUE_MAX_MB bounds its estimated size, beyond which only the
+# books with the lowest IDs are held.
+
+CATALOGUE_STORE = {
+    "ENABLED": os.environ.get("BOOK_STORE_CATALOGUE", "0") == "1",
+    "MAX_BYTES": (
+        int(float(os.environ["BOOK_STORE_CATALOGUE_MAX_MB"]) * 1024 * 1024)
+        if os.environ.get("BOOK_STORE_CATALOGUE_MAX_MB")
+        else None
+    ),
+}
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/5.0/topics/auth/passwords/
+# New passwords are hashed with the preferred profile, chosen with
+# BOOK_STORE_PASSWORD_HASHER, and hashes of the other hashers, or with outdated
+# cost parameters, are upgraded on the next login. Argon2 requires argon2-cffi.
+PASSWORD_HASHER_PROFILES = {
+    "scrypt": "users.hashers.TunedScryptPasswordHasher",
+    "argon2": "users.hashers.TunedArgon2PasswordHasher",
+    "pbkdf2": "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+}
+
+PASSWORD_HASHER = os.environ.get("BOOK_STORE_PASSWORD_HASHER", "scrypt")
+
+PASSWORD_HASHERS = [
+    PASSWORD_HASHER_PROFILES[PASSWORD_HASHER],
+    *(
+        hasher
+        for name, hasher in PASSWORD_HASHER_PROFILES.items()
+        if name != PASSWORD_HASHER
+    ),
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+]
+
+PASSWORD_HASHING = {
+    "SCRYPT": {
+        "WORK_FACTOR": int(os.environ.get("BOOK_STORE_SCRYPT_N", 2**14)),
+        "BLOCK_SIZE": 8,
+        "PARALLELISM": 1,
+    },
+    "ARGON2": {"TIME_COST": 2, "MEMORY_COST": 19456, "PARALLELISM": 1},
+    "WORKERS": None,
 }
 
 
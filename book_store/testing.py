@@ -0,0 +1,23 @@
+from django import test
+from django.test import override_settings
+from rest_framework import test as drf_test
+
+
+# Throttling is enabled unless BOOK_STORE_THROTTLING=0, and all test clients
+# share one address, so the test cases turn it off. Tests of throttling
+# enable it again with their own THROTTLING setting.
+THROTTLING_DISABLED = {"ENABLED": False}
+
+
+@override_settings(THROTTLING=THROTTLING_DISABLED)
+class APITestCase(drf_test.APITestCase):
+    """
+    DRF's APITestCase with throttling turned off.
+    """
+
+
+@override_settings(THROTTLING=THROTTLING_DISABLED)
+class TransactionTestCase(test.TransactionTestCase):
+    """
+    Django's TransactionTestCase with throttling turned off.
+    """
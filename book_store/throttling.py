@@ -0,0 +1,326 @@
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+DEFAULT_THROTTLING = {
+    "ENABLED": True,
+    # Where the buckets are kept: "memory" (per process), "sqlite" or "redis".
+    "STORE": "memory",
+    "SQLITE_PATH": "throttle.sqlite3",
+    "REDIS_URL": "redis://127.0.0.1:6379",
+    # Number of buckets the memory store keeps, least recently used ones are dropped.
+    "MAX_ENTRIES": 100000,
+    # Bucket size and tokens added per second, by scope. Authenticated users
+    # get a bucket per user, everyone else a bucket per client address.
+    "RATES": {
+        "anon": {"CAPACITY": 60, "REFILL_RATE": 1.0},
+        "user": {"CAPACITY": 120, "REFILL_RATE": 2.0},
+        "auth": {"CAPACITY": 10, "REFILL_RATE": 0.2},
+    },
+    # Tokens a request takes, by the throttle cost of its view. "bulk" is per operation.
+    "COSTS": {"default": 1, "detail": 1, "list": 2, "search": 5, "export": 20, "bulk": 1},
+}
+
+
+def get_throttling_settings():
+    return {**DEFAULT_THROTTLING, **getattr(settings, "THROTTLING", {})}
+
+
+class MemoryBucketStore:
+    """
+    Token buckets kept in the memory of the current process.
+
+    The cheapest store, but every worker process enforces the limits on its
+    own, so a client may get the capacity once per process.
+
+    Methods:
+    - consume(self, key, cost, capacity, refill_rate): Takes tokens from a bucket.
+    - clear(self): Removes all buckets.
+    """
+
+    blocking = False
+
+    def __init__(self, options):
+        self.max_entries = options["MAX_ENTRIES"]
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def consume(self, key, cost, capacity, refill_rate):
+        """
+        Takes tokens from a bucket if it holds enough.
+
+        A bucket starts full and is refilled continuously at refill_rate
+        tokens per second, up to its capacity.
+
+        Args:
+        - key: The key of the bucket.
+        - cost: The number of tokens to take, at most the capacity.
+        - capacity: The maximum number of tokens in the bucket.
+        - refill_rate: The tokens added per second.
+
+        Returns:
+        - float: 0 if the tokens were taken, else the seconds until the bucket holds enough.
+        """
+
+        now = time.time()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (capacity, now))
+            tokens, wait = take_tokens(tokens, updated, now, cost, capacity, refill_rate)
+            self.buckets[key] = (tokens, now)
+            while len(self.buckets) > self.max_entries:
+                # Least recently used buckets are the most likely to be full again.
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class SQLiteBucketStore:
+    """
+    Token buckets kept in a SQLite database shared by all processes of a host.
+
+    Every bucket is updated in an immediate transaction, so concurrent
+    workers never take the same tokens twice. The database is separate from
+    the application database, so throttling never waits for its writers.
+    Buckets are deleted once they would be full again.
+
+    Methods:
+    - consume(self, key, cost, capacity, refill_rate): Takes tokens from a bucket.
+    - clear(self): Removes all buckets.
+    """
+
+    blocking = True
+
+    def __init__(self, options):
+        self.path = str(options["SQLITE_PATH"])
+        self.local = threading.local()
+        self.calls = 0
+
+    def get_connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, "
+                "full_at REAL NOT NULL) WITHOUT ROWID"
+            )
+            self.local.connection = connection
+        return connection
+
+    def consume(self, key, cost, capacity, refill_rate):
+        connection = self.get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = connection.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated = row or (capacity, now)
+            tokens, wait = take_tokens(tokens, updated, now, cost, capacity, refill_rate)
+            connection.execute(
+                "INSERT INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "tokens = excluded.tokens, updated = excluded.updated, full_at = excluded.full_at",
+                (key, tokens, now, now + (capacity - tokens) / refill_rate),
+            )
+            self.calls += 1
+            if self.calls % 1000 == 0:
+                connection.execute("DELETE FROM buckets WHERE full_at < ?", (now,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+    def clear(self):
+        self.get_connection().execute("DELETE FROM buckets")
+
+
+class RedisBucketStore:
+    """
+    Token buckets kept in Redis, shared by all processes and hosts using it.
+
+    Requires the redis package. Any server speaking the Redis protocol and
+    running Lua scripts works, e.g. a local Redis or Valkey. Every bucket is
+    updated by a single script call, which Redis runs atomically, and expires
+    once it would be full again.
+
+    Methods:
+    - consume(self, key, cost, capacity, refill_rate): Takes tokens from a bucket.
+    - clear(self): Removes all buckets.
+    """
+
+    blocking = True
+
+    key_prefix = "book_store:throttle:"
+
+    script = """
+    local capacity = tonumber(ARGV[1])
+    local refill_rate = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = tonumber(ARGV[4])
+    local state = redis.call("HMGET", KEYS[1], "tokens", "updated")
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * refill_rate)
+    local wait = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+    else
+        wait = (cost - tokens) / refill_rate
+    end
+    redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+    redis.call("PEXPIRE", KEYS[1], math.ceil((capacity - tokens) / refill_rate * 1000) + 1000)
+    return tostring(wait)
+    """
+
+    def __init__(self, options):
+        if redis is None:
+            raise RuntimeError("The redis throttle store requires the redis package.")
+        self.client = redis.Redis.from_url(options["REDIS_URL"])
+        self.consume_script = self.client.register_script(self.script)
+
+    def consume(self, key, cost, capacity, refill_rate):
+        wait = self.consume_script(
+            keys=[self.key_prefix + key], args=[capacity, refill_rate, cost, time.time()]
+        )
+        return float(wait)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.key_prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+STORES = {
+    "memory": MemoryBucketStore,
+    "sqlite": SQLiteBucketStore,
+    "redis": RedisBucketStore,
+}
+
+stores = {}
+stores_lock = threading.Lock()
+
+
+def get_throttle_store(options=None):
+    """
+    Returns the bucket store selected with the STORE setting.
+
+    One store is created per configuration and process.
+
+    Args:
+    - options: The throttling settings, read from the settings by default.
+
+    Returns:
+    - MemoryBucketStore | SQLiteBucketStore | RedisBucketStore: The store.
+    """
+
+    options = options or get_throttling_settings()
+    location = {"sqlite": options["SQLITE_PATH"], "redis": options["REDIS_URL"]}
+    key = (options["STORE"], str(location.get(options["STORE"], "")))
+    with stores_lock:
+        store = stores.get(key)
+        if store is None:
+            store = stores[key] = STORES[options["STORE"]](options)
+    return store
+
+
+def take_tokens(tokens, updated, now, cost, capacity, refill_rate):
+    """
+    Refills a bucket for the time passed since its last update and takes tokens from it.
+
+    Returns:
+    - tuple: The remaining tokens and 0, or the unchanged tokens and the seconds to wait.
+    """
+
+    tokens = min(capacity, tokens + max(0.0, now - updated) * refill_rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / refill_rate
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket throttling by user, or by client address for anonymous requests.
+
+    Every client has a bucket per scope, holding up to CAPACITY tokens and
+    refilled with REFILL_RATE tokens per second. A request takes as many
+    tokens as its view costs, so a client may burst up to the capacity and is
+    then held to the refill rate. Requests finding too few tokens get a 429
+    response with a Retry-After header.
+
+    The scope is the throttle_scope of the view, e.g. 'auth' for the signup
+    and token endpoints, else 'user' or 'anon'. The cost is named by the
+    throttle_cost attribute or the get_throttle_cost(request) method of the
+    view, and looked up in COSTS. Views doing work in proportion to the request,
+    like bulk writes, also define get_throttle_units(request), and the cost is
+    taken once per unit, up to the capacity of the bucket.
+
+    Methods:
+    - allow_request(self, request, view): Takes the tokens of the request.
+    - aallow_request(self, request, view): Async version of allow_request().
+    - get_bucket_key(self, request, view): Returns the scope and key of the client's bucket.
+    - get_cost(self, request, view, options): Returns the tokens the request takes.
+    - wait(self): Returns the seconds until the request would be allowed.
+    """
+
+    def __init__(self):
+        self.wait_time = None
+
+    def allow_request(self, request, view):
+        options = get_throttling_settings()
+        if not options["ENABLED"]:
+            return True
+        scope, key = self.get_bucket_key(request, view)
+        rate = options["RATES"][scope]
+        cost = min(self.get_cost(request, view, options), rate["CAPACITY"])
+        self.wait_time = get_throttle_store(options).consume(
+            f"{scope}:{key}", cost, rate["CAPACITY"], rate["REFILL_RATE"]
+        )
+        return self.wait_time == 0
+
+    async def aallow_request(self, request, view):
+        options = get_throttling_settings()
+        if options["ENABLED"] and get_throttle_store(options).blocking:
+            # The store needs no thread sensitive context, so it is not queried
+            # on the thread shared by the sync views.
+            return await sync_to_async(self.allow_request, thread_sensitive=False)(request, view)
+        return self.allow_request(request, view)
+
+    def get_bucket_key(self, request, view):
+        user = request.user
+        authenticated = user is not None and user.is_authenticated
+        scope = getattr(view, "throttle_scope", None) or ("user" if authenticated else "anon")
+        key = f"user:{user.pk}" if authenticated else f"ip:{self.get_ident(request)}"
+        return scope, key
+
+    def get_cost(self, request, view, options):
+        get_throttle_cost = getattr(view, "get_throttle_cost", None)
+        if get_throttle_cost is not None:
+            name = get_throttle_cost(request)
+        else:
+            name = getattr(view, "throttle_cost", "default")
+        cost = options["COSTS"].get(name, options["COSTS"]["default"])
+        get_throttle_units = getattr(view, "get_throttle_units", None)
+        if get_throttle_units is not None:
+            cost *= get_throttle_units(request)
+        return cost
+
+    def wait(self):
+        return math.ceil(self.wait_time) if self.wait_time else None
@@ -15,20 +15,45 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from books.views import BookListView, BookDetailView, ManageUserBooksView
-from users.views import CreateCustomUser
+from book_store.metrics import metrics_view
+from books.views import (
+    BookListView,
+    BookDetailView,
+    BookExportView,
+    ManageUserBooksView,
+    ManageUserBooksBulkView,
+)
+from books.async_views import (
+    AsyncBookDetailView,
+    AsyncBookListView,
+    AsyncManageUserBooksView,
+)
+from users.async_views import AsyncCreateCustomUser, AsyncTokenObtainPairView
+from users.views import CreateCustomUser, TokenObtainPairView, TokenRefreshView
+
+if settings.ASYNC_VIEWS:
+    BookListView = AsyncBookListView
+    BookDetailView = AsyncBookDetailView
+    ManageUserBooksView = AsyncManageUserBooksView
+    CreateCustomUser = AsyncCreateCustomUser
+    TokenObtainPairView = AsyncTokenObtainPairView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     path("signup/", CreateCustomUser.as_view(), name="signup"),
     path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("books/", BookListView.as_view(), name="books_list"),
+    path("books/export/", BookExportView.as_view(), name="books_export"),
     path("books/<int:book_id>/", BookDetailView.as_view(), name="books_details"),
     path("user_books/", ManageUserBooksView.as_view(), name="auth_books"),
+    path(
+        "user_books/bulk/", ManageUserBooksBulkView.as_view(), name="auth_books_bulk"
+    ),
     path(
         "user_books/<int:book_id>/",
         ManageUserBooksView.as_view(),
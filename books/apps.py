@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class BooksConfig(AppConfig):
@@ -7,3 +8,9 @@ class BooksConfig(AppConfig):
 
     def ready(self):
         from . import signals
+        from .cache import books_written
+        from .catalogue import refresh_catalogue
+        from .search import ensure_search_index
+
+        post_migrate.connect(ensure_search_index, sender=self)
+        books_written.connect(refresh_catalogue)
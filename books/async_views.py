@@ -0,0 +1,175 @@
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.shortcuts import aget_object_or_404
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from book_store.async_views import AsyncAPIView, get_request_data
+from users.authentication import get_model_user
+from .cache import (
+    AUTHORS_GENERATION_KEY,
+    cache_response,
+    get_detail_generation_key,
+    get_list_generation_key,
+)
+from .catalogue import get_catalogue
+from .conditional import (
+    aget_book_state,
+    aget_list_generation,
+    book_condition,
+    book_list_condition,
+    lock_book,
+    set_book_validators,
+)
+from .fieldsets import BookFieldset
+from .models import Book
+from .pagination import BookCursorPagination, SearchCursorPagination
+from .permissions import IsNotDathVader
+from .search import get_search_backend
+from .serializers import BookRowSerializer, BookSerializer
+
+
+class AsyncBookListView(AsyncAPIView):
+    """
+    Async version of BookListView.
+
+    Attributes:
+    - permission_classes: List of permission classes allowed to access this view (AllowAny in this case).
+    - replica_reads: Whether anonymous reads may be served from a replica (see books/routers.py).
+
+    Methods:
+    - get_throttle_cost(self, request): Names the throttle cost, searches cost more than listings.
+    - get(self, request): Retrieves a page of books or of search results.
+    """
+
+    permission_classes = [AllowAny]
+    replica_reads = True
+
+    def get_throttle_cost(self, request):
+        return "search" if request.query_params.get("search") else "list"
+
+    async def get(self, request):
+        await aget_list_generation(request)
+        return await book_list_condition(self.list_books)(request)
+
+    @cache_response(get_list_generation_key)
+    async def list_books(self, request):
+        fieldset = BookFieldset.from_request(request)
+        search_query = request.query_params.get("search", None)
+        paginator = SearchCursorPagination() if search_query else BookCursorPagination()
+        catalogue = get_catalogue(request)
+        page = None
+        if catalogue is not None:
+            page = catalogue.paginate(paginator, search_query, request, self)
+        if page is None and search_query:
+            books = Book.objects.as_rows(fieldset.get_row_fields())
+            page = await sync_to_async(paginator.paginate_search)(
+                get_search_backend(books.db), search_query, books, request
+            )
+        elif page is None:
+            ordering = paginator.get_ordering(request, None, self)
+            books = Book.objects.as_rows(fieldset.get_row_fields(ordering))
+            page = await sync_to_async(paginator.paginate_queryset)(books, request, view=self)
+        serializer = BookRowSerializer(page, many=True, fieldset=fieldset)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class AsyncBookDetailView(AsyncAPIView):
+    """
+    Async version of BookDetailView.
+
+    Attributes:
+    - permission_classes: List of permission classes allowed to access this view (AllowAny in this case).
+    - replica_reads: Whether anonymous reads may be served from a replica (see books/routers.py).
+    - throttle_cost: The throttle cost of a request (see book_store/throttling.py).
+
+    Methods:
+    - get(self, request, book_id): Retrieves details of a book identified by its ID.
+    """
+
+    permission_classes = [AllowAny]
+    replica_reads = True
+    throttle_cost = "detail"
+
+    async def get(self, request, book_id):
+        await aget_book_state(request, book_id)
+        return await book_condition(self.retrieve_book)(request, book_id=book_id)
+
+    @cache_response(get_detail_generation_key, AUTHORS_GENERATION_KEY)
+    async def retrieve_book(self, request, book_id):
+        fieldset = BookFieldset.from_request(request)
+        book = await aget_object_or_404(fieldset.narrow(Book.objects.all()), pk=book_id)
+        return Response(BookSerializer(book, fieldset=fieldset).data, status=status.HTTP_200_OK)
+
+
+class AsyncManageUserBooksView(AsyncAPIView):
+    """
+    Async version of ManageUserBooksView.
+
+    Uploaded covers are parsed and stored in worker threads, everything else
+    runs on the event loop.
+
+    Attributes:
+    - permission_classes: List of permission classes allowed to access this view (IsNotDathVader in this case).
+
+    Methods:
+    - get(self, request): Retrieves books authored by the authenticated user.
+    - post(self, request): Creates a new book entry for the authenticated user.
+    - patch(self, request, book_id): Updates details of a book authored by the authenticated user.
+    - delete(self, request, book_id): Deletes a book authored by the authenticated user.
+    """
+
+    permission_classes = [IsNotDathVader]
+
+    async def get(self, request):
+        await aget_list_generation(request)
+        return await book_list_condition(self.list_books)(request)
+
+    async def list_books(self, request):
+        fieldset = BookFieldset.from_request(request)
+        paginator = BookCursorPagination()
+        ordering = paginator.get_ordering(request, None, self)
+        books = Book.objects.filter(author_id=request.user.pk)
+        books = books.as_rows(fieldset.get_row_fields(ordering))
+        page = await sync_to_async(paginator.paginate_queryset)(books, request, view=self)
+        serializer = BookRowSerializer(page, many=True, fieldset=fieldset)
+        return paginator.get_paginated_response(serializer.data)
+
+    async def post(self, request):
+        serializer = BookSerializer(data=await get_request_data(request))
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        author = await sync_to_async(get_model_user)(request.user)
+        await sync_to_async(serializer.save)(author=author)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    async def patch(self, request, book_id):
+        await aget_book_state(request, book_id)
+        return await book_condition(self.update_book)(request, book_id=book_id)
+
+    async def update_book(self, request, book_id):
+        data = await get_request_data(request)
+        return await sync_to_async(self.write_book)(request, book_id, data)
+
+    def write_book(self, request, book_id, data):
+        # The lock and the write need one transaction, so they run in one thread.
+        with transaction.atomic():
+            book = lock_book(request, Book.objects.with_author(), book_id)
+            serializer = BookSerializer(book, data=data, partial=True)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            book = serializer.save()
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+        return set_book_validators(response, request, book)
+
+    async def delete(self, request, book_id):
+        await aget_book_state(request, book_id)
+        return await book_condition(self.delete_book)(request, book_id=book_id)
+
+    async def delete_book(self, request, book_id):
+        await sync_to_async(self.remove_book)(request, book_id)
+        return Response({"message": "Book deleted."}, status=status.HTTP_204_NO_CONTENT)
+
+    def remove_book(self, request, book_id):
+        with transaction.atomic():
+            lock_book(request, Book.objects.all(), book_id).delete()
@@ -0,0 +1,484 @@
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from rest_framework.renderers import JSONRenderer
+from rest_framework_xml.renderers import XMLRenderer
+from users.models import CustomUser
+from users.tokens import CustomRefreshToken
+from .cache import get_response_cache
+from .models import Book, CoverVariantReference
+from .renderers import FastJSONRenderer, StreamingXMLRenderer
+from .serializers import BookRowSerializer, BookSerializer
+
+
+BENCHMARK_PASSWORD = "benchmark-password"
+
+RENDERERS = {"json": "application/json", "xml": "application/xml"}
+
+RENDERER_CLASSES = {"json": FastJSONRenderer, "xml": StreamingXMLRenderer}
+
+STOCK_RENDERER_CLASSES = {"json": JSONRenderer, "xml": XMLRenderer}
+
+ENDPOINTS = ["books_list", "books_search", "books_details", "auth_books", "token", "signup"]
+
+
+def parse_volume(value):
+    """
+    Parses a row count like '10000', '10k' or '1M'.
+
+    Args:
+    - value: The count, optionally with a 'k' or 'M' suffix.
+
+    Returns:
+    - int: The number of rows.
+    """
+
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    value = str(value).strip()
+    multiplier = multipliers.get(value[-1:].lower())
+    if multiplier:
+        return int(float(value[:-1]) * multiplier)
+    return int(value)
+
+
+def seed(users, books, batch_size=5000, log=None):
+    """
+    Fills the database with benchmark users and books.
+
+    Users are named 'bench<n>' and share the password BENCHMARK_PASSWORD, which is
+    hashed once. Books are spread evenly over the users. Seeding is skipped if the
+    database already holds the requested volumes, so repeated runs measure the
+    same data.
+
+    Args:
+    - users: The number of users.
+    - books: The number of books.
+    - batch_size: The number of rows per INSERT query.
+    - log: Optional callable receiving progress messages.
+
+    Returns:
+    - bool: Whether the database was seeded.
+    """
+
+    log = log or (lambda message: None)
+    bench_users = CustomUser.objects.filter(username__startswith="bench")
+    if bench_users.count() == users and Book.objects.count() == books:
+        log(f"Database already holds {users} users and {books} books.")
+        return False
+
+    with transaction.atomic():
+        # Benchmark books have no covers, so the per-row delete signals and the
+        # collector are skipped. Leftover variant references are removed with them.
+        Book.objects.all()._raw_delete(Book.objects.db)
+        CoverVariantReference.objects.all()._raw_delete(CoverVariantReference.objects.db)
+        bench_users.delete()
+
+        password = make_password(BENCHMARK_PASSWORD)
+        for start in range(0, users, batch_size):
+            CustomUser.objects.bulk_create(
+                CustomUser(
+                    username=f"bench{index}",
+                    email=f"bench{index}@example.com",
+                    password=password,
+                    author_pseudonym=f"Bench Author {index}",
+                )
+                for index in range(start, min(start + batch_size, users))
+            )
+        author_ids = list(bench_users.order_by("id").values_list("id", flat=True))
+        log(f"Created {users} users.")
+
+        words = ["saga", "dragon", "empire", "river", "winter", "garden", "shadow", "voyage"]
+        for start in range(0, books, batch_size):
+            Book.objects.bulk_create(
+                Book(
+                    title=f"{words[index % len(words)].title()} {index}",
+                    description=" ".join(random.sample(words, 4)),
+                    author_id=author_ids[index % len(author_ids)],
+                    price=f"{index % 100}.99",
+                )
+                for index in range(start, min(start + batch_size, books))
+            )
+            log(f"Created {min(start + batch_size, books)} of {books} books.")
+
+    get_response_cache().clear()
+    return True
+
+
+class RequestFactory:
+    """
+    Builds the requests sent to each benchmarked endpoint.
+
+    Detail requests pick random books, list requests are authenticated as the
+    first benchmark user, and every signup uses a new username.
+
+    Methods:
+    - build(self, endpoint): Returns the method, path, body and headers of a request.
+    """
+
+    def __init__(self):
+        user = CustomUser.objects.filter(username__startswith="bench").order_by("id").first()
+        if user is None:
+            raise ValueError("The database has not been seeded.")
+        bounds = Book.objects.order_by("id").values_list("id", flat=True)
+        self.first_id, self.last_id = bounds.first(), bounds.last()
+        self.username = user.username
+        self.access_token = str(CustomRefreshToken.for_user(user).access_token)
+        self.run_id = f"{os.getpid()}{int(time.time())}"
+        self.signups = count()
+
+    def build(self, endpoint):
+        if endpoint == "books_list":
+            return "GET", reverse("books_list"), None, {}
+        if endpoint == "books_search":
+            return "GET", reverse("books_list") + "?search=dragon", None, {}
+        if endpoint == "books_details":
+            book_id = random.randint(self.first_id, self.last_id)
+            return "GET", reverse("books_details", args=[book_id]), None, {}
+        if endpoint == "auth_books":
+            headers = {"Authorization": f"Bearer {self.access_token}"}
+            return "GET", reverse("auth_books"), None, headers
+        if endpoint == "token":
+            body = {"username": self.username, "password": BENCHMARK_PASSWORD}
+            return "POST", reverse("token_obtain_pair"), body, {}
+        if endpoint == "signup":
+            name = f"signup{self.run_id}x{next(self.signups)}"
+            body = {
+                "username": name,
+                "email": f"{name}@example.com",
+                "password": BENCHMARK_PASSWORD,
+                "author_pseudonym": name,
+            }
+            return "POST", reverse("signup"), body, {}
+        raise ValueError(f"Unknown endpoint {endpoint!r}.")
+
+
+def summarize(latencies, elapsed, errors, queries=None, peak_rss_kb=None):
+    """
+    Summarizes the measurements of one endpoint and renderer.
+
+    Args:
+    - latencies: The latencies of the requests in milliseconds.
+    - elapsed: The wall clock time of all requests in seconds.
+    - errors: The number of requests that did not succeed.
+    - queries: Optional list of the query counts of the requests.
+    - peak_rss_kb: Optional peak resident set size of the serving process.
+
+    Returns:
+    - dict: The request count, latency percentiles, throughput, query count and peak RSS.
+    """
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentiles[49], 3),
+        "p95_ms": round(percentiles[94], 3),
+        "p99_ms": round(percentiles[98], 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "queries_per_request": round(statistics.fmean(queries), 2) if queries else None,
+        "peak_rss_kb": peak_rss_kb,
+    }
+
+
+@override_settings(THROTTLING={"ENABLED": False})
+def run_in_process(endpoints, renderers, requests, warmup=5, cold_cache=False):
+    """
+    Benchmarks the endpoints with the Django test client in this process.
+
+    Measures the full request handling including middleware, without network
+    and server overhead, and counts the queries of every request. Throttling
+    is turned off, as all requests come from one client, also for the servers
+    started by start_server().
+
+    Args:
+    - endpoints: The names of the endpoints to benchmark.
+    - renderers: The renderer formats to request ('json', 'xml').
+    - requests: The number of measured requests per endpoint and renderer.
+    - warmup: The number of unmeasured requests sent first.
+    - cold_cache: Whether the response cache is cleared before every request.
+
+    Returns:
+    - dict: The summaries by '<endpoint>:<renderer>'.
+    """
+
+    factory = RequestFactory()
+    client = Client(SERVER_NAME="localhost")
+    response_cache = get_response_cache()
+    results = {}
+    for endpoint in endpoints:
+        for renderer in renderers:
+            latencies, queries, errors = [], [], 0
+            elapsed = 0.0
+            for index in range(warmup + requests):
+                method, path, body, headers = factory.build(endpoint)
+                if cold_cache:
+                    response_cache.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = client.generic(
+                        method,
+                        path,
+                        json.dumps(body) if body else "",
+                        content_type="application/json",
+                        headers={**headers, "Accept": RENDERERS[renderer]},
+                    )
+                    duration = time.perf_counter() - start
+                if index < warmup:
+                    continue
+                elapsed += duration
+                latencies.append(duration * 1000)
+                queries.append(len(captured))
+                errors += response.status_code >= 400
+            peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            results[f"{endpoint}:{renderer}"] = summarize(
+                latencies, elapsed, errors, queries, peak_rss_kb
+            )
+    return results
+
+
+def run_serializers(renderers, requests, page_size=10_000, warmup=1):
+    """
+    Benchmarks BookSerializer against BookRowSerializer on pages of books.
+
+    Every measured request reads and renders one page of books, like a listing
+    does. The two serializers are checked to render identical bytes first.
+
+    Args:
+    - renderers: The renderer formats to render ('json', 'xml').
+    - requests: The number of measured pages per serializer and renderer.
+    - page_size: The number of books per page.
+    - warmup: The number of unmeasured pages rendered first.
+
+    Returns:
+    - dict: The summaries by 'serializer_model:<renderer>' and 'serializer_rows:<renderer>'.
+    """
+
+    books = Book.objects.order_by("id")[:page_size]
+    serializers = {
+        "serializer_model": lambda: BookSerializer(books.with_author(), many=True).data,
+        "serializer_rows": lambda: BookRowSerializer(books.as_rows(), many=True).data,
+    }
+    results = {}
+    for renderer in renderers:
+        render = RENDERER_CLASSES[renderer]().render
+        if render(serializers["serializer_model"]()) != render(serializers["serializer_rows"]()):
+            raise ValueError(f"The serializers render different {renderer} output.")
+        for name, serialize in serializers.items():
+            results[f"{name}:{renderer}"] = measure(lambda: render(serialize()), requests, warmup)
+    return results
+
+
+def run_renderers(renderers, requests, page_size=10_000, warmup=1):
+    """
+    Benchmarks the stock DRF renderers against the renderers of books/renderers.py.
+
+    One page of books is serialized once and rendered by every measured
+    request. The renderers are checked to produce identical bytes first.
+
+    Args:
+    - renderers: The renderer formats to render ('json', 'xml').
+    - requests: The number of measured renderings per renderer.
+    - page_size: The number of books per page.
+    - warmup: The number of unmeasured renderings first.
+
+    Returns:
+    - dict: The summaries by 'renderer_stock:<renderer>' and 'renderer_fast:<renderer>'.
+    """
+
+    data = BookRowSerializer(Book.objects.order_by("id")[:page_size].as_rows(), many=True).data
+    results = {}
+    for renderer in renderers:
+        classes = {
+            "renderer_stock": STOCK_RENDERER_CLASSES[renderer],
+            "renderer_fast": RENDERER_CLASSES[renderer],
+        }
+        stock, fast = (force_bytes(cls().render(data)) for cls in classes.values())
+        if stock != fast:
+            raise ValueError(f"The renderers produce different {renderer} output.")
+        for name, renderer_class in classes.items():
+            render = renderer_class().render
+            results[f"{name}:{renderer}"] = measure(lambda: render(data), requests, warmup)
+    return results
+
+
+def measure(task, requests, warmup):
+    latencies = []
+    for index in range(warmup + requests):
+        start = time.perf_counter()
+        task()
+        duration = time.perf_counter() - start
+        if index >= warmup:
+            latencies.append(duration * 1000)
+    return summarize(
+        latencies,
+        sum(latencies) / 1000,
+        0,
+        peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    )
+
+
+def get_peak_rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def start_server(database_name, port, asgi=False, async_views=False):
+    """
+    Starts a local server on the benchmark database.
+
+    Args:
+    - database_name: The SQLite file the server uses.
+    - port: The local port to listen on.
+    - asgi: Whether to serve with uvicorn instead of the development server.
+    - async_views: Whether to serve the async versions of the book views.
+
+    Returns:
+    - Popen: The server process, accepting connections.
+    """
+
+    env = {
+        **os.environ,
+        "BOOK_STORE_DB_NAME": str(database_name),
+        "BOOK_STORE_ASYNC_VIEWS": "1" if async_views else "0",
+        "BOOK_STORE_THROTTLING": "0",
+    }
+    if asgi:
+        command = [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "book_store.asgi:application",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ]
+    else:
+        command = [sys.executable, "manage.py", "runserver", "--noreload", f"127.0.0.1:{port}"]
+    server = subprocess.Popen(
+        command,
+        cwd=settings.BASE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("The benchmark server exited, is it installed?")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}{reverse('books_list')}", timeout=1)
+            return server
+        except urllib.error.HTTPError:
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("The benchmark server did not start.")
+
+
+def send(base_url, method, path, body, headers):
+    request = urllib.request.Request(
+        base_url + path,
+        data=json.dumps(body).encode() if body else None,
+        headers={**headers, "Content-Type": "application/json"},
+        method=method,
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            failed = False
+    except urllib.error.HTTPError as error:
+        error.read()
+        failed = True
+    return (time.perf_counter() - start) * 1000, failed
+
+
+def run_over_http(base_url, endpoints, renderers, requests, warmup=5, concurrency=1, pid=None):
+    """
+    Benchmarks the endpoints over HTTP against a running server.
+
+    Args:
+    - base_url: The URL of the server, e.g. 'http://127.0.0.1:8765'.
+    - endpoints: The names of the endpoints to benchmark.
+    - renderers: The renderer formats to request ('json', 'xml').
+    - requests: The number of measured requests per endpoint and renderer.
+    - warmup: The number of unmeasured requests sent first.
+    - concurrency: The number of requests in flight at once.
+    - pid: Optional process ID of the server, used to report its peak RSS.
+
+    Returns:
+    - dict: The summaries by '<endpoint>:<renderer>'.
+    """
+
+    factory = RequestFactory()
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for endpoint in endpoints:
+            for renderer in renderers:
+
+                def call(_):
+                    method, path, body, headers = factory.build(endpoint)
+                    headers = {**headers, "Accept": RENDERERS[renderer]}
+                    return send(base_url, method, path, body, headers)
+
+                list(executor.map(call, range(warmup)))
+                start = time.perf_counter()
+                measured = list(executor.map(call, range(requests)))
+                elapsed = time.perf_counter() - start
+                results[f"{endpoint}:{renderer}"] = summarize(
+                    [latency for latency, _ in measured],
+                    elapsed,
+                    sum(failed for _, failed in measured),
+                    peak_rss_kb=get_peak_rss_kb(pid) if pid else None,
+                )
+    return results
+
+
+def compare_results(baseline, current, threshold=0.1, metric="p95_ms"):
+    """
+    Compares a benchmark run with a baseline run.
+
+    Args:
+    - baseline: The results of the baseline run.
+    - current: The results of the current run.
+    - threshold: The relative slowdown above which a result counts as a regression.
+    - metric: The latency metric compared.
+
+    Returns:
+    - list: Tuples of key, baseline value, current value, relative change and
+            whether it is a regression, for every key present in both runs.
+    """
+
+    rows = []
+    for key, result in current["results"].items():
+        before = baseline["results"].get(key)
+        if not before or not before[metric]:
+            continue
+        change = (result[metric] - before[metric]) / before[metric]
+        rows.append((key, before[metric], result[metric], change, change > threshold))
+    return rows
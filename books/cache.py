@@ -0,0 +1,345 @@
+import hashlib
+import json
+import time
+from functools import partial, wraps
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import caches
+from django.db import transaction
+from django.dispatch import Signal
+from django.http import HttpResponse
+from django.utils.functional import cached_property
+from rest_framework.response import Response
+from book_store.metrics import timer
+from .models import Book
+from .routers import get_replica_max_lag, reads_from_replica
+
+
+RESPONSE_CACHE_ALIAS = "books"
+LIST_GENERATION_KEY = "books:generation:list"
+# Replaced when an author changes, which outdates the details of all their
+# books. Book details belong to it besides their own generation.
+AUTHORS_GENERATION_KEY = "books:generation:authors"
+
+# Sent with the IDs of written books and changed authors once the writes are
+# committed, together with the list generations before and after them (see
+# invalidate_books()).
+books_written = Signal()
+
+
+def get_response_cache():
+    return caches[RESPONSE_CACHE_ALIAS]
+
+
+def get_list_generation_key(**kwargs):
+    return LIST_GENERATION_KEY
+
+
+def get_detail_generation_key(book_id, **kwargs):
+    return f"books:generation:detail:{book_id}"
+
+
+def get_generation(generation_key, *shared_generation_keys):
+    """
+    Returns the current generation stored under the given keys.
+
+    A generation is the time of the last write that affected a group of cached
+    responses. It is part of the cache key of every response of that group, so
+    replacing it makes all of them unreachable at once. A missing generation,
+    e.g. after a cache restart, is initialised with the current time.
+    Generations expire with the TIMEOUT of the cache alias like the responses,
+    so with a per-process cache, writes handled by other processes show up
+    after at most TIMEOUT seconds.
+
+    A group may also belong to shared generations, like book details to the
+    authors generation. Its generation is then the latest of them, which
+    changes whenever one of them is replaced.
+
+    Args:
+    - generation_key: The cache key of the generation.
+    - *shared_generation_keys: Cache keys of further generations the group belongs to.
+
+    Returns:
+    - int: The generation as nanoseconds since the epoch.
+    """
+
+    cache = get_response_cache()
+    keys = [generation_key, *shared_generation_keys]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns())
+            generations[key] = cache.get(key, time.time_ns())
+    return max(generations.values())
+
+
+async def aget_generation(generation_key, *shared_generation_keys):
+    """
+    Async version of get_generation().
+    """
+
+    cache = get_response_cache()
+    keys = [generation_key, *shared_generation_keys]
+    generations = await cache.aget_many(keys)
+    for key in keys:
+        if key not in generations:
+            await cache.aadd(key, time.time_ns())
+            generations[key] = await cache.aget(key, time.time_ns())
+    return max(generations.values())
+
+
+def invalidate_books(book_ids=(), author_ids=()):
+    """
+    Invalidates the cached book lists and the cached details of the given books.
+
+    Changed authors replace the authors generation instead, which invalidates
+    the details of every book, so their books do not need to be listed.
+
+    Inside a transaction the generations are replaced again once it commits, as
+    a concurrent request may have cached the old state under the new generation
+    before the write became visible. The books_written signal is sent once the
+    write is committed, once per transaction with the IDs of all books written
+    in it and the list generation from before the transaction.
+
+    Args:
+    - book_ids: IDs of the books whose cached details are outdated.
+    - author_ids: IDs of the authors whose books show outdated author fields.
+    """
+
+    book_ids = list(book_ids)
+    author_ids = list(author_ids)
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        previous_generation = get_response_cache().get(LIST_GENERATION_KEY)
+        generation = set_generations(book_ids, author_ids)
+        books_written.send(
+            sender=Book,
+            book_ids=book_ids,
+            author_ids=author_ids,
+            previous_generation=previous_generation,
+            generation=generation,
+        )
+        return
+
+    batch = getattr(connection, "books_written_batch", None)
+    if batch is None or not batch.is_pending(connection):
+        batch = connection.books_written_batch = WriteBatch()
+        transaction.on_commit(batch.commit)
+    batch.book_ids.update(dict.fromkeys(book_ids))
+    batch.author_ids.update(dict.fromkeys(author_ids))
+    set_generations(book_ids, author_ids)
+
+
+class WriteBatch:
+    """
+    The books written in a transaction, invalidated together once it commits.
+
+    Attributes:
+    - book_ids: IDs of the written books, as keys of a dict to keep their order.
+    - author_ids: IDs of the changed authors, likewise.
+    - previous_generation: The list generation before the transaction.
+
+    Methods:
+    - is_pending(self, connection): Whether the batch still commits with the current transaction.
+    - commit(self): Replaces the generations and sends books_written.
+    """
+
+    def __init__(self):
+        self.book_ids = {}
+        self.author_ids = {}
+        self.previous_generation = get_response_cache().get(LIST_GENERATION_KEY)
+
+    def is_pending(self, connection):
+        # Hooks are dropped when the transaction, or the savepoint they were
+        # registered in, is rolled back, and after the transaction committed.
+        return any(hook[1] == self.commit for hook in connection.run_on_commit)
+
+    def commit(self):
+        book_ids = list(self.book_ids)
+        author_ids = list(self.author_ids)
+        generation = set_generations(book_ids, author_ids)
+        books_written.send(
+            sender=Book,
+            book_ids=book_ids,
+            author_ids=author_ids,
+            previous_generation=self.previous_generation,
+            generation=generation,
+        )
+
+
+def set_generations(book_ids, author_ids=()):
+    generation = time.time_ns()
+    generations = {get_detail_generation_key(book_id): generation for book_id in book_ids}
+    generations[LIST_GENERATION_KEY] = generation
+    if author_ids:
+        generations[AUTHORS_GENERATION_KEY] = generation
+    get_response_cache().set_many(generations)
+    return generation
+
+
+def get_response_key(request, generation_key, generation=None):
+    """
+    Builds the cache key of a response.
+
+    Responses are cached per URL, including the query string, and per accepted
+    media type, so JSON and XML representations are stored separately.
+
+    Args:
+    - request: The HTTP request object.
+    - generation_key: The cache key of the generation the response belongs to.
+    - generation: The current generation, read from the cache if not given.
+
+    Returns:
+    - str: The cache key of the response.
+    """
+
+    if generation is None:
+        generation = get_generation(generation_key)
+    variant = f"{request.accepted_media_type}\n{request.get_full_path()}"
+    digest = hashlib.md5(variant.encode("utf-8"), usedforsecurity=False).hexdigest()
+    return f"books:response:{generation_key}:{generation}:{digest}"
+
+
+def is_cacheable(generation):
+    """
+    Returns whether a response built in the current request may be cached.
+
+    A replica may not have applied the last write yet, and a response read
+    from it would stay cached under the new generation. Such responses are
+    only cached once the generation is older than REPLICA_MAX_LAG.
+
+    Args:
+    - generation: The generation the response belongs to.
+
+    Returns:
+    - bool: Whether the response may be cached.
+    """
+
+    if not reads_from_replica():
+        return True
+    return time.time_ns() - generation > get_replica_max_lag() * 1_000_000_000
+
+
+class CachedContentMixin:
+    """
+    Response mixin decoding the data of a response served from the cache.
+
+    The cache keeps only the rendered content, so the data is decoded from JSON
+    content when it is accessed, e.g. by tests, and is None for other media types.
+    """
+
+    @cached_property
+    def data(self):
+        if self["Content-Type"].startswith("application/json"):
+            return json.loads(self.content)
+        return None
+
+
+class CachedHttpResponse(CachedContentMixin, HttpResponse):
+    """
+    CachedResponse as a plain HttpResponse, which async views return so Django
+    does not call render() in a thread (see AsyncAPIView.detach_rendering()).
+    """
+
+
+class CachedResponse(CachedContentMixin, Response):
+    """
+    Response of a view served from the response cache.
+
+    The content is already rendered, so finalizing the response in the view's
+    dispatch() sets its headers but renders nothing.
+
+    Args:
+    - content: The rendered content.
+    - content_type: The Content-Type header of the content.
+
+    Attributes:
+    - rendered_class: The class async views return the response as.
+    """
+
+    rendered_class = CachedHttpResponse
+
+    def __init__(self, content, content_type):
+        super().__init__()
+        del self.data
+        self.content = content
+        self["Content-Type"] = content_type
+
+
+def render_response(view, request, response):
+    """
+    Renders a response of a view for the cache.
+
+    Sets the renderer like APIView.finalize_response(), which the view's
+    dispatch() calls on the returned response afterwards.
+
+    Args:
+    - view: The APIView instance.
+    - request: The DRF request object.
+    - response: The Response returned by the view method.
+    """
+
+    response.accepted_renderer = request.accepted_renderer
+    response.accepted_media_type = request.accepted_media_type
+    response.renderer_context = view.get_renderer_context()
+    with timer("render"):
+        response.render()
+
+
+def cache_response(get_generation_key, *shared_generation_keys):
+    """
+    Decorator caching the rendered successful responses of an APIView method.
+
+    Cached entries do not expire on their own. They are invalidated when their
+    generation changes, which the signal handlers in books/signals.py do
+    whenever a book or its author is written. Async methods are supported and
+    use the async cache API. Responses read from a replica are only cached if
+    is_cacheable() allows it.
+
+    Args:
+    - get_generation_key: Callable returning the generation key from the URL keyword arguments.
+    - *shared_generation_keys: Keys of further generations the responses belong to.
+
+    Returns:
+    - function: The decorator.
+    """
+
+    def decorator(method):
+        if iscoroutinefunction(method):
+
+            @wraps(method)
+            async def async_wrapper(view, request, *args, **kwargs):
+                cache = get_response_cache()
+                generation_key = get_generation_key(**kwargs)
+                generation = await aget_generation(generation_key, *shared_generation_keys)
+                key = get_response_key(request, generation_key, generation)
+                cached = await cache.aget(key)
+                if cached is not None:
+                    return CachedResponse(*cached)
+
+                response = await method(view, request, *args, **kwargs)
+                if response.status_code == 200 and is_cacheable(generation):
+                    render_response(view, request, response)
+                    await cache.aset(key, (response.content, response["Content-Type"]))
+                return response
+
+            return async_wrapper
+
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            cache = get_response_cache()
+            generation_key = get_generation_key(**kwargs)
+            generation = get_generation(generation_key, *shared_generation_keys)
+            key = get_response_key(request, generation_key, generation)
+            cached = cache.get(key)
+            if cached is not None:
+                return CachedResponse(*cached)
+
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200 and is_cacheable(generation):
+                render_response(view, request, response)
+                cache.set(key, (response.content, response["Content-Type"]))
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,882 @@
+import logging
+import math
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import Count, Max
+from .cache import LIST_GENERATION_KEY, get_generation
+from .conditional import get_list_generation
+from .models import AUTHOR_SNAPSHOT_FIELDS, Book
+from .search import (
+    DESCRIPTION_WEIGHT,
+    TITLE_WEIGHT,
+    BaseSearchBackend,
+    SQLiteSearchBackend,
+    get_search_backend,
+    get_search_terms,
+)
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOGUE_STORE = {
+    "ENABLED": False,
+    # Upper bound in bytes for the estimated size of the store, None for no bound.
+    "MAX_BYTES": None,
+    # Seconds the store may lag behind the list generation of the response
+    # cache, e.g. after writes of another process, before it is reloaded.
+    "RELOAD_DELAY": 1.0,
+    # Seconds between checks that the store still matches the database, by
+    # the number of books and their latest update time, None for no checks.
+    # They notice writes of other processes when the response cache is per
+    # process and its generations are not shared.
+    "VERIFY_INTERVAL": 5.0,
+}
+
+# Tokens of the FTS5 'unicode61' tokenizer: runs of letters and digits.
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+# Parameters of the BM25 ranking, as used by FTS5's bm25().
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Prices are stored in cents and ordered by 'cents * ID_RANGE + id', which
+# keeps the (price, id) index a flat array of integers.
+ID_RANGE = 1 << 40
+
+# Number of search queries whose rankings are kept until the next write.
+RANKING_CACHE_SIZE = 32
+
+# Rough size in bytes of an entry in a dict or list, on top of its value.
+ENTRY_SIZE = 8
+
+# Size in bytes of an empty postings array, the slots it holds are counted
+# with the book they belong to.
+POSTINGS_SIZE = sys.getsizeof(array("l"))
+
+_catalogue = None
+_load_lock = threading.Lock()
+_loading = False
+_verifying = False
+
+
+def get_catalogue_settings():
+    return {**DEFAULT_CATALOGUE_STORE, **getattr(settings, "CATALOGUE_STORE", {})}
+
+
+def tokenize(text):
+    """
+    Splits a text into lower-cased tokens like the FTS5 'unicode61' tokenizer.
+
+    Args:
+    - text: The text to split.
+
+    Returns:
+    - list: The tokens, without diacritics.
+    """
+
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return TOKEN_PATTERN.findall(text)
+
+
+def get_author_size(author):
+    # The snapshot values, the entries in the authors and author_counts dicts.
+    return sum(sys.getsizeof(value) for value in author) + 2 * ENTRY_SIZE
+
+
+class CatalogueMiss(Exception):
+    """
+    Raised when the catalogue cannot answer a query, which then goes to the database.
+    """
+
+
+class Catalogue:
+    """
+    Columnar in-memory snapshot of every book.
+
+    Every book occupies a slot in a set of parallel columns: strings and the
+    cover variants in lists, and IDs, prices in cents, timestamps in
+    microseconds, versions and author IDs in typed arrays. The author snapshot
+    is stored once per author. Two sorted arrays index the books by ID and by
+    (price, ID), and an inverted index maps every token of the titles and
+    descriptions to the slots it occurs in, once per occurrence.
+
+    The catalogue answers the queries of BookCursorPagination through
+    books() and ranked searches through search_backend(), producing the same
+    rows as BookQuerySet.as_rows(). Searches match every term as a prefix and
+    are ranked with the BM25 formula of the SQLite FTS5 index.
+
+    With a size bound the catalogue only holds the books up to 'last_id',
+    the books with the lowest IDs fitting into the bound. It then only
+    answers ID ordered pages within that range and raises CatalogueMiss for
+    everything else.
+
+    Attributes:
+    - generation: The list generation of the response cache the catalogue reflects.
+    - max_bytes: The bound for the estimated size, None for no bound.
+    - nbytes: The estimated size in bytes.
+    - truncated: Whether books with IDs above 'last_id' were left out.
+    - last_id: The highest ID the catalogue covers if truncated.
+    - verified_at: The monotonic time the catalogue was last checked against the database.
+
+    Methods:
+    - load(cls, generation, max_bytes=None): Reads every book from the database.
+    - refresh(self, book_ids, author_ids=()): Re-reads the given books from the database.
+    - books(self): Returns a CatalogueQuery over all books.
+    - search_backend(self): Returns a search backend answering from the catalogue.
+    - paginate(self, paginator, search_query, request, view): Returns a page of books.
+    - memory_usage(self): Returns the estimated size of every column.
+    - get_state(self): Returns the number of books and their latest update time.
+    - read_state(self): Reads the same state from the database.
+    """
+
+    def __init__(self, generation=None, max_bytes=None):
+        self.generation = generation
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.truncated = False
+        self.last_id = 0
+        self.out_of_sync_since = None
+        self.verified_at = time.monotonic()
+        self.max_updated_at = 0
+        self.lock = threading.RLock()
+        self.epoch = datetime(1970, 1, 1, tzinfo=timezone.utc if settings.USE_TZ else None)
+
+        self.slots = {}
+        self.free_slots = []
+        self.slot_ids = array("q")
+        self.titles = []
+        self.descriptions = []
+        self.cover_images = []
+        self.cover_variants = []
+        self.prices = array("q")
+        self.updated_at = array("q")
+        self.versions = array("q")
+        self.author_ids = array("q")
+        self.lengths = array("l")
+        self.authors = {}
+        self.author_counts = {}
+
+        self.ids = array("q")
+        self.price_keys = array("q")
+        self.tokens = []
+        self.title_postings = {}
+        self.description_postings = {}
+        self.total_length = 0
+        self.rankings = {}
+
+    @classmethod
+    def load(cls, generation, max_bytes=None):
+        """
+        Reads every book from the database, in ID order, into a new catalogue.
+
+        Loading stops at the first book exceeding the size bound.
+
+        Args:
+        - generation: The list generation read before loading.
+        - max_bytes: The bound for the estimated size, None for no bound.
+
+        Returns:
+        - Catalogue: The loaded catalogue.
+        """
+
+        catalogue = cls(generation, max_bytes)
+        for row in Book.objects.order_by("id").as_rows().iterator(chunk_size=2000):
+            catalogue.add(row)
+            if max_bytes is not None and catalogue.nbytes > max_bytes:
+                catalogue.remove(row["id"])
+                catalogue.truncated = True
+                break
+            catalogue.last_id = row["id"]
+        return catalogue
+
+    def refresh(self, book_ids, author_ids=()):
+        """
+        Re-reads the given books from the database, dropping deleted ones.
+
+        Args:
+        - book_ids: IDs of the written books.
+        - author_ids: IDs of changed authors, whose books are re-read as well.
+        """
+
+        rows = {row["id"]: row for row in Book.objects.filter(pk__in=book_ids).as_rows()}
+        if author_ids:
+            books = Book.objects.filter(author_id__in=author_ids)
+            rows.update((row["id"], row) for row in books.as_rows())
+        book_ids = list(dict.fromkeys([*book_ids, *rows]))
+        with self.lock:
+            for book_id in book_ids:
+                if book_id in self.slots:
+                    self.remove(book_id)
+                row = rows.get(book_id)
+                if row is not None and not (self.truncated and book_id > self.last_id):
+                    self.add(row)
+            self.trim()
+
+    def trim(self):
+        """
+        Drops the books with the highest IDs until the catalogue fits into its bound.
+        """
+
+        if self.max_bytes is None:
+            return
+        while self.ids and self.nbytes > self.max_bytes:
+            self.remove(self.ids[-1])
+            self.truncated = True
+            self.last_id = self.ids[-1] if self.ids else 0
+
+    def add(self, row):
+        self.rankings.clear()
+        book_id = row["id"]
+        cents = int(row["price"].scaleb(2))
+        tokens = [(token, self.title_postings) for token in tokenize(row["title"])]
+        tokens += [(token, self.description_postings) for token in tokenize(row["description"])]
+        values = (
+            book_id,
+            row["title"],
+            row["description"],
+            row["cover_image"],
+            row["cover_variants"],
+            cents,
+            (row["updated_at"] - self.epoch) // timedelta(microseconds=1),
+            row["version"],
+            row["author_id"],
+            len(tokens),
+        )
+        columns = self.get_columns()
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            for column, value in zip(columns, values):
+                column[slot] = value
+        else:
+            slot = len(self.slot_ids)
+            for column, value in zip(columns, values):
+                column.append(value)
+        self.slots[book_id] = slot
+        if self.max_updated_at is not None:
+            self.max_updated_at = max(self.max_updated_at, self.updated_at[slot])
+
+        insort(self.ids, book_id)
+        insort(self.price_keys, cents * ID_RANGE + book_id)
+        for token, postings in tokens:
+            if token not in postings:
+                if token not in self.title_postings and token not in self.description_postings:
+                    insort(self.tokens, token)
+                    self.nbytes += sys.getsizeof(token) + 2 * ENTRY_SIZE
+                postings[token] = array("l")
+                self.nbytes += POSTINGS_SIZE + ENTRY_SIZE
+            postings[token].append(slot)
+        self.total_length += len(tokens)
+
+        author_id = row["author_id"]
+        author = tuple(row[field] for field in AUTHOR_SNAPSHOT_FIELDS.values())
+        previous_author = self.authors.get(author_id)
+        if previous_author != author:
+            if previous_author is not None:
+                self.nbytes -= get_author_size(previous_author)
+            self.nbytes += get_author_size(author)
+            self.authors[author_id] = author
+        self.author_counts[author_id] = self.author_counts.get(author_id, 0) + 1
+        self.nbytes += self.get_slot_size(slot)
+
+    def remove(self, book_id):
+        self.rankings.clear()
+        slot = self.slots.pop(book_id)
+        if self.updated_at[slot] == self.max_updated_at:
+            # Recomputed by get_state() when it is needed.
+            self.max_updated_at = None
+        self.nbytes -= self.get_slot_size(slot)
+        self.ids.pop(bisect_left(self.ids, book_id))
+        key = self.prices[slot] * ID_RANGE + book_id
+        self.price_keys.pop(bisect_left(self.price_keys, key))
+        tokens = [(token, self.title_postings) for token in tokenize(self.titles[slot])]
+        tokens += [
+            (token, self.description_postings) for token in tokenize(self.descriptions[slot])
+        ]
+        for token, postings in tokens:
+            slots = postings[token]
+            slots.remove(slot)
+            if not slots:
+                self.nbytes -= POSTINGS_SIZE + ENTRY_SIZE
+                del postings[token]
+                if token not in self.title_postings and token not in self.description_postings:
+                    self.tokens.pop(bisect_left(self.tokens, token))
+                    self.nbytes -= sys.getsizeof(token) + 2 * ENTRY_SIZE
+        self.total_length -= self.lengths[slot]
+        author_id = self.author_ids[slot]
+        self.author_counts[author_id] -= 1
+        if not self.author_counts[author_id]:
+            # The author is dropped with its last book.
+            del self.author_counts[author_id]
+            self.nbytes -= get_author_size(self.authors.pop(author_id))
+        for column in (self.titles, self.descriptions, self.cover_images, self.cover_variants):
+            column[slot] = None
+        self.free_slots.append(slot)
+
+    def get_columns(self):
+        return (
+            self.slot_ids,
+            self.titles,
+            self.descriptions,
+            self.cover_images,
+            self.cover_variants,
+            self.prices,
+            self.updated_at,
+            self.versions,
+            self.author_ids,
+            self.lengths,
+        )
+
+    def get_slot_size(self, slot):
+        # Strings and the cover variants, one entry per list column, 8 bytes
+        # per array column, the ID and price indexes and the postings.
+        variants = self.cover_variants[slot]
+        return (
+            sys.getsizeof(self.titles[slot])
+            + sys.getsizeof(self.descriptions[slot])
+            + sys.getsizeof(self.cover_images[slot])
+            + sys.getsizeof(variants)
+            + sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in variants.items())
+            + 4 * ENTRY_SIZE
+            + 6 * 8
+            + 2 * 8
+            + self.lengths[slot] * 4
+            + 2 * ENTRY_SIZE
+        )
+
+    def get_row(self, book_id):
+        slot = self.slots[book_id]
+        author_id = self.author_ids[slot]
+        username, email, pseudonym = self.authors[author_id]
+        return {
+            "id": book_id,
+            "title": self.titles[slot],
+            "description": self.descriptions[slot],
+            "cover_image": self.cover_images[slot],
+            "cover_variants": self.cover_variants[slot],
+            "price": Decimal(self.prices[slot]).scaleb(-2),
+            "updated_at": self.epoch + timedelta(microseconds=self.updated_at[slot]),
+            "version": self.versions[slot],
+            "author_id": author_id,
+            "author_username": username,
+            "author_email": email,
+            "author_pseudonym": pseudonym,
+        }
+
+    def get_state(self):
+        """
+        Returns the number of books and their latest update time in microseconds.
+
+        Every write to a book sets its update time, so the state changes with
+        every insert and update, and the count with every delete.
+        """
+
+        with self.lock:
+            if self.max_updated_at is None:
+                self.max_updated_at = max(
+                    (self.updated_at[slot] for slot in self.slots.values()), default=0
+                )
+            return len(self.slots), self.max_updated_at
+
+    def read_state(self):
+        """
+        Reads the state of get_state() from the database, for the books the catalogue covers.
+        """
+
+        books = Book.objects.all()
+        if self.truncated:
+            books = books.filter(id__lte=self.last_id)
+        state = books.aggregate(count=Count("id"), updated_at=Max("updated_at"))
+        if state["updated_at"] is None:
+            return state["count"], 0
+        return state["count"], (state["updated_at"] - self.epoch) // timedelta(microseconds=1)
+
+    def books(self):
+        return CatalogueQuery(self)
+
+    def search_backend(self):
+        return CatalogueSearchBackend(self)
+
+    def paginate(self, paginator, search_query, request, view):
+        """
+        Returns a page of books read from the catalogue.
+
+        Args:
+        - paginator: The SearchCursorPagination or BookCursorPagination instance.
+        - search_query: The raw value of the 'search' query parameter, if any.
+        - request: The HTTP request object.
+        - view: The view paginating the books.
+
+        Searches are only answered where the database ranks them the same way,
+        with the FTS5 index of SQLite. Elsewhere, e.g. with ts_rank on
+        PostgreSQL, the order and the (score, ID) cursors would depend on
+        whether the catalogue is current.
+
+        Returns:
+        - list: The rows of the page, or None if the catalogue cannot answer the request.
+        """
+
+        if search_query and not isinstance(
+            get_search_backend(Book.objects.db), SQLiteSearchBackend
+        ):
+            return None
+        try:
+            if search_query:
+                return paginator.paginate_search(
+                    self.search_backend(), search_query, self.books(), request
+                )
+            return paginator.paginate_queryset(self.books(), request, view=view)
+        except CatalogueMiss:
+            return None
+
+    def select(self, ordering, bounds, offset, limit):
+        """
+        Returns the rows of an ordered, bounded slice of the books.
+
+        Args:
+        - ordering: The fields the books are ordered by, the first one decides.
+        - bounds: Lookups like {'id__gt': '42'} on the first ordering field.
+        - offset: The number of books skipped.
+        - limit: The maximum number of books returned, None for all.
+
+        Returns:
+        - list: The rows, like BookQuerySet.as_rows() returns them.
+        """
+
+        field = ordering[0].lstrip("-")
+        descending = ordering[0].startswith("-")
+        if field not in ("id", "price") or any(not key.startswith(field) for key in bounds):
+            raise CatalogueMiss(f"Unsupported query on {field}.")
+
+        with self.lock:
+            if field == "id":
+                keys = self.ids
+                lower, upper = get_id_bound(bounds, "gt"), get_id_bound(bounds, "lt")
+            elif self.truncated:
+                raise CatalogueMiss("The catalogue does not hold every book.")
+            else:
+                keys = self.price_keys
+                lower = get_price_bound(bounds, "gt", math.floor)
+                upper = get_price_bound(bounds, "lt", math.ceil)
+                lower = None if lower is None else (lower + 1) * ID_RANGE
+                upper = None if upper is None else upper * ID_RANGE
+            start = 0 if lower is None else bisect_left(keys, lower)
+            end = len(keys) if upper is None else bisect_left(keys, upper)
+            count = end - start if limit is None else limit
+
+            if descending:
+                if self.truncated and (upper is None or upper > self.last_id + 1):
+                    raise CatalogueMiss("The catalogue does not hold the highest IDs.")
+                selected = keys[max(start, end - offset - count) : max(start, end - offset)]
+                selected.reverse()
+            else:
+                selected = keys[start + offset : min(end, start + offset + count)]
+                if self.truncated and upper is None and (limit is None or len(selected) < count):
+                    raise CatalogueMiss("The catalogue does not hold the highest IDs.")
+            if field == "price":
+                selected = [key % ID_RANGE for key in selected]
+            return [self.get_row(book_id) for book_id in selected]
+
+    def filter_ids(self, book_ids):
+        with self.lock:
+            return [self.get_row(book_id) for book_id in book_ids if book_id in self.slots]
+
+    def search(self, terms, limit, after=None, reverse=False):
+        """
+        Returns the books matching every term as a prefix, ranked like the FTS5 index.
+
+        Args:
+        - terms: The tokens of the search query.
+        - limit: The maximum number of results.
+        - after: The (score, id) keyset position to continue after.
+        - reverse: Whether to return the results before the position instead.
+
+        Returns:
+        - list: Up to 'limit' (id, score) tuples.
+        """
+
+        if self.truncated:
+            raise CatalogueMiss("The catalogue does not hold every book.")
+        if not terms:
+            raise CatalogueMiss("The query is matched by the database as a whole.")
+        ranked = self.rank(tuple(terms))
+        if reverse:
+            end = len(ranked) if after is None else bisect_left(ranked, tuple(after))
+            ranked = ranked[max(end - limit, 0) : end][::-1]
+        else:
+            start = 0 if after is None else bisect_right(ranked, tuple(after))
+            ranked = ranked[start : start + limit]
+        return [(book_id, score) for score, book_id in ranked]
+
+    def rank(self, terms):
+        """
+        Returns the sorted (score, id) positions of all books matching the terms.
+
+        Rankings are kept for the most recent queries until the next write,
+        so following pages of a search are only a bisection.
+
+        Args:
+        - terms: The tokens of the search query, as a tuple.
+
+        Returns:
+        - list: The (score, id) tuples, most relevant first.
+        """
+
+        with self.lock:
+            ranked = self.rankings.pop(terms, None)
+            if ranked is None:
+                ranked = self.score(terms)
+            self.rankings[terms] = ranked
+            while len(self.rankings) > RANKING_CACHE_SIZE:
+                del self.rankings[next(iter(self.rankings))]
+            return ranked
+
+    def score(self, terms):
+        count = len(self.slots)
+        if not count:
+            return []
+        matches = []
+        for term in terms:
+            title_counts = Counter()
+            description_counts = Counter()
+            start = bisect_left(self.tokens, term)
+            for token in self.tokens[start:]:
+                if not token.startswith(term):
+                    break
+                title_counts.update(self.title_postings.get(token, ()))
+                description_counts.update(self.description_postings.get(token, ()))
+            hits = title_counts.keys() | description_counts.keys()
+            if not hits:
+                return []
+            idf = math.log((count - len(hits) + 0.5) / (len(hits) + 0.5))
+            idf = idf if idf > 0.0 else 1e-6
+            matches.append((idf, title_counts, description_counts, hits))
+
+        average_length = self.total_length / count
+        slot_ids = self.slot_ids
+        ranked = []
+        for slot in set.intersection(*(hits for *_, hits in matches)):
+            length = BM25_B * self.lengths[slot] / average_length
+            score = 0.0
+            for idf, title_counts, description_counts, hits in matches:
+                # Floating point operations in the order of FTS5's bm25(), so
+                # scores and cursors are interchangeable with the index.
+                frequency = title_counts[slot] * TITLE_WEIGHT
+                frequency += description_counts[slot] * DESCRIPTION_WEIGHT
+                score += (
+                    idf
+                    * (frequency * (BM25_K1 + 1.0))
+                    / (frequency + BM25_K1 * (1 - BM25_B + length))
+                )
+            ranked.append((-score, slot_ids[slot]))
+        ranked.sort()
+        return ranked
+
+    def memory_usage(self):
+        """
+        Returns the estimated size of the catalogue by column.
+
+        Returns:
+        - dict: Sizes in bytes by column name, with the sum under 'total'.
+        """
+
+        with self.lock:
+            def size_of_list(values):
+                return sys.getsizeof(values) + sum(map(sys.getsizeof, values))
+
+            def size_of_array(values):
+                return sys.getsizeof(values)
+
+            usage = {
+                "ids": size_of_array(self.slot_ids) + sys.getsizeof(self.slots),
+                "titles": size_of_list(self.titles),
+                "descriptions": size_of_list(self.descriptions),
+                "cover_images": size_of_list(self.cover_images),
+                "cover_variants": sys.getsizeof(self.cover_variants)
+                + sum(
+                    sys.getsizeof(variants)
+                    + sum(map(sys.getsizeof, variants.keys()))
+                    + sum(map(sys.getsizeof, variants.values()))
+                    for variants in self.cover_variants
+                    if variants is not None
+                ),
+                "prices": size_of_array(self.prices),
+                "updated_at": size_of_array(self.updated_at),
+                "versions": size_of_array(self.versions),
+                "author_ids": size_of_array(self.author_ids),
+                "authors": sys.getsizeof(self.authors)
+                + sys.getsizeof(self.author_counts)
+                + sum(
+                    sys.getsizeof(author) + sum(map(sys.getsizeof, author))
+                    for author in self.authors.values()
+                ),
+                "indexes": size_of_array(self.ids) + size_of_array(self.price_keys),
+                "search_index": size_of_list(self.tokens)
+                + size_of_array(self.lengths)
+                + sum(
+                    sys.getsizeof(postings) + sum(map(sys.getsizeof, postings.values()))
+                    for postings in (self.title_postings, self.description_postings)
+                ),
+            }
+        usage["total"] = sum(usage.values())
+        return usage
+
+
+def get_id_bound(bounds, lookup):
+    value = bounds.get(f"id__{lookup}")
+    if value is None:
+        return None
+    try:
+        book_id = int(value)
+    except (TypeError, ValueError):
+        raise CatalogueMiss(f"Invalid ID {value!r}.")
+    return book_id + 1 if lookup == "gt" else book_id
+
+
+def get_price_bound(bounds, lookup, rounding):
+    value = bounds.get(f"price__{lookup}")
+    if value is None:
+        return None
+    try:
+        return rounding(Decimal(value).scaleb(2))
+    except (TypeError, ValueError, InvalidOperation):
+        raise CatalogueMiss(f"Invalid price {value!r}.")
+
+
+class CatalogueQuery:
+    """
+    The subset of the QuerySet API the book paginators use, answered from a Catalogue.
+
+    Supports order_by() by 'id' or 'price', filter() with '__gt' and '__lt'
+    lookups on the first ordering field or with 'pk__in', and slicing.
+    Rows are dicts like those of BookQuerySet.as_rows().
+    """
+
+    def __init__(self, catalogue, ordering=("id",), bounds=None, book_ids=None):
+        self.catalogue = catalogue
+        self.ordering = ordering
+        self.bounds = bounds or {}
+        self.book_ids = book_ids
+
+    def order_by(self, *ordering):
+        return CatalogueQuery(self.catalogue, ordering, self.bounds, self.book_ids)
+
+    def filter(self, pk__in=None, **bounds):
+        book_ids = self.book_ids if pk__in is None else list(pk__in)
+        return CatalogueQuery(
+            self.catalogue, self.ordering, {**self.bounds, **bounds}, book_ids
+        )
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError("Catalogue queries only support slices without step.")
+        offset = key.start or 0
+        limit = None if key.stop is None else max(key.stop - offset, 0)
+        return self.catalogue.select(self.ordering, self.bounds, offset, limit)
+
+    def __iter__(self):
+        if self.book_ids is not None:
+            return iter(self.catalogue.filter_ids(self.book_ids))
+        return iter(self[:])
+
+
+class CatalogueSearchBackend(BaseSearchBackend):
+    """
+    Search backend answering from a Catalogue instead of the database.
+    """
+
+    def __init__(self, catalogue, using="default"):
+        super().__init__(using)
+        self.catalogue = catalogue
+
+    def ranked_ids(self, search_query, limit, after=None, reverse=False):
+        terms = [token for term in get_search_terms(search_query) for token in tokenize(term)]
+        return self.catalogue.search(terms, limit, after=after, reverse=reverse)
+
+
+def get_catalogue(request):
+    """
+    Returns the catalogue if it is enabled and reflects the current state of the books.
+
+    The catalogue is current if its generation equals the list generation of
+    the response cache. A missing catalogue is loaded in the background, one
+    lagging behind for longer than RELOAD_DELAY is reloaded. Until then the
+    books are read from the database.
+
+    Writes of another process change the list generation only when the
+    response cache is shared (file or redis). With a per-process cache they
+    are noticed by checking the catalogue against the database in the
+    background every VERIFY_INTERVAL seconds, see verify_catalogue().
+
+    Args:
+    - request: The HTTP request object.
+
+    Returns:
+    - Catalogue: The catalogue, or None if the request has to use the database.
+    """
+
+    options = get_catalogue_settings()
+    if not options["ENABLED"]:
+        return None
+    catalogue = _catalogue
+    if catalogue is None:
+        schedule_catalogue_load()
+        return None
+    if catalogue.generation == get_list_generation(request):
+        catalogue.out_of_sync_since = None
+        interval = options["VERIFY_INTERVAL"]
+        if interval is not None and time.monotonic() - catalogue.verified_at > interval:
+            schedule_catalogue_verification(catalogue)
+        return catalogue
+    now = time.monotonic()
+    if catalogue.out_of_sync_since is None:
+        catalogue.out_of_sync_since = now
+    elif now - catalogue.out_of_sync_since > options["RELOAD_DELAY"]:
+        schedule_catalogue_load()
+    return None
+
+
+def load_catalogue():
+    """
+    Loads the catalogue from the database and makes it available to requests.
+
+    Returns:
+    - Catalogue: The loaded catalogue.
+    """
+
+    global _catalogue
+    generation = get_generation(LIST_GENERATION_KEY)
+    catalogue = Catalogue.load(generation, get_catalogue_settings()["MAX_BYTES"])
+    _catalogue = catalogue
+    return catalogue
+
+
+def schedule_catalogue_load():
+    """
+    Loads the catalogue in a background thread, unless a load is already running.
+    """
+
+    global _loading
+    with _load_lock:
+        if _loading:
+            return
+        _loading = True
+    threading.Thread(target=run_catalogue_load, name="catalogue-load", daemon=True).start()
+
+
+def run_catalogue_load():
+    global _loading
+    try:
+        load_catalogue()
+    except Exception:
+        logger.exception("Loading the catalogue failed.")
+    finally:
+        connections.close_all()
+        with _load_lock:
+            _loading = False
+
+
+def verify_catalogue(catalogue):
+    """
+    Checks a catalogue against the database and drops it from use if it is stale.
+
+    A stale catalogue no longer matches the list generation, so requests read
+    from the database until it was reloaded. A catalogue refreshed by a write
+    of this process during the check is left alone, as the database state may
+    predate the refresh.
+
+    Args:
+    - catalogue: The catalogue to check.
+
+    Returns:
+    - bool: Whether the catalogue matched the database.
+    """
+
+    generation = catalogue.generation
+    catalogue.verified_at = time.monotonic()
+    matches = catalogue.read_state() == catalogue.get_state()
+    if not matches and catalogue.generation == generation:
+        logger.info("The catalogue is stale, another process wrote to the books.")
+        catalogue.generation = None
+    return matches
+
+
+def schedule_catalogue_verification(catalogue):
+    """
+    Runs verify_catalogue() in a background thread, unless a check is already running.
+    """
+
+    global _verifying
+    with _load_lock:
+        if _verifying:
+            return
+        _verifying = True
+    threading.Thread(
+        target=run_catalogue_verification,
+        args=(catalogue,),
+        name="catalogue-verify",
+        daemon=True,
+    ).start()
+
+
+def run_catalogue_verification(catalogue):
+    global _verifying
+    try:
+        verify_catalogue(catalogue)
+    except Exception:
+        logger.exception("Checking the catalogue failed.")
+    finally:
+        connections.close_all()
+        with _load_lock:
+            _verifying = False
+
+
+def clear_catalogue():
+    global _catalogue
+    _catalogue = None
+
+
+def refresh_catalogue(
+    sender, book_ids, previous_generation, generation, author_ids=(), **kwargs
+):
+    """
+    Signal handler for books_written applying committed writes to the catalogue.
+
+    The written books are re-read from the database. If the catalogue did not
+    reflect the generation preceding the writes, another process wrote in
+    between and the catalogue is reloaded instead.
+
+    Args:
+    - sender: The model class of the written rows (Book).
+    - book_ids: IDs of the written books.
+    - previous_generation: The list generation before the writes.
+    - generation: The list generation after the writes.
+    - author_ids: IDs of changed authors, whose books are re-read.
+    - **kwargs: Additional keyword arguments.
+    """
+
+    catalogue = _catalogue
+    if catalogue is None or not get_catalogue_settings()["ENABLED"]:
+        return
+    if catalogue.generation != previous_generation:
+        catalogue.generation = None
+        schedule_catalogue_load()
+        return
+    try:
+        catalogue.refresh(book_ids, author_ids)
+    except DatabaseError:
+        logger.exception("Refreshing the catalogue failed.")
+        catalogue.generation = None
+        schedule_catalogue_load()
+        return
+    catalogue.generation = generation
@@ -0,0 +1,166 @@
+import logging
+import queue
+import threading
+from django.conf import settings
+from django.db import connections, transaction
+from .models import Book, CoverVariantReference
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COVER_CLEANUP = {
+    # Maximum number of files handled per batch.
+    "BATCH_SIZE": 100,
+    # Seconds the worker waits for more files before handling a partial batch.
+    "BATCH_DELAY": 0.5,
+    # Delete files in the committing thread instead of the background worker.
+    "EAGER": False,
+    # Keep unreferenced files saved less than this many seconds ago, as they
+    # may belong to a write that has not committed yet. prune_cover_images
+    # removes them later if they stay orphaned.
+    "MIN_AGE": 60,
+}
+
+
+def get_cover_cleanup_settings():
+    return {**DEFAULT_COVER_CLEANUP, **getattr(settings, "COVER_CLEANUP", {})}
+
+
+def get_cover_storage():
+    return Book._meta.get_field("cover_image").storage
+
+
+def get_file_names(book):
+    """
+    Returns the storage names of the cover and cover variants of a book.
+
+    Args:
+    - book: The Book instance.
+
+    Returns:
+    - list: The storage names.
+    """
+
+    names = [book.cover_image.name] if book.cover_image else []
+    for widths in book.cover_variants.values():
+        names += widths.values()
+    return names
+
+
+def set_variant_references(book_id, variants):
+    """
+    Records the cover variant files of a book, replacing those recorded before.
+
+    Must be called in the transaction writing Book.cover_variants, see
+    CoverVariantReference.
+
+    Args:
+    - book_id: The ID of the book.
+    - variants: The storage names of the variants, by format and width.
+    """
+
+    CoverVariantReference.objects.filter(book_id=book_id).delete()
+    CoverVariantReference.objects.bulk_create(
+        CoverVariantReference(book_id=book_id, name=name)
+        for widths in variants.values()
+        for name in widths.values()
+    )
+
+
+def delete_files(names):
+    """
+    Deletes the given cover files.
+
+    The cover storage only unlinks files that no book references anymore and
+    that were not saved within MIN_AGE seconds, and missing files are ignored,
+    so a file can safely be scheduled more than once.
+
+    Args:
+    - names: The storage names of the files.
+    """
+
+    storage = get_cover_storage()
+    min_age = get_cover_cleanup_settings()["MIN_AGE"]
+    for name in set(names):
+        try:
+            storage.delete(name, min_age=min_age)
+        except OSError:
+            logger.exception("Deleting the cover file %s failed.", name)
+
+
+class CoverCleanupQueue:
+    """
+    Background queue deleting cover files in batches.
+
+    Files are handed over once the deleting transaction has committed and are
+    deleted by a single daemon thread, which collects them into batches and
+    keeps the reference checks and unlinking out of the request that deleted
+    the books.
+
+    Methods:
+    - put(self, names): Queues files for deletion.
+    - join(self): Blocks until all queued files have been handled.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def put(self, names):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="cover-cleanup", daemon=True
+                )
+                self.thread.start()
+        for name in names:
+            self.queue.put(name)
+
+    def join(self):
+        self.queue.join()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            options = get_cover_cleanup_settings()
+            try:
+                while len(batch) < options["BATCH_SIZE"]:
+                    batch.append(self.queue.get(timeout=options["BATCH_DELAY"]))
+            except queue.Empty:
+                pass
+
+            try:
+                delete_files(batch)
+            except Exception:
+                logger.exception("Deleting cover files %s failed.", batch)
+            finally:
+                connections.close_all()
+                for _ in batch:
+                    self.queue.task_done()
+
+
+cleanup_queue = CoverCleanupQueue()
+
+
+def schedule_file_deletion(names):
+    """
+    Deletes cover files after the current transaction commits.
+
+    If the transaction is rolled back, the files are kept.
+
+    Args:
+    - names: The storage names of the files.
+    """
+
+    names = [name for name in names if name]
+    if not names:
+        return
+
+    def enqueue():
+        if get_cover_cleanup_settings()["EAGER"]:
+            delete_files(names)
+        else:
+            cleanup_queue.put(names)
+
+    transaction.on_commit(enqueue, robust=True)
@@ -0,0 +1,224 @@
+import hashlib
+from datetime import datetime, timezone
+from django.shortcuts import get_object_or_404
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from .cache import (
+    AUTHORS_GENERATION_KEY,
+    LIST_GENERATION_KEY,
+    aget_generation,
+    get_detail_generation_key,
+    get_generation,
+    get_response_cache,
+)
+from .models import Book
+
+
+def make_etag(request, *parts):
+    """
+    Builds a strong entity tag for a representation.
+
+    Besides the given state, the tag covers the accepted media type and the query
+    string, so the JSON and XML representations, and differently shaped responses
+    of the same resource, get different tags. The path is left out, so a book has
+    the same tag on /books/<id>/ and /user_books/<id>/.
+
+    Args:
+    - request: The HTTP request object.
+    - *parts: Values identifying the state of the resource.
+
+    Returns:
+    - str: The unquoted entity tag.
+    """
+
+    variant = "\n".join(
+        [*map(str, parts), request.accepted_media_type, request.META.get("QUERY_STRING", "")]
+    )
+    return hashlib.sha1(variant.encode("utf-8"), usedforsecurity=False).hexdigest()
+
+
+def get_book_state(request, book_id):
+    """
+    Returns the version and update time of a book, or None if it is not found.
+
+    For safe methods the state is kept in the response cache next to the cached
+    responses of the book, so answering a conditional GET needs no query. For
+    unsafe methods it is always read from the database, and only books of the
+    authenticated user are considered, so a precondition cannot reveal anything
+    about the books of other authors. The result is stored on the request, as it
+    is needed for both headers.
+
+    Args:
+    - request: The HTTP request object.
+    - book_id: The ID of the book.
+
+    Returns:
+    - tuple: The version and updated_at of the book, or None.
+    """
+
+    if hasattr(request, "_book_state"):
+        return request._book_state
+
+    if request.method in SAFE_METHODS:
+        cache = get_response_cache()
+        generation_key = get_detail_generation_key(book_id)
+        generation = get_generation(generation_key, AUTHORS_GENERATION_KEY)
+        key = f"books:state:{generation_key}:{generation}"
+        state = cache.get(key)
+        if state is None:
+            state = Book.objects.filter(pk=book_id).values_list("version", "updated_at").first()
+            if state is not None:
+                cache.set(key, state)
+    else:
+        books = Book.objects.filter(pk=book_id, author_id=request.user.pk)
+        state = books.values_list("version", "updated_at").first()
+
+    request._book_state = state
+    return state
+
+
+async def aget_book_state(request, book_id):
+    """
+    Async version of get_book_state().
+
+    Async views call it before applying book_condition, whose callables then
+    find the state on the request and make no blocking call.
+    """
+
+    if hasattr(request, "_book_state"):
+        return request._book_state
+
+    if request.method in SAFE_METHODS:
+        cache = get_response_cache()
+        generation_key = get_detail_generation_key(book_id)
+        generation = await aget_generation(generation_key, AUTHORS_GENERATION_KEY)
+        key = f"books:state:{generation_key}:{generation}"
+        state = await cache.aget(key)
+        if state is None:
+            books = Book.objects.filter(pk=book_id)
+            state = await books.values_list("version", "updated_at").afirst()
+            if state is not None:
+                await cache.aset(key, state)
+    else:
+        books = Book.objects.filter(pk=book_id, author_id=request.user.pk)
+        state = await books.values_list("version", "updated_at").afirst()
+
+    request._book_state = state
+    return state
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = "The book was changed by another request."
+    default_code = "precondition_failed"
+
+
+def lock_book(request, queryset, book_id):
+    """
+    Loads a book of the authenticated user for a write and locks its row.
+
+    book_condition evaluates If-Match and If-Unmodified-Since before the view
+    runs, outside of the write's transaction. Once the row is locked, it is
+    compared with the state the preconditions were evaluated against, so a
+    write committed by another request in between is rejected with a 412
+    response instead of being overwritten. Must be called inside
+    transaction.atomic(); on SQLite the IMMEDIATE transaction mode takes the
+    lock, as select_for_update() is not supported.
+
+    Args:
+    - request: The HTTP request object.
+    - queryset: The Book queryset to load the book from.
+    - book_id: The ID of the book.
+
+    Returns:
+    - Book: The locked book.
+    """
+
+    book = get_object_or_404(queryset.select_for_update(), pk=book_id, author_id=request.user.pk)
+    has_preconditions = any(
+        header in request.META for header in ("HTTP_IF_MATCH", "HTTP_IF_UNMODIFIED_SINCE")
+    )
+    state = getattr(request, "_book_state", None)
+    if has_preconditions and state != (book.version, book.updated_at):
+        raise PreconditionFailed()
+    return book
+
+
+def book_etag(request, book_id, **kwargs):
+    state = get_book_state(request, book_id)
+    if state is None:
+        return None
+    return make_etag(request, "book", book_id, state[0])
+
+
+def book_last_modified(request, book_id, **kwargs):
+    state = get_book_state(request, book_id)
+    if state is None:
+        return None
+    return state[1]
+
+
+def set_book_validators(response, request, book):
+    """
+    Sets the ETag and Last-Modified headers of a response to the state of a book.
+
+    Used after a book was written, so a client can send the new tag with its
+    next conditional request without fetching the book again.
+
+    Args:
+    - response: The response to set the headers on.
+    - request: The HTTP request object.
+    - book: The Book instance the response represents.
+
+    Returns:
+    - Response: The response.
+    """
+
+    response["ETag"] = quote_etag(make_etag(request, "book", book.pk, book.version))
+    response["Last-Modified"] = http_date(book.updated_at.timestamp())
+    return response
+
+
+def get_list_generation(request):
+    """
+    Returns the list generation of the response cache, stored on the request.
+
+    Args:
+    - request: The HTTP request object.
+
+    Returns:
+    - int: The list generation.
+    """
+
+    if not hasattr(request, "_list_generation"):
+        request._list_generation = get_generation(LIST_GENERATION_KEY)
+    return request._list_generation
+
+
+async def aget_list_generation(request):
+    if not hasattr(request, "_list_generation"):
+        request._list_generation = await aget_generation(LIST_GENERATION_KEY)
+    return request._list_generation
+
+
+def book_list_etag(request, **kwargs):
+    return make_etag(request, "list", request.user.pk, get_list_generation(request))
+
+
+def book_list_last_modified(request, **kwargs):
+    generation = get_list_generation(request)
+    return datetime.fromtimestamp(generation / 1e9, tz=timezone.utc)
+
+
+# Conditional GET for a single book, and If-Match / If-Unmodified-Since for
+# writes to it. Not modified responses are returned before anything is serialized.
+book_condition = condition(etag_func=book_etag, last_modified_func=book_last_modified)
+
+# Conditional GET for book lists. The list generation of the response cache
+# changes on every write to a book or author, so no query is needed.
+book_list_condition = condition(
+    etag_func=book_list_etag, last_modified_func=book_list_last_modified
+)
@@ -0,0 +1,194 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from .cache import invalidate_books
+from .cleanup import schedule_file_deletion, set_variant_references
+from .models import Book
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover
+    Image = None
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COVER_PROCESSING = {
+    # Widths in pixels of the generated variants. Covers are never upscaled.
+    "WIDTHS": [160, 480],
+    # Pillow format names of the generated variants, unsupported ones are skipped.
+    "FORMATS": ["webp", "avif"],
+    # Quality passed to the encoders.
+    "QUALITY": 80,
+    # Number of worker threads processing covers.
+    "WORKERS": 2,
+    # Process covers in the committing thread instead of the worker pool.
+    "EAGER": False,
+}
+
+VARIANTS_DIRECTORY = "cover_images/variants/"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_cover_processing_settings():
+    return {**DEFAULT_COVER_PROCESSING, **getattr(settings, "COVER_PROCESSING", {})}
+
+
+def get_executor():
+    """
+    Returns the worker pool processing covers, creating it on first use.
+
+    Returns:
+    - ThreadPoolExecutor: The worker pool.
+    """
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_cover_processing_settings()["WORKERS"],
+                thread_name_prefix="cover-processing",
+            )
+        return _executor
+
+
+def schedule_cover_processing(book):
+    """
+    Hands the cover of a book to the worker pool once the transaction commits.
+
+    The request returns immediately, the variants appear in the book's
+    representation as soon as the worker has stored them.
+
+    Args:
+    - book: The Book instance whose cover was uploaded.
+    """
+
+    if Image is None or not book.cover_image:
+        return
+
+    book_id, name = book.pk, book.cover_image.name
+
+    def submit():
+        if get_cover_processing_settings()["EAGER"]:
+            process_cover(book_id, name)
+        else:
+            get_executor().submit(run_in_worker, process_cover, book_id, name)
+
+    transaction.on_commit(submit, robust=True)
+
+
+def run_in_worker(task, *args):
+    """
+    Runs a task in a worker thread and closes its database connections afterwards.
+
+    Args:
+    - task: The function to run.
+    - *args: The arguments of the task.
+    """
+
+    try:
+        task(*args)
+    finally:
+        connections.close_all()
+
+
+def render_variant(image, width, image_format, quality):
+    """
+    Encodes a resized copy of an image.
+
+    Args:
+    - image: The source image.
+    - width: The maximum width of the variant.
+    - image_format: The Pillow format name of the variant.
+    - quality: The encoder quality.
+
+    Returns:
+    - bytes: The encoded variant.
+    """
+
+    variant = image.copy()
+    variant.thumbnail((width, width * 4))
+    buffer = BytesIO()
+    variant.save(buffer, format=image_format.upper(), quality=quality)
+    return buffer.getvalue()
+
+
+def store_variant(storage, content, image_format):
+    """
+    Stores an encoded variant in the content-addressed cover storage.
+
+    Identical variants are stored once, and a changed cover always gets new
+    URLs, so variants can be cached by clients and CDNs forever.
+
+    Args:
+    - storage: The storage of the cover images.
+    - content: The encoded variant.
+    - image_format: The Pillow format name of the variant.
+
+    Returns:
+    - str: The storage name of the variant.
+    """
+
+    return storage.save(f"{VARIANTS_DIRECTORY}variant.{image_format}", ContentFile(content))
+
+
+def process_cover(book_id, name):
+    """
+    Generates the resized variants of a cover and records them on the book.
+
+    The variants are only recorded if the book still has the processed cover,
+    so a slow worker cannot overwrite the variants of a newer upload.
+
+    Args:
+    - book_id: The ID of the book.
+    - name: The storage name of the uploaded cover.
+    """
+
+    options = get_cover_processing_settings()
+    storage = Book._meta.get_field("cover_image").storage
+    try:
+        with storage.open(name) as source:
+            image = ImageOps.exif_transpose(Image.open(source))
+            image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        Image.init()
+        variants = {}
+        for image_format in options["FORMATS"]:
+            if image_format.upper() not in Image.SAVE:
+                continue
+            variants[image_format] = {
+                str(width): store_variant(
+                    storage,
+                    render_variant(image, width, image_format, options["QUALITY"]),
+                    image_format,
+                )
+                for width in options["WIDTHS"]
+            }
+
+        with transaction.atomic():
+            updated = Book.objects.filter(pk=book_id, cover_image=name).update(
+                cover_variants=variants,
+                version=F("version") + 1,
+                updated_at=timezone.now(),
+            )
+            if updated:
+                set_variant_references(book_id, variants)
+        if updated:
+            invalidate_books([book_id])
+        else:
+            # The cover was replaced or the book deleted in the meantime.
+            schedule_file_deletion(
+                [name for widths in variants.values() for name in widths.values()]
+            )
+    except Exception:
+        logger.exception("Processing the cover %s of book %s failed.", name, book_id)
@@ -0,0 +1,129 @@
+from asgiref.sync import sync_to_async
+from .renderers import FastJSONRenderer, StreamingXMLRenderer, dump_ndjson_line
+from .serializers import BookRowSerializer
+
+
+# Number of books fetched from the database per round trip.
+EXPORT_CHUNK_SIZE = 2000
+
+# Number of serialized books joined into one chunk of the streamed response.
+EXPORT_BATCH_SIZE = 100
+
+
+def iter_representations(books, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields the serialized representation of every book of a queryset.
+
+    The queryset is read as rows with iterator(), so only one chunk of books is
+    held in memory at a time, and rendered with BookRowSerializer.
+
+    Args:
+    - books: The queryset of books to serialize.
+    - chunk_size: Number of books fetched from the database at a time.
+
+    Yields:
+    - dict: The serialized book.
+    """
+
+    serializer = BookRowSerializer()
+    for row in books.as_rows().iterator(chunk_size=chunk_size):
+        yield serializer.to_representation(row)
+
+
+def iter_batches(chunks, batch_size=EXPORT_BATCH_SIZE):
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield b"".join(batch)
+            batch = []
+    if batch:
+        yield b"".join(batch)
+
+
+def iter_ndjson(books):
+    """
+    Streams books as newline delimited JSON, one book per line.
+
+    Args:
+    - books: The queryset of books to export.
+
+    Yields:
+    - bytes: Chunks of the document.
+    """
+
+    yield from iter_batches(dump_ndjson_line(book) for book in iter_representations(books))
+
+
+def iter_json(books):
+    """
+    Streams books as a JSON array, byte-identical to the output of FastJSONRenderer.
+
+    Args:
+    - books: The queryset of books to export.
+
+    Yields:
+    - bytes: Chunks of the document.
+    """
+
+    renderer = FastJSONRenderer()
+
+    def chunks():
+        yield b"["
+        for index, book in enumerate(iter_representations(books)):
+            if index:
+                yield b","
+            yield renderer.render(book)
+        yield b"]"
+
+    yield from iter_batches(chunks())
+
+
+def iter_xml(books):
+    """
+    Streams books as XML, byte-identical to the output of StreamingXMLRenderer.
+
+    Every book is written as a 'list-item' element of the root element as soon
+    as it is serialized, so the document is never built in memory.
+
+    Args:
+    - books: The queryset of books to export.
+
+    Yields:
+    - bytes: Chunks of the document.
+    """
+
+    renderer = StreamingXMLRenderer()
+    chunks = renderer.iter_list(iter_representations(books))
+    yield from iter_batches(chunk.encode(renderer.charset) for chunk in chunks)
+
+
+async def aiter_export(chunks):
+    """
+    Streams the chunks of an exporter from an async iterator, for serving under ASGI.
+
+    Django's ASGI handler reads a synchronous iterator completely before it
+    sends the response, so an export would be held in memory. Here every chunk
+    is produced in the thread that runs the sync views, where the exporter's
+    database cursor lives, and sent before the next one is read.
+
+    Args:
+    - chunks: The iterator returned by one of the EXPORTERS.
+
+    Yields:
+    - bytes: Chunks of the document.
+    """
+
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
+
+
+EXPORTERS = {
+    "ndjson": iter_ndjson,
+    "json": iter_json,
+    "xml": iter_xml,
+}
@@ -0,0 +1,116 @@
+from .models import BOOK_ROW_FIELDS
+
+
+# Fields of a book representation, in the order they are rendered.
+BOOK_FIELDS = (
+    "id",
+    "author",
+    "cover_variants",
+    "title",
+    "description",
+    "cover_image",
+    "price",
+    "updated_at",
+    "version",
+)
+
+# Fields rendered as embedded objects when expanded, by the columns they need.
+EXPANDABLE_FIELDS = {
+    "author": ("author_username", "author_email", "author_pseudonym"),
+}
+
+FIELDS_PARAM = "fields"
+EXPAND_PARAM = "expand"
+
+
+class BookFieldset:
+    """
+    The fields of a book representation a client asked for.
+
+    Clients pick fields with a comma-separated 'fields' query parameter, e.g.
+    '?fields=id,title,price', and embed related objects with 'expand', e.g.
+    '?expand=author'. Without 'fields' every field is rendered and the author
+    is expanded, as before. With 'fields' the author is rendered as its ID
+    unless it is expanded, and expanded fields are always rendered. Unknown
+    names are ignored, like unknown orderings are.
+
+    The fieldset narrows both the serializer output and the selected columns,
+    so the database and the renderer only handle what the client needs.
+
+    Attributes:
+    - fields: The rendered fields, in the order of BOOK_FIELDS.
+    - expand: The rendered fields embedded as objects.
+
+    Methods:
+    - from_request(cls, request): Reads the fieldset from the query parameters.
+    - is_complete(self): Whether every field is rendered and the author expanded.
+    - get_row_fields(self, ordering=()): Returns the columns selected for BookRowSerializer.
+    - narrow(self, queryset): Restricts a queryset to the columns BookSerializer renders.
+    """
+
+    def __init__(self, fields=BOOK_FIELDS, expand=tuple(EXPANDABLE_FIELDS)):
+        expand = [name for name in EXPANDABLE_FIELDS if name in expand]
+        self.fields = tuple(name for name in BOOK_FIELDS if name in fields or name in expand)
+        self.expand = tuple(expand)
+
+    @classmethod
+    def from_request(cls, request):
+        expand = parse_names(request.query_params.get(EXPAND_PARAM, ""))
+        fields = parse_names(request.query_params.get(FIELDS_PARAM, ""))
+        if not fields.intersection(BOOK_FIELDS):
+            return cls(expand=expand | set(EXPANDABLE_FIELDS))
+        return cls(fields, expand)
+
+    def is_complete(self):
+        return self.fields == BOOK_FIELDS and self.expand == tuple(EXPANDABLE_FIELDS)
+
+    def get_row_fields(self, ordering=()):
+        """
+        Returns the columns selected with BookQuerySet.as_rows().
+
+        The ID and the ordering columns are always selected, as pagination needs
+        them to build its cursors.
+
+        Args:
+        - ordering: The fields the rows are ordered by.
+
+        Returns:
+        - tuple: The column names, in the order of BOOK_ROW_FIELDS.
+        """
+
+        columns = {"id", *(field.lstrip("-") for field in ordering)}
+        for name in self.fields:
+            columns.update(get_columns(name, name in self.expand))
+        return tuple(column for column in BOOK_ROW_FIELDS if column in columns)
+
+    def narrow(self, queryset):
+        """
+        Restricts a queryset of Book instances to the columns of the fieldset.
+
+        Args:
+        - queryset: The BookQuerySet to restrict.
+
+        Returns:
+        - BookQuerySet: The queryset loading only the rendered columns.
+        """
+
+        if self.is_complete():
+            return queryset.with_author()
+        columns = []
+        for name in self.fields:
+            columns += get_columns(name, name in self.expand)
+        # The foreign key column is loaded as the 'author' field.
+        only = ["id", *(column for column in columns if column not in ("id", "author_id"))]
+        if "author" in self.fields:
+            only.append("author")
+        return queryset.only(*only)
+
+
+def parse_names(value):
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+def get_columns(name, expanded=False):
+    if name == "author":
+        return ("author_id", *EXPANDABLE_FIELDS["author"]) if expanded else ("author_id",)
+    return (name,)
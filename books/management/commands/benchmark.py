@@ -0,0 +1,238 @@
+import json
+import platform
+import time
+from pathlib import Path
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from books.benchmark import (
+    ENDPOINTS,
+    RENDERERS,
+    compare_results,
+    parse_volume,
+    run_in_process,
+    run_renderers,
+    run_over_http,
+    run_serializers,
+    seed,
+    start_server,
+)
+
+# Result pairs whose speedup is printed, by mode.
+SPEEDUPS = {
+    "serializers": ("serializer_model", "serializer_rows", "BookRowSerializer vs. BookSerializer"),
+    "renderers": ("renderer_stock", "renderer_fast", "books.renderers vs. DRF renderers"),
+}
+
+
+class Command(BaseCommand):
+    """
+    Management command benchmarking the REST API.
+
+    The command switches to a separate SQLite database, migrates and seeds it
+    with the requested number of users and books, and measures the endpoints
+    for every renderer, either in-process with the test client or over HTTP
+    against a local development server. Latency percentiles, throughput, query
+    counts and peak RSS are printed and written as JSON, and can be compared
+    with the results of an earlier run.
+    """
+
+    help = "Seeds a benchmark database and measures the latency of the API endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default=str(settings.BASE_DIR / "benchmark.sqlite3"),
+            help="SQLite file seeded and benchmarked (default: benchmark.sqlite3).",
+        )
+        parser.add_argument(
+            "--users", default="1k", help="Number of users, e.g. 1000 or 1k (default: 1k)."
+        )
+        parser.add_argument(
+            "--books",
+            default="10k",
+            help="Number of books, e.g. 10k, 100k or 1M (default: 10k).",
+        )
+        parser.add_argument(
+            "--mode",
+            choices=["in-process", "server", "serializers", "renderers"],
+            default="in-process",
+            help=(
+                "Use the test client in this process, HTTP against a local server, or "
+                "compare the book serializers or the renderers on pages of --page-size books."
+            ),
+        )
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=10_000,
+            help="Books per page in serializers and renderers mode (default: 10000).",
+        )
+        parser.add_argument(
+            "--url",
+            help="Benchmark an already running server at this URL instead of starting one.",
+        )
+        parser.add_argument("--port", type=int, default=8765, help="Port of the local server.")
+        parser.add_argument(
+            "--asgi",
+            action="store_true",
+            help="Serve with uvicorn instead of the development server (server mode).",
+        )
+        parser.add_argument(
+            "--async-views",
+            action="store_true",
+            help="Serve the async versions of the book views (server mode).",
+        )
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            choices=ENDPOINTS,
+            dest="endpoints",
+            help="Endpoint to benchmark, can be repeated (default: all).",
+        )
+        parser.add_argument(
+            "--renderer",
+            action="append",
+            choices=list(RENDERERS),
+            dest="renderers",
+            help="Renderer to request, can be repeated (default: all).",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Measured requests per endpoint."
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=5, help="Unmeasured requests sent first."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=1, help="Requests in flight (server mode)."
+        )
+        parser.add_argument(
+            "--cold-cache",
+            action="store_true",
+            help="Clear the response cache before every request (in-process mode).",
+        )
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument("--compare", help="Compare the results with this JSON file.")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.1,
+            help="Relative p95 slowdown reported as regression (default: 0.1).",
+        )
+
+    def handle(self, *args, **options):
+        users = parse_volume(options["users"])
+        books = parse_volume(options["books"])
+        endpoints = options["endpoints"] or ENDPOINTS
+        renderers = options["renderers"] or list(RENDERERS)
+        if options["requests"] < 2:
+            raise CommandError("At least 2 requests are needed for percentiles.")
+
+        if connection.vendor != "sqlite":
+            raise CommandError("Benchmarks run on SQLite, select the sqlite database profile.")
+        database = Path(options["database"]).resolve()
+        if database == Path(settings.DATABASES["default"]["NAME"]).resolve():
+            raise CommandError("Refusing to seed the main database, pass another --database.")
+        # The default connection is pointed at the benchmark database for the
+        # run, so the views and the test client use it, and restored afterwards.
+        main_database = connection.settings_dict["NAME"]
+        connection.close()
+        connection.settings_dict["NAME"] = str(database)
+        try:
+            call_command("migrate", verbosity=0)
+            seed(users, books, log=self.stdout.write)
+
+            arguments = (endpoints, renderers, options["requests"], options["warmup"])
+            if options["mode"] == "serializers":
+                results = run_serializers(renderers, options["requests"], options["page_size"])
+            elif options["mode"] == "renderers":
+                results = run_renderers(renderers, options["requests"], options["page_size"])
+            elif options["mode"] == "in-process":
+                results = run_in_process(*arguments, cold_cache=options["cold_cache"])
+            elif options["url"]:
+                results = run_over_http(
+                    options["url"].rstrip("/"), *arguments, concurrency=options["concurrency"]
+                )
+            else:
+                server = start_server(
+                    database, options["port"], options["asgi"], options["async_views"]
+                )
+                try:
+                    results = run_over_http(
+                        f"http://127.0.0.1:{options['port']}",
+                        *arguments,
+                        concurrency=options["concurrency"],
+                        pid=server.pid,
+                    )
+                finally:
+                    server.terminate()
+                    server.wait()
+        finally:
+            connection.close()
+            connection.settings_dict["NAME"] = main_database
+
+        run = {
+            "meta": {
+                "mode": options["mode"],
+                "users": users,
+                "books": books,
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+                "asgi": options["asgi"],
+                "async_views": options["async_views"],
+                "cold_cache": options["cold_cache"],
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            },
+            "results": results,
+        }
+        self.write_table(results)
+        if options["mode"] in SPEEDUPS:
+            self.write_speedups(results, *SPEEDUPS[options["mode"]])
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(run, indent=2))
+            self.stdout.write(f"Results written to {options['output']}.")
+        if options["compare"]:
+            self.compare(run, options["compare"], options["threshold"])
+
+    def write_table(self, results):
+        self.stdout.write(
+            f"{'endpoint':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+            f"{'req/s':>10}{'queries':>9}{'RSS MB':>9}{'errors':>8}"
+        )
+        for key, result in results.items():
+            queries = result["queries_per_request"]
+            rss = result["peak_rss_kb"]
+            self.stdout.write(
+                f"{key:<22}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                f"{result['p99_ms']:>10.2f}{result['throughput_rps'] or 0:>10.1f}"
+                f"{'-' if queries is None else queries:>9}"
+                f"{'-' if rss is None else round(rss / 1024, 1):>9}{result['errors']:>8}"
+            )
+
+    def write_speedups(self, results, baseline, optimized, description):
+        for key, result in results.items():
+            name, renderer = key.split(":")
+            if name == optimized:
+                before = results[f"{baseline}:{renderer}"]
+                speedup = before["p50_ms"] / result["p50_ms"]
+                self.stdout.write(f"{description} {renderer}: {speedup:.1f}x faster (p50)")
+
+    def compare(self, run, path, threshold):
+        baseline = json.loads(Path(path).read_text())
+        if baseline["meta"]["mode"] != run["meta"]["mode"]:
+            self.stdout.write(self.style.WARNING("The baseline was measured in another mode."))
+        rows = compare_results(baseline, run, threshold)
+        self.stdout.write(f"{'p95':<22}{'baseline':>10}{'current':>10}{'change':>9}")
+        for key, before, after, change, regression in rows:
+            line = f"{key:<22}{before:>10.2f}{after:>10.2f}{change:>+9.1%}"
+            self.stdout.write(self.style.ERROR(line) if regression else line)
+        regressions = [row[0] for row in rows if row[4]]
+        if regressions:
+            raise CommandError(
+                f"p95 latency regressed by more than {threshold:.0%}: {', '.join(regressions)}"
+            )
+        self.stdout.write(self.style.SUCCESS("No regressions."))
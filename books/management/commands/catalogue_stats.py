@@ -0,0 +1,45 @@
+import time
+from django.core.management.base import BaseCommand
+from books.catalogue import Catalogue, get_catalogue_settings
+
+
+class Command(BaseCommand):
+    """
+    Management command loading the catalogue store and printing its memory usage.
+
+    Prints the estimated size of every column, which helps choosing
+    BOOK_STORE_CATALOGUE_MAX_MB, and whether the configured bound truncates
+    the catalogue. The catalogue of the running server is not affected.
+    """
+
+    help = "Loads the catalogue store and prints its estimated memory usage by column."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-mb",
+            type=float,
+            help="Bound for the estimated size in MiB, defaults to CATALOGUE_STORE['MAX_BYTES'].",
+        )
+
+    def handle(self, *args, **options):
+        max_bytes = get_catalogue_settings()["MAX_BYTES"]
+        if options["max_mb"] is not None:
+            max_bytes = int(options["max_mb"] * 1024 * 1024)
+
+        start = time.perf_counter()
+        catalogue = Catalogue.load(generation=None, max_bytes=max_bytes)
+        elapsed = time.perf_counter() - start
+
+        for column, size in catalogue.memory_usage().items():
+            self.stdout.write(f"{column:<16} {size / 1024:>12.1f} KiB")
+        self.stdout.write(
+            f"Loaded {len(catalogue.slots)} books in {elapsed * 1000:.0f} ms, "
+            f"estimated at {catalogue.nbytes / 1024:.1f} KiB."
+        )
+        if catalogue.truncated:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"The bound truncates the catalogue after book {catalogue.last_id}, "
+                    "searches and price orderings use the database."
+                )
+            )
@@ -0,0 +1,73 @@
+import os
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from books.cleanup import get_cover_storage
+from books.models import Book
+
+
+class Command(BaseCommand):
+    """
+    Management command deleting cover files that no Book references.
+
+    Files can be orphaned when a process stops before its deferred deletions ran,
+    or by uploads of requests that failed afterwards. The command walks the cover
+    directory of the storage and deletes every file that is neither the cover nor
+    a cover variant of a book. Recent files are kept, as they may belong to an
+    upload whose transaction has not committed yet.
+    """
+
+    help = "Deletes cover images and cover variants that no book references."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the orphaned files instead of deleting them.",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=3600,
+            help="Keep files modified less than this many seconds ago (default: 3600).",
+        )
+
+    def handle(self, *args, dry_run=False, min_age=3600, **options):
+        storage = get_cover_storage()
+        directory = Book._meta.get_field("cover_image").upload_to
+        referenced = self.get_referenced_names()
+        cutoff = timezone.now() - timedelta(seconds=min_age)
+
+        orphaned = [
+            name
+            for name in self.walk(storage, directory.rstrip("/"))
+            if name not in referenced and storage.get_modified_time(name) < cutoff
+        ]
+        for name in orphaned:
+            self.stdout.write(name)
+            if not dry_run:
+                storage.delete(name, min_age=min_age)
+
+        action = "Found" if dry_run else "Deleted"
+        self.stdout.write(
+            self.style.SUCCESS(f"{action} {len(orphaned)} orphaned cover files.")
+        )
+
+    def get_referenced_names(self):
+        referenced = set()
+        books = Book.objects.values_list("cover_image", "cover_variants")
+        for cover_image, cover_variants in books.iterator(chunk_size=2000):
+            if cover_image:
+                referenced.add(cover_image)
+            for widths in cover_variants.values():
+                referenced.update(widths.values())
+        return referenced
+
+    def walk(self, storage, directory):
+        if not storage.exists(directory):
+            return
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield os.path.join(directory, name).replace(os.sep, "/")
+        for subdirectory in directories:
+            yield from self.walk(storage, os.path.join(directory, subdirectory))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from books.routers import get_replicas
+
+
+class Command(BaseCommand):
+    """
+    Management command copying the primary SQLite database into its replicas.
+
+    Meant for local setups with several SQLite files, where nothing replicates
+    the primary. Every replica listed in DATABASE_REPLICAS is overwritten with
+    an online backup of the primary, which stays available for reads and
+    writes meanwhile. Run it after migrating and whenever the replicas should
+    catch up.
+    """
+
+    help = "Copies the primary SQLite database into the SQLite replicas."
+
+    def handle(self, *args, **options):
+        replicas = get_replicas()
+        if not replicas:
+            raise CommandError("No replicas configured, set BOOK_STORE_DB_REPLICAS.")
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != "sqlite":
+            raise CommandError("Only SQLite replicas can be synced, replicate other databases.")
+
+        primary.ensure_connection()
+        for alias in replicas:
+            replica = connections[alias]
+            replica.ensure_connection()
+            primary.connection.backup(replica.connection)
+            replica.close()
+            self.stdout.write(f"Copied the primary into {alias} ({replica.settings_dict['NAME']}).")
+        self.stdout.write(self.style.SUCCESS(f"Synced {len(replicas)} replicas."))
@@ -0,0 +1,79 @@
+from django.db import migrations
+
+
+# Frozen copy of the DDL of books.search, so that later changes to the app code do not
+# change what this migration does.
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE books_book_fts USING fts5(
+        title,
+        description,
+        content='books_book',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_book_fts_insert AFTER INSERT ON books_book BEGIN
+        INSERT INTO books_book_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_book_fts_delete AFTER DELETE ON books_book BEGIN
+        INSERT INTO books_book_fts(books_book_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_book_fts_update AFTER UPDATE OF title, description ON books_book BEGIN
+        INSERT INTO books_book_fts(books_book_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO books_book_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    "INSERT INTO books_book_fts(books_book_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS books_book_fts_update",
+    "DROP TRIGGER IF EXISTS books_book_fts_delete",
+    "DROP TRIGGER IF EXISTS books_book_fts_insert",
+    "DROP TABLE IF EXISTS books_book_fts",
+]
+
+POSTGRESQL_CREATE = [
+    """
+    CREATE INDEX books_book_search_idx ON books_book USING gin ((
+        setweight(to_tsvector('simple'::regconfig, COALESCE(("title")::text, '')), 'A')
+        || setweight(to_tsvector('simple'::regconfig, COALESCE(("description")::text, '')), 'B')
+    ))
+    """,
+]
+
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS books_book_search_idx",
+]
+
+
+def run_for_vendor(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_book_title'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({"sqlite": SQLITE_CREATE, "postgresql": POSTGRESQL_CREATE}),
+            run_for_vendor({"sqlite": SQLITE_DROP, "postgresql": POSTGRESQL_DROP}),
+        ),
+    ]
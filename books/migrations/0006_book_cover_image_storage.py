@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-17 22:17
+
+import books.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_book_cover_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='cover_image',
+            field=models.FileField(null=True, storage=books.storage.get_cover_storage, upload_to='cover_images/'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.6 on 2026-10-17 22:48
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_authors(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    CustomUser = apps.get_model(settings.AUTH_USER_MODEL)
+    using = schema_editor.connection.alias
+    authors = CustomUser.objects.using(using).filter(pk=OuterRef("author_id"))
+    Book.objects.using(using).update(
+        author_username=Subquery(authors.values("username")[:1]),
+        author_email=Subquery(authors.values("email")[:1]),
+        author_pseudonym=Subquery(authors.values("author_pseudonym")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_book_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='author_email',
+            field=models.EmailField(blank=True, default='', editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='author_pseudonym',
+            field=models.CharField(default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='author_username',
+            field=models.CharField(default='', editable=False, max_length=150),
+        ),
+        migrations.RunPython(copy_authors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.6 on 2026-10-17 23:30
+
+import books.storage
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_variant_references(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    CoverVariantReference = apps.get_model("books", "CoverVariantReference")
+    using = schema_editor.connection.alias
+    books = Book.objects.using(using).exclude(cover_variants={}).values_list("id", "cover_variants")
+    CoverVariantReference.objects.using(using).bulk_create(
+        (
+            CoverVariantReference(book_id=book_id, name=name)
+            for book_id, variants in books.iterator(chunk_size=2000)
+            for widths in variants.values()
+            for name in widths.values()
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_book_author_snapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='cover_image',
+            field=models.FileField(db_index=True, null=True, storage=books.storage.get_cover_storage, upload_to='cover_images/'),
+        ),
+        migrations.CreateModel(
+            name='CoverVariantReference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=255)),
+                ('book', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='books.book')),
+            ],
+        ),
+        migrations.RunPython(copy_variant_references, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,182 @@
 from django.db import models
 from users.models import CustomUser
+from .storage import get_cover_storage
+
+
+# Columns of a book rendered by BookRowSerializer, including the author snapshot.
+BOOK_ROW_FIELDS = (
+    "id",
+    "title",
+    "description",
+    "cover_image",
+    "cover_variants",
+    "price",
+    "updated_at",
+    "version",
+    "author_id",
+    "author_username",
+    "author_email",
+    "author_pseudonym",
+)
+
+# Snapshot columns of a book, by the field of its author they copy.
+AUTHOR_SNAPSHOT_FIELDS = {
+    "username": "author_username",
+    "email": "author_email",
+    "author_pseudonym": "author_pseudonym",
+}
+
+
+class BookQuerySet(models.QuerySet):
+    """
+    Custom queryset for Book instances.
+
+    Methods:
+    - with_author(self): Restricts the selected columns to those the serializers render.
+    - as_rows(self, fields=BOOK_ROW_FIELDS): Returns the books as dicts for BookRowSerializer.
+    - bulk_create(self, objs, *args, **kwargs): Creates books with their author snapshot.
+    """
+
+    def with_author(self):
+        """
+        Restricts the selected columns to those the serializers render.
+
+        The author is rendered from the snapshot columns of the book, so no
+        join with the users table is needed and the password hash and
+        permission fields of the author are never loaded.
+
+        Returns:
+        - BookQuerySet: The queryset with the restricted columns.
+        """
+
+        return self.only(
+            "title",
+            "description",
+            "author",
+            "cover_image",
+            "cover_variants",
+            "price",
+            "updated_at",
+            "version",
+            *AUTHOR_SNAPSHOT_FIELDS.values(),
+        )
+
+    def as_rows(self, fields=BOOK_ROW_FIELDS):
+        """
+        Returns the books as dicts of the columns BookRowSerializer renders.
+
+        No model instances are created, which makes reading large listings
+        considerably cheaper.
+
+        Args:
+        - fields: The columns to select, all of BOOK_ROW_FIELDS by default.
+
+        Returns:
+        - BookQuerySet: The queryset yielding dicts.
+        """
+
+        return self.values(*fields)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Creates the books like QuerySet.bulk_create() and fills their author snapshot.
+
+        Authors that are not loaded on the books are read in a single query.
+        """
+
+        objs = list(objs)
+        author_ids = {book.author_id for book in objs if not Book.author.is_cached(book)}
+        authors = CustomUser.objects.only(*AUTHOR_SNAPSHOT_FIELDS).in_bulk(author_ids)
+        for book in objs:
+            book.copy_author(authors.get(book.author_id))
+        return super().bulk_create(objs, *args, **kwargs)
 
 
 # Create your models here.
 class Book(models.Model):
     title = models.CharField(max_length=20)
     description = models.CharField(max_length=250)
+    # Indexed by the composite (author, id) index below.
     author = models.ForeignKey(
-        CustomUser, on_delete=models.CASCADE, related_name="books"
+        CustomUser, on_delete=models.CASCADE, related_name="books", db_index=False
     )
-    cover_image = models.FileField(upload_to="cover_images/", null=True)
+    # Indexed for the reference counting of the cover storage.
+    cover_image = models.FileField(
+        upload_to="cover_images/", null=True, storage=get_cover_storage, db_index=True
+    )
+    cover_variants = models.JSONField(default=dict, blank=True)
     price = models.DecimalField(max_digits=6, decimal_places=2)
+    # Snapshot of the author fields embedded in book responses, so reads need
+    # no join. Kept in sync by Book.save() and books.signals.author_post_save.
+    author_username = models.CharField(max_length=150, default="", editable=False)
+    author_email = models.EmailField(blank=True, default="", editable=False)
+    author_pseudonym = models.CharField(max_length=50, default="", editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Per-author listings, ordered by ID for cursor pagination. Also
+            # serves every other lookup by author, including the foreign key.
+            models.Index(fields=["author", "id"], name="books_author_id_idx"),
+            # Price ordered listings, with the ID as tie breaker.
+            models.Index(fields=["price", "id"], name="books_price_id_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the book and increments its version if it already exists.
+
+        The version and the updated_at timestamp identify a state of the book and
+        are used for the ETag and Last-Modified headers of book responses.
+        The author snapshot is copied from the author when the book is created
+        and whenever the author is loaded, e.g. after being reassigned.
+        """
+
+        author_loaded = Book.author.is_cached(self)
+        if self._state.adding or author_loaded:
+            self.copy_author()
+        if not self._state.adding:
+            self.version += 1
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                snapshot_fields = AUTHOR_SNAPSHOT_FIELDS.values() if author_loaded else ()
+                kwargs["update_fields"] = {
+                    *update_fields,
+                    *snapshot_fields,
+                    "version",
+                    "updated_at",
+                }
+        super().save(*args, **kwargs)
+
+    def copy_author(self, author=None):
+        """
+        Copies the fields of the author embedded in book responses into the snapshot.
+
+        Args:
+        - author: The author, defaults to the author of the book.
+        """
+
+        author = author or self.author
+        for field, snapshot_field in AUTHOR_SNAPSHOT_FIELDS.items():
+            setattr(self, snapshot_field, getattr(author, field))
+
+
+class CoverVariantReference(models.Model):
+    """
+    A cover variant file used by a book, one row per book and file.
+
+    Mirrors the file names in Book.cover_variants, so the cover storage counts
+    the books using a variant with an index lookup instead of searching the
+    JSON of every book. The rows are replaced together with the variants, in
+    the same transaction, by books.cleanup.set_variant_references(). They are
+    removed by books.signals.book_post_delete, so deleting books without
+    variants costs no extra query.
+    """
+
+    book = models.ForeignKey(
+        Book, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    name = models.CharField(max_length=255, db_index=True)
@@ -0,0 +1,174 @@
+import binascii
+import contextlib
+from base64 import b64decode, b64encode
+from urllib import parse
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class BookCursorPagination(CursorPagination):
+    """
+    Keyset pagination for book listings.
+
+    Pages are addressed with an opaque cursor that encodes the last seen book ID,
+    so fetching a page is a `WHERE id > ? ORDER BY id LIMIT ?` query and stays
+    equally fast however deep a client pages. The page size defaults to
+    `page_size` and can be changed per request with the `page_size` query
+    parameter, up to `max_page_size`.
+
+    Books are ordered by ID unless the client picks one of `ordering_choices`
+    with the `ordering` query parameter. Every choice ends with the ID as tie
+    breaker and is backed by an index, so no page needs a sort.
+
+    Attributes:
+    - ordering: The default ordering, based on the unique ID.
+    - ordering_param: Query parameter a client can use to choose the ordering.
+    - ordering_choices: The orderings a client can choose from, by query value.
+    - page_size: Number of books returned per page by default.
+    - page_size_query_param: Query parameter a client can use to set the page size.
+    - max_page_size: Upper bound for the page size requested by a client.
+    """
+
+    ordering = ("id",)
+    ordering_param = "ordering"
+    ordering_choices = {
+        "id": ("id",),
+        "price": ("price", "id"),
+        "-price": ("-price", "-id"),
+    }
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Returns the ordering chosen with the 'ordering' query parameter.
+
+        Unknown values fall back to the default ordering.
+
+        Args:
+        - request: The HTTP request object.
+        - queryset: The queryset being paginated.
+        - view: The view paginating the queryset.
+
+        Returns:
+        - tuple: The fields the books are ordered by.
+        """
+
+        choice = request.query_params.get(self.ordering_param)
+        return self.ordering_choices.get(choice, self.ordering)
+
+
+class SearchCursorPagination(BasePagination):
+    """
+    Keyset pagination for ranked search results.
+
+    Search results are ordered by relevance, so the cursor encodes the relevance
+    score and ID of the last (or, for the previous page, first) book of a page.
+    The search backend continues right after that position, which keeps deep
+    pages as cheap as the first one and the cursor opaque to clients.
+
+    Attributes:
+    - cursor_query_param: Query parameter carrying the encoded cursor.
+    - page_size: Number of books returned per page by default.
+    - page_size_query_param: Query parameter a client can use to set the page size.
+    - max_page_size: Upper bound for the page size requested by a client.
+    """
+
+    cursor_query_param = "cursor"
+    page_size = BookCursorPagination.page_size
+    page_size_query_param = BookCursorPagination.page_size_query_param
+    max_page_size = BookCursorPagination.max_page_size
+    invalid_cursor_message = _("Invalid cursor")
+
+    def paginate_search(self, search_backend, search_query, queryset, request):
+        """
+        Returns the page of books selected by the cursor of the request.
+
+        Args:
+        - search_backend: The backend running the ranked search.
+        - search_query: The raw value of the 'search' query parameter.
+        - queryset: The queryset the matching books are loaded from, yielding
+          Book instances or, e.g. from as_rows(), dicts with an 'id'.
+        - request: The HTTP request object.
+
+        Returns:
+        - list: The books of the page, most relevant first.
+        """
+
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        reverse, position = self.cursor if self.cursor else (False, None)
+
+        ranked = search_backend.ranked_ids(
+            search_query, self.page_size + 1, after=position, reverse=reverse
+        )
+        has_following = len(ranked) > self.page_size
+        ranked = ranked[: self.page_size]
+        if reverse:
+            ranked.reverse()
+            self.has_next = True
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+
+        self.positions = ranked
+        books = queryset.filter(pk__in=[book_id for book_id, score in ranked])
+        books = {book["id"] if isinstance(book, dict) else book.pk: book for book in books}
+        return [books[book_id] for book_id, score in ranked if book_id in books]
+
+    def get_page_size(self, request):
+        with contextlib.suppress(KeyError, ValueError):
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode("ascii")).decode("ascii")
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get("r", ["0"])[0]))
+            position = (float(tokens["s"][0]), int(tokens["i"][0]))
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        return reverse, position
+
+    def encode_cursor(self, reverse, book_id, score):
+        tokens = {"s": repr(float(score)), "i": str(book_id)}
+        if reverse:
+            tokens["r"] = "1"
+        querystring = parse.urlencode(tokens)
+        encoded = b64encode(querystring.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.positions:
+            return None
+        return self.encode_cursor(False, *self.positions[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.positions:
+            return None
+        return self.encode_cursor(True, *self.positions[0])
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
@@ -0,0 +1,142 @@
+import re
+from xml.sax.saxutils import escape
+from django.utils.encoding import force_str
+from django.utils.xmlutils import UnserializableContentError
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework_xml.renderers import XMLRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+CONTROL_CHARACTERS = re.compile(r"[\x00-\x08\x0B-\x0C\x0E-\x1F]")
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Renderer which serializes a list to newline delimited JSON.
+
+    Every item of the list is written as a compact JSON document on its own line.
+    Used for content negotiation of the catalogue export, which streams the same
+    format with books.export.iter_ndjson.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if not isinstance(data, (list, tuple)):
+            data = [data]
+        return b"".join(dump_ndjson_line(item) for item in data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in replacement of JSONRenderer encoding with orjson.
+
+    The output is identical to that of JSONRenderer with the default settings:
+    compact, UTF-8 encoded and with U+2028 and U+2029 escaped. Types orjson does
+    not encode like DRF, e.g. decimals, dates and lazy strings, are passed to
+    DRF's JSONEncoder. Indented output, ASCII-only or non-compact settings and
+    data orjson rejects, like integers beyond 64 bits, fall back to
+    JSONRenderer, which is also used when orjson is not installed.
+
+    Floats are the exception: orjson writes exponents without a sign or
+    leading zero (1e16 and 1.5e-7 instead of 1e+16 and 1.5e-07), and NaN and
+    infinity as null where JSONRenderer raises a ValueError. Book responses
+    contain no floats, prices are decimals rendered as strings.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if (
+            orjson is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_NON_STR_KEYS
+                | orjson.OPT_PASSTHROUGH_DATETIME
+                | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class StreamingXMLRenderer(XMLRenderer):
+    """
+    Drop-in replacement of XMLRenderer writing the document incrementally.
+
+    Elements are written as strings while the data is walked, instead of
+    through the SAX events of SimplerXMLGenerator, and a list is produced one
+    'list-item' element at a time, so the catalogue export can stream it. The
+    output is identical to that of XMLRenderer, including the error raised for
+    control characters.
+
+    Methods:
+    - render(self, data, accepted_media_type=None, renderer_context=None): Renders the whole document.
+    - iter_render(self, data): Yields the document in chunks.
+    - iter_list(self, items): Yields the document of a list in chunks, one per item.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return ""
+        return "".join(self.iter_render(data))
+
+    def iter_render(self, data):
+        if isinstance(data, (list, tuple)):
+            yield from self.iter_list(data)
+            return
+        parts = [self.get_document_start()]
+        self.write(parts.append, data)
+        parts.append(f"</{self.root_tag_name}>")
+        yield "".join(parts)
+
+    def iter_list(self, items):
+        yield self.get_document_start()
+        for item in items:
+            parts = []
+            self.write(parts.append, [item])
+            yield "".join(parts)
+        yield f"</{self.root_tag_name}>"
+
+    def get_document_start(self):
+        return f'<?xml version="1.0" encoding="{self.charset}"?>\n<{self.root_tag_name}>'
+
+    def write(self, write, data):
+        if isinstance(data, (list, tuple)):
+            start, end = f"<{self.item_tag_name}>", f"</{self.item_tag_name}>"
+            for item in data:
+                write(start)
+                self.write(write, item)
+                write(end)
+        elif isinstance(data, dict):
+            for key, value in data.items():
+                write("<" + key + ">")
+                self.write(write, value)
+                write("</" + key + ">")
+        elif data is not None:
+            content = data if isinstance(data, str) else force_str(data)
+            if content:
+                if CONTROL_CHARACTERS.search(content):
+                    raise UnserializableContentError(
+                        "Control characters are not supported in XML 1.0"
+                    )
+                write(escape(content))
+
+
+def dump_ndjson_line(item):
+    return FastJSONRenderer().render(item) + b"\n"
@@ -0,0 +1,142 @@
+import random
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import Resolver404, resolve
+from rest_framework.permissions import SAFE_METHODS
+
+
+# Cookie sent after a successful write, pinning the client's reads to the primary.
+PRIMARY_COOKIE_NAME = "book_store_primary"
+
+# Upper bound in seconds for the replication lag, if not set in REPLICA_MAX_LAG.
+DEFAULT_REPLICA_MAX_LAG = 5
+
+read_from_replica = ContextVar("read_from_replica", default=False)
+
+
+def get_replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def get_replica_max_lag():
+    return getattr(settings, "REPLICA_MAX_LAG", DEFAULT_REPLICA_MAX_LAG)
+
+
+def choose_replica():
+    return random.choice(get_replicas())
+
+
+def reads_from_replica():
+    """
+    Returns whether queries of the current request are routed to a replica.
+
+    Returns:
+    - bool: Whether reads go to a replica.
+    """
+
+    return read_from_replica.get() and bool(get_replicas())
+
+
+class ReplicaRouter:
+    """
+    Database router sending reads of eligible requests to a replica.
+
+    The aliases listed in the DATABASE_REPLICAS setting hold copies of the
+    primary database. Reads go to a randomly chosen replica while
+    ReplicaRoutingMiddleware marks the current request as eligible, and to the
+    primary otherwise. Writes always go to the primary, also for instances
+    read from a replica, and migrations only run on the primary.
+
+    Methods:
+    - db_for_read(self, model, **hints): Returns a replica for eligible reads.
+    - db_for_write(self, model, **hints): Returns the primary.
+    - allow_relation(self, obj1, obj2, **hints): Allows relations across all aliases.
+    - allow_migrate(self, db, app_label, model_name=None, **hints): Forbids migrating replicas.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reads_from_replica():
+            return choose_replica()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Middleware choosing the database of the queries of a request.
+
+    Safe requests to views with 'replica_reads = True' read from a replica if
+    they are anonymous, i.e. carry no Authorization header, and the client
+    has not written recently. Every successful unsafe request sets a cookie
+    for REPLICA_MAX_LAG seconds, during which the client reads from the
+    primary, so authors see their own changes before the replicas catch up.
+    Authenticated requests always read from the primary.
+
+    Methods:
+    - can_read_from_replica(self, request): Whether the request may read from a replica.
+    - process_response(self, request, response): Sets the cookie after writes.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = read_from_replica.set(self.can_read_from_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_from_replica.reset(token)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        token = read_from_replica.set(self.can_read_from_replica(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_from_replica.reset(token)
+        return self.process_response(request, response)
+
+    def can_read_from_replica(self, request):
+        if (
+            not get_replicas()
+            or request.method not in SAFE_METHODS
+            or "HTTP_AUTHORIZATION" in request.META
+            or PRIMARY_COOKIE_NAME in request.COOKIES
+        ):
+            return False
+        try:
+            view = resolve(request.path_info).func
+        except Resolver404:
+            return False
+        return getattr(getattr(view, "view_class", None), "replica_reads", False)
+
+    def process_response(self, request, response):
+        if get_replicas() and request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PRIMARY_COOKIE_NAME,
+                "1",
+                max_age=get_replica_max_lag(),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -0,0 +1,251 @@
+import re
+from abc import ABC, abstractmethod
+from django.db import connections
+from django.db.models import Q
+from .models import Book
+
+
+SEARCH_TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Weight of a match in the title relative to a match in the description.
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def get_search_terms(search_query):
+    """
+    Splits a search query into the terms the full-text index understands.
+
+    Only word characters are kept, which also makes it impossible to inject
+    operators of the underlying query language.
+
+    Args:
+    - search_query: The raw value of the 'search' query parameter.
+
+    Returns:
+    - list: The lower-cased search terms.
+    """
+
+    return [term.lower() for term in SEARCH_TERM_PATTERN.findall(search_query)]
+
+
+class BaseSearchBackend(ABC):
+    """
+    Base class for the book search backends.
+
+    A backend returns the IDs of the books matching a search query together with
+    a relevance score, most relevant first. Lower scores are more relevant, and
+    ties are broken by the book ID, so (score, id) is a unique, stable sort key
+    that SearchCursorPagination can use as a keyset.
+
+    Methods:
+    - ranked_ids(self, search_query, limit, after=None, reverse=False):
+      Returns up to 'limit' (id, score) tuples after the given keyset position.
+    """
+
+    def __init__(self, using="default"):
+        self.using = using
+
+    @abstractmethod
+    def ranked_ids(self, search_query, limit, after=None, reverse=False):
+        pass
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """
+    Search backend using the SQLite FTS5 index 'books_book_fts'.
+
+    The index is an external content table over books_book, kept in sync by the
+    triggers in SQLITE_TRIGGERS. Every search term is matched as a prefix, and
+    results are ranked with BM25, weighting title matches over description
+    matches. Queries without word characters cannot be matched by the index and
+    are answered by LikeSearchBackend.
+    """
+
+    def get_match_expression(self, terms):
+        return " ".join(f'"{term}"*' for term in terms)
+
+    def ranked_ids(self, search_query, limit, after=None, reverse=False):
+        terms = get_search_terms(search_query)
+        if not terms:
+            return LikeSearchBackend(self.using).ranked_ids(search_query, limit, after, reverse)
+
+        score = f"bm25(books_book_fts, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT})"
+        sql = f"SELECT rowid, {score} AS score FROM books_book_fts WHERE books_book_fts MATCH %s"
+        params = [self.get_match_expression(terms)]
+        if after is not None:
+            compare = "<" if reverse else ">"
+            sql += f" AND ({score} {compare} %s OR ({score} = %s AND rowid {compare} %s))"
+            params += [after[0], after[0], after[1]]
+        direction = "DESC" if reverse else "ASC"
+        sql += f" ORDER BY score {direction}, rowid {direction} LIMIT %s"
+        params.append(limit)
+
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class PostgreSQLSearchBackend(BaseSearchBackend):
+    """
+    Search backend using PostgreSQL full-text search.
+
+    The weighted tsvector built here matches the expression of the GIN index
+    'books_book_search_idx' created in migration 0003, so the '@@' filter is
+    answered from the index. Every search term is matched as a prefix, and
+    results are ranked with ts_rank, negated so that lower scores are more
+    relevant as for the other backends. Queries without word characters are
+    answered by LikeSearchBackend.
+    """
+
+    def ranked_ids(self, search_query, limit, after=None, reverse=False):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        terms = get_search_terms(search_query)
+        if not terms:
+            return LikeSearchBackend(self.using).ranked_ids(search_query, limit, after, reverse)
+
+        vector = SearchVector("title", weight="A", config="simple") + SearchVector(
+            "description", weight="B", config="simple"
+        )
+        query = SearchQuery(
+            " & ".join(f"{term}:*" for term in terms),
+            search_type="raw",
+            config="simple",
+        )
+        books = (
+            Book.objects.using(self.using)
+            .annotate(search=vector, score=-SearchRank(vector, query))
+            .filter(search=query)
+        )
+        if after is not None:
+            if reverse:
+                books = books.filter(
+                    Q(score__lt=after[0]) | Q(score=after[0], id__lt=after[1])
+                )
+            else:
+                books = books.filter(
+                    Q(score__gt=after[0]) | Q(score=after[0], id__gt=after[1])
+                )
+        if reverse:
+            books = books.order_by("-score", "-id")
+        else:
+            books = books.order_by("score", "id")
+        return list(books.values_list("id", "score")[:limit])
+
+
+class LikeSearchBackend(BaseSearchBackend):
+    """
+    Fallback search backend for databases without a full-text index.
+
+    Filters with case-insensitive substring matches on every term and does not
+    rank results: every match has the score 0, so results are ordered by ID.
+    A query without word characters, like '--', is matched as a whole.
+    """
+
+    def ranked_ids(self, search_query, limit, after=None, reverse=False):
+        terms = get_search_terms(search_query) or [search_query.strip()]
+        if not terms[0]:
+            return []
+
+        books = Book.objects.using(self.using)
+        for term in terms:
+            books = books.filter(
+                Q(title__icontains=term) | Q(description__icontains=term)
+            )
+        if after is not None:
+            if reverse:
+                books = books.filter(id__lt=after[1])
+            else:
+                books = books.filter(id__gt=after[1])
+        books = books.order_by("-id" if reverse else "id")
+        return [(book_id, 0.0) for book_id in books.values_list("id", flat=True)[:limit]]
+
+
+# The triggers keeping the FTS5 index in sync with books_book. Migration 0003
+# creates a frozen copy of them, and ensure_search_index() restores them after table rebuilds.
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS books_book_fts_insert AFTER INSERT ON books_book BEGIN
+        INSERT INTO books_book_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_book_fts_delete AFTER DELETE ON books_book BEGIN
+        INSERT INTO books_book_fts(books_book_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_book_fts_update AFTER UPDATE OF title, description ON books_book BEGIN
+        INSERT INTO books_book_fts(books_book_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO books_book_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+SQLITE_TRIGGER_NAMES = {
+    "books_book_fts_insert",
+    "books_book_fts_delete",
+    "books_book_fts_update",
+}
+
+
+def ensure_search_index(sender, using="default", **kwargs):
+    """
+    Signal handler for post_migrate restoring the SQLite search index triggers.
+
+    SQLite cannot alter most columns in place, so Django rebuilds books_book for
+    many schema changes and the triggers created in migration 0003 are dropped
+    together with the old table. This handler recreates missing triggers and
+    rebuilds the index from books_book in that case.
+
+    Args:
+    - sender: The app config that was migrated.
+    - using: The alias of the migrated database.
+    - **kwargs: Additional keyword arguments.
+    """
+
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name FROM sqlite_master "
+            "WHERE name = 'books_book_fts' OR (type = 'trigger' AND tbl_name = 'books_book')"
+        )
+        existing = cursor.fetchall()
+        if ("table", "books_book_fts") not in existing:
+            return
+        triggers = {name for kind, name in existing if kind == "trigger"}
+        if SQLITE_TRIGGER_NAMES <= triggers:
+            return
+
+        for statement in SQLITE_TRIGGERS:
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO books_book_fts(books_book_fts) VALUES ('rebuild')")
+
+
+SEARCH_BACKENDS = {
+    "sqlite": SQLiteSearchBackend,
+    "postgresql": PostgreSQLSearchBackend,
+}
+
+
+def get_search_backend(using="default"):
+    """
+    Returns the search backend for the vendor of the given database alias.
+
+    Args:
+    - using: The database alias the search should run on.
+
+    Returns:
+    - BaseSearchBackend: The full-text backend of the database, or LikeSearchBackend.
+    """
+
+    backend_class = SEARCH_BACKENDS.get(connections[using].vendor, LikeSearchBackend)
+    return backend_class(using)
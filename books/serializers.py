@@ -1,12 +1,243 @@
-from rest_framework import serializers
-from .models import Book
-from users.serializers import CustomUserSerializer
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from book_store.metrics import TimedSerializerMixin, timer
+from .models import AUTHOR_SNAPSHOT_FIELDS, Book
+from .cleanup import (
+    get_cover_storage,
+    get_file_names,
+    schedule_file_deletion,
+    set_variant_references,
+)
+from .covers import schedule_cover_processing
 
 
-class BookSerializer(serializers.ModelSerializer):
-    author = CustomUserSerializer(read_only=True)
+class BookSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    BookSerializer class for serializing and deserializing Book instances.
+
+    The author is set by the views and embedded from the author snapshot of the
+    book, with the fields of CustomUserSerializer, so no user is loaded. The
+    resized variants of the cover are generated in the background after an upload
+    and exposed as URLs by format and width, e.g. {"webp": {"160": "..."}}.
+    A BookFieldset passed as 'fieldset' restricts the rendered fields; an author
+    that is not expanded is rendered as its ID.
+
+    Methods:
+    - get_author: Returns the author from the author snapshot.
+    - get_cover_variants: Returns the URLs of the cover variants.
+    - create: Creates a Book instance and schedules the processing of its cover.
+    - update: Updates a Book instance, schedules the processing of a new cover and
+      the deletion of the replaced one.
+    """
+
+    author = serializers.SerializerMethodField()
+    cover_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Book
-        fields = "__all__"
-        read_only_fields = ("author",)
+        exclude = tuple(AUTHOR_SNAPSHOT_FIELDS.values())
+        read_only_fields = ("author", "version")
+
+    def __init__(self, *args, fieldset=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fieldset is None or fieldset.is_complete():
+            return
+        for name in set(self.fields) - set(fieldset.fields):
+            self.fields.pop(name)
+        if "author" in self.fields and "author" not in fieldset.expand:
+            self.fields["author"] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    def get_author(self, book):
+        return {
+            "id": book.author_id,
+            "username": book.author_username,
+            "email": book.author_email,
+            "author_pseudonym": book.author_pseudonym,
+        }
+
+    def get_cover_variants(self, book):
+        return get_cover_variant_urls(book.cover_variants)
+
+    def create(self, validated_data):
+        book = super().create(validated_data)
+        schedule_cover_processing(book)
+        return book
+
+    def update(self, instance, validated_data):
+        if "cover_image" not in validated_data:
+            return super().update(instance, validated_data)
+
+        replaced_files = get_file_names(instance)
+        if instance.cover_variants:
+            set_variant_references(instance.pk, {})
+        instance.cover_variants = {}
+        book = super().update(instance, validated_data)
+        schedule_file_deletion(replaced_files)
+        schedule_cover_processing(book)
+        return book
+
+
+class BookRowSerializer:
+    """
+    Read-only serializer rendering book rows for listings.
+
+    Takes the dicts of BookQuerySet.as_rows() instead of Book instances and
+    builds the representation directly, without DRF's field by field
+    serialization. The output is identical to that of BookSerializer. Prices
+    and timestamps are formatted like DRF's DecimalField and DateTimeField
+    with the default settings, the current time zone being looked up once per
+    serializer instead of once per book. With other settings the DRF fields
+    format them. A BookFieldset passed as 'fieldset' restricts the rendered
+    fields like for BookSerializer, the rows then only need the columns of
+    BookFieldset.get_row_fields().
+
+    Attributes:
+    - data: The representation of the row, or of every row if many is set.
+
+    Methods:
+    - to_representation(self, row): Returns the representation of a single row.
+    - get_value(self, name, row): Returns the representation of a single field.
+    """
+
+    price_field = serializers.DecimalField(max_digits=6, decimal_places=2)
+    updated_at_field = serializers.DateTimeField()
+
+    def __init__(self, instance=None, many=False, fieldset=None):
+        self.instance = instance
+        self.many = many
+        self.fieldset = None if fieldset is None or fieldset.is_complete() else fieldset
+        self.timezone = self.updated_at_field.default_timezone()
+        self.fast_formats = (
+            api_settings.COERCE_DECIMAL_TO_STRING
+            and api_settings.DATETIME_FORMAT.lower() == ISO_8601
+            and self.timezone is not None
+        )
+
+    @property
+    def data(self):
+        with timer("serialize"):
+            if self.many:
+                return [self.to_representation(row) for row in self.instance]
+            return self.to_representation(self.instance)
+
+    def to_representation(self, row):
+        if self.fieldset is not None:
+            return {name: self.get_value(name, row) for name in self.fieldset.fields}
+        cover_image = row["cover_image"]
+        return {
+            "id": row["id"],
+            "author": self.get_author(row),
+            "cover_variants": get_cover_variant_urls(row["cover_variants"]),
+            "title": row["title"],
+            "description": row["description"],
+            "cover_image": get_cover_storage().url(cover_image) if cover_image else None,
+            "price": self.format_price(row["price"]),
+            "updated_at": self.format_updated_at(row["updated_at"]),
+            "version": row["version"],
+        }
+
+    def get_value(self, name, row):
+        if name == "author":
+            if "author" not in self.fieldset.expand:
+                return row["author_id"]
+            return self.get_author(row)
+        if name == "cover_variants":
+            return get_cover_variant_urls(row["cover_variants"])
+        if name == "cover_image":
+            return get_cover_storage().url(row["cover_image"]) if row["cover_image"] else None
+        if name == "price":
+            return self.format_price(row["price"])
+        if name == "updated_at":
+            return self.format_updated_at(row["updated_at"])
+        return row[name]
+
+    def get_author(self, row):
+        return {
+            "id": row["author_id"],
+            "username": row["author_username"],
+            "email": row["author_email"],
+            "author_pseudonym": row["author_pseudonym"],
+        }
+
+    def format_price(self, price):
+        if not self.fast_formats:
+            return self.price_field.to_representation(price)
+        # Prices are read quantized to their decimal places, like DecimalField does.
+        return f"{price:f}"
+
+    def format_updated_at(self, updated_at):
+        if not self.fast_formats:
+            return self.updated_at_field.to_representation(updated_at)
+        updated_at = updated_at.astimezone(self.timezone).isoformat()
+        if updated_at.endswith("+00:00"):
+            updated_at = updated_at[:-6] + "Z"
+        return updated_at
+
+
+def get_cover_variant_urls(cover_variants):
+    """
+    Returns the URLs of cover variants, by format and width.
+
+    Args:
+    - cover_variants: The storage names of the variants, by format and width.
+
+    Returns:
+    - dict: The URLs of the variants.
+    """
+
+    storage = get_cover_storage()
+    return {
+        image_format: {width: storage.url(name) for width, name in widths.items()}
+        for image_format, widths in cover_variants.items()
+    }
+
+
+class BookBulkSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    BookBulkSerializer class for validating the envelope of a bulk request.
+
+    The books to create and the changes to apply are validated item by item with
+    BookSerializer afterwards, this serializer only checks the structure of the
+    request and the number of operations.
+
+    Attributes:
+    - create: List of books to create.
+    - update: List of partial updates, each with the 'id' of the book to update.
+    - delete: List of IDs of the books to delete.
+    """
+
+    max_operations = 1000
+
+    create = serializers.ListField(child=serializers.DictField(), required=False)
+    update = serializers.ListField(child=serializers.DictField(), required=False)
+    delete = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False
+    )
+
+    def validate_update(self, value):
+        ids = [item.get("id") for item in value]
+        if not all(isinstance(book_id, int) for book_id in ids):
+            raise serializers.ValidationError("Every update needs the integer 'id' of a book.")
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError("A book can only be updated once per request.")
+        return value
+
+    def validate_delete(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError("A book can only be deleted once per request.")
+        return value
+
+    def validate(self, data):
+        operations = sum(len(data.get(key, [])) for key in ("create", "update", "delete"))
+        if not operations:
+            raise serializers.ValidationError("At least one operation is required.")
+        if operations > self.max_operations:
+            raise serializers.ValidationError(
+                f"At most {self.max_operations} operations are allowed per request."
+            )
+        updated_ids = {item["id"] for item in data.get("update", [])}
+        if updated_ids & set(data.get("delete", [])):
+            raise serializers.ValidationError(
+                "A book cannot be updated and deleted in the same request."
+            )
+        return data
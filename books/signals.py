@@ -1,7 +1,11 @@
-from django.db.models.signals import post_delete
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
 from django.dispatch import receiver
-from .models import Book
-import os
+from users.models import CustomUser
+from .cache import invalidate_books
+from .cleanup import get_file_names, schedule_file_deletion, set_variant_references
+from .models import AUTHOR_SNAPSHOT_FIELDS, Book
 
 
 @receiver(post_delete, sender=Book)
@@ -9,9 +13,10 @@ def book_post_delete(sender, instance, **kwargs):
     """
     Signal handler for deleting a Book instance.
 
-    This function is called after a Book instance is deleted. It checks if the
-    instance has a cover image associated with it and deletes the image file from
-    the filesystem if it exists.
+    This function is called after a Book instance is deleted. It removes the
+    references to its cover variants and schedules the cover image and its
+    variants for deletion once the transaction commits. The files are deleted
+    in the background, and only if no other book uses them.
 
     Args:
     - sender: The model class that sent the signal (Book in this case).
@@ -19,5 +24,56 @@ def book_post_delete(sender, instance, **kwargs):
     - **kwargs: Additional keyword arguments.
     """
 
-    if instance.cover_image:
-        os.remove(instance.cover_image.path)
+    if instance.cover_variants:
+        set_variant_references(instance.pk, {})
+    schedule_file_deletion(get_file_names(instance))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_invalidate_cache(sender, instance, **kwargs):
+    """
+    Signal handler invalidating cached responses after a Book is written.
+
+    This function is called after a Book instance is created, updated or deleted.
+    It invalidates the cached book lists and the cached details of the book.
+
+    Args:
+    - sender: The model class that sent the signal (Book in this case).
+    - instance: The Book instance that was written.
+    - **kwargs: Additional keyword arguments.
+    """
+
+    invalidate_books([instance.pk])
+
+
+@receiver(post_save, sender=CustomUser)
+def author_post_save(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Signal handler for changes to the author of books.
+
+    This function is called after a CustomUser instance is saved. Book responses
+    embed the author from the author snapshot of the books, so if a field shown
+    there may have changed, the snapshot of the author's books is rewritten and
+    their version incremented, which changes their ETag, in a single UPDATE
+    query. The cached book lists and, through the authors generation, the
+    cached book details are invalidated.
+
+    Args:
+    - sender: The model class that sent the signal (CustomUser in this case).
+    - instance: The CustomUser instance that was saved.
+    - created: Whether the user was newly created.
+    - update_fields: The fields passed to save(), if any.
+    - **kwargs: Additional keyword arguments.
+    """
+
+    if created or (
+        update_fields is not None and not AUTHOR_SNAPSHOT_FIELDS.keys() & set(update_fields)
+    ):
+        return
+    snapshot = {
+        snapshot_field: getattr(instance, field)
+        for field, snapshot_field in AUTHOR_SNAPSHOT_FIELDS.items()
+    }
+    if instance.books.update(**snapshot, version=F("version") + 1, updated_at=timezone.now()):
+        invalidate_books(author_ids=[instance.pk])
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import time
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+
+
+class CoverImageStorage(FileSystemStorage):
+    """
+    Content-addressed, deduplicating file storage for cover images.
+
+    Every file is stored under the SHA-256 hash of its content, e.g.
+    'cover_images/3f/3fa1...e9.webp', in the directory of the requested name.
+    Saving content that is already stored returns the existing name without
+    writing anything, so books with identical covers share one file.
+
+    Files are reference counted by the books using them as cover or cover
+    variant, and delete() only unlinks a file once no book references it. A
+    file is saved before the book referencing it is committed, so saving also
+    updates the modification time of a reused file, and delete() can keep
+    recently saved files that may belong to a transaction still in progress.
+
+    Methods:
+    - save(self, name, content, max_length=None): Stores content under its hash.
+    - get_available_name(self, name, max_length=None): Refuses to rename a stored file.
+    - get_reference_count(self, name): Returns the number of books using a file.
+    - delete(self, name, min_age=0): Deletes a file unless a book still references it.
+    """
+
+    def get_content_name(self, name, content):
+        """
+        Returns the content-addressed name of a file.
+
+        Args:
+        - name: The requested name, its directory and extension are kept.
+        - content: The file content.
+
+        Returns:
+        - str: The storage name derived from the content hash.
+        """
+
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension).replace(os.sep, "/")
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        validate_file_name(name, allow_relative_path=True)
+
+        name = self.get_content_name(name, content)
+        try:
+            # Marks a stored file as recently used, see delete().
+            os.utime(self.path(name))
+            return name
+        except FileNotFoundError:
+            pass
+        try:
+            name = self._save(name, content)
+        except FileExistsError:
+            # Stored by a concurrent save of the same content.
+            return name
+        validate_file_name(name, allow_relative_path=True)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # A file stored under a content-addressed name already has the content.
+        raise FileExistsError(f"{name} is already stored.")
+
+    def get_reference_count(self, name):
+        Book = apps.get_model("books", "Book")
+        CoverVariantReference = apps.get_model("books", "CoverVariantReference")
+        return (
+            Book.objects.filter(cover_image=name).count()
+            + CoverVariantReference.objects.filter(name=name).count()
+        )
+
+    def delete(self, name, min_age=0):
+        """
+        Deletes a file unless a book references it or it was saved recently.
+
+        The modification time is checked after the references were counted, so
+        a file reused by a save that has not committed its book yet is kept.
+        Kept files that turn out to be orphaned are removed by the
+        prune_cover_images command.
+
+        Args:
+        - name: The storage name of the file.
+        - min_age: Files saved less than this many seconds ago are kept.
+        """
+
+        if self.get_reference_count(name):
+            return
+        if min_age:
+            try:
+                if os.path.getmtime(self.path(name)) > time.time() - min_age:
+                    return
+            except FileNotFoundError:
+                return
+        super().delete(name)
+
+
+cover_storage = CoverImageStorage()
+
+
+def get_cover_storage():
+    return cover_storage
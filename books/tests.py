@@ -1,13 +1,51 @@
-from rest_framework.test import APITestCase
-from django.urls import reverse
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
+import tempfile
+from asgiref.sync import sync_to_async
+from io import BytesIO, StringIO
+from urllib.parse import parse_qs, urlsplit
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.test import AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.xmlutils import UnserializableContentError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_xml.renderers import XMLRenderer
+from django.conf import settings
+from django.db import connection, transaction
+from django.urls import resolve, reverse
 from users.models import CustomUser
-from .models import Book
+from .async_views import AsyncBookDetailView, AsyncBookListView, AsyncManageUserBooksView
+from .models import Book, CoverVariantReference
+from .routers import PRIMARY_COOKIE_NAME, ReplicaRouter
+from .renderers import FastJSONRenderer, StreamingXMLRenderer
+from .serializers import BookRowSerializer, BookSerializer
+from .search import ensure_search_index
+from .benchmark import compare_results, parse_volume, run_in_process, seed
+from .cleanup import cleanup_queue
+from .cache import CachedHttpResponse, get_response_cache
+from .conditional import aget_book_state, get_book_state
+from .catalogue import clear_catalogue, load_catalogue, verify_catalogue
 from rest_framework_simplejwt.tokens import RefreshToken
+from users.tokens import CustomRefreshToken
+from book_store import metrics, throttling
+from book_store.testing import APITestCase, TransactionTestCase
 
 
 class BookTests(APITestCase):
 
     def setUp(self):
+        get_response_cache().clear()
+
         self.user = CustomUser.objects.create(
             username="testuser1",
             email="testuser1@example.com",
@@ -60,13 +98,13 @@ class BookTests(APITestCase):
     def test_get_unfiltert_books_list_view(self):
         response = self.client.get(reverse("books_list"))
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 3)
+        self.assertEqual(len(response.data["results"]), 3)
 
     def test_get_filterd_books_list_view(self):
         response = self.client.get(reverse("books_list"), {"search": "Book One"})
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["title"], "Book One")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["title"], "Book One")
 
     def test_get_detail_book_view(self):
         response = self.client.get(reverse("books_details", args=[1]))
@@ -84,7 +122,7 @@ class BookTests(APITestCase):
         )
         response = self.client.get(reverse("auth_books"))
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data["results"]), 2)
 
     def test_get_all_books_of_user_wrong_token(self):
         self.client.credentials(HTTP_AUTHORIZATION="Bearer " + "WrongToken123")
@@ -187,3 +225,1532 @@ class BookTests(APITestCase):
         )
         self.assertEqual(response.status_code, 404)
         self.assertEqual(response.data["detail"], "No Book matches the given query.")
+
+    def test_books_list_query_count_does_not_grow_with_rows(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("books_list"))
+        self.assertEqual(len(response.data["results"]), 3)
+
+        for index in range(10):
+            Book.objects.create(
+                title=f"Extra Book {index}",
+                description="Extra description",
+                author=self.user2,
+                price="5.00",
+            )
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("books_list"))
+        self.assertEqual(len(response.data["results"]), 13)
+        self.assertEqual(response.data["results"][0]["author"]["username"], "testuser1")
+
+    def test_book_reads_use_author_snapshot(self):
+        get_response_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("books_list"))
+            response = self.client.get(reverse("books_details", args=[self.book3.pk]))
+        self.assertFalse(any("users_customuser" in query["sql"] for query in queries))
+        self.assertEqual(response.data["author"]["author_pseudonym"], "test2pseudonym")
+
+        self.user2.email = "changed@example.com"
+        with CaptureQueriesContext(connection) as queries:
+            self.user2.save(update_fields=["email"])
+        # One UPDATE by author, without reading or listing the IDs of the books.
+        book_queries = [query["sql"] for query in queries if "books_book" in query["sql"]]
+        self.assertEqual(len(book_queries), 1)
+        self.assertIn('WHERE "books_book"."author_id" =', book_queries[0])
+        self.book3.refresh_from_db()
+        self.assertEqual(self.book3.author_email, "changed@example.com")
+
+        books = Book.objects.bulk_create(
+            [Book(title="Bulk", description="Bulk", author_id=self.user.pk, price="1.00")]
+        )
+        self.assertEqual(books[0].author_username, "testuser1")
+
+    def test_user_books_query_count_does_not_grow_with_rows(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Bearer " + self.user_token["access"]
+        )
+        for index in range(10):
+            Book.objects.create(
+                title=f"Extra Book {index}",
+                description="Extra description",
+                author=self.user,
+                price="5.00",
+            )
+
+        # One query authenticates the user, one loads the books with their author.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("auth_books"))
+        self.assertEqual(len(response.data["results"]), 12)
+
+    def test_books_list_cursor_pagination(self):
+        for index in range(10):
+            Book.objects.create(
+                title=f"Extra Book {index}",
+                description="Extra description",
+                author=self.user2,
+                price="5.00",
+            )
+
+        seen_ids = []
+        url = reverse("books_list") + "?page_size=5"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 5)
+            seen_ids += [book["id"] for book in response.data["results"]]
+            url = response.data["next"]
+
+        self.assertEqual(seen_ids, list(Book.objects.order_by("id").values_list("id", flat=True)))
+
+        response = self.client.get(reverse("books_list"), {"page_size": 5})
+        self.assertIsNone(response.data["previous"])
+        second_page = self.client.get(response.data["next"])
+        self.assertIsNotNone(second_page.data["previous"])
+        previous_page = self.client.get(second_page.data["previous"])
+        self.assertEqual(previous_page.data["results"], response.data["results"])
+
+    def test_books_list_cursor_pagination_xml(self):
+        response = self.client.get(
+            reverse("books_list"), {"page_size": 2}, HTTP_ACCEPT="application/xml"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"<next>http://testserver/books/?", response.content)
+        self.assertEqual(response.content.count(b"<list-item>"), 2)
+
+    def test_books_list_invalid_cursor(self):
+        response = self.client.get(reverse("books_list"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_books_list_sparse_fieldset(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("books_list"), {"fields": "id,title,price", "ordering": "price"}
+            )
+        self.assertEqual(response.status_code, 200)
+        first = response.json()["results"][0]
+        self.assertEqual(first, {"id": self.book1.pk, "title": "Book One", "price": "10.00"})
+        select = next(query["sql"] for query in queries if '"books_book"' in query["sql"])
+        self.assertNotIn("description", select)
+        self.assertNotIn("users_customuser", select)
+
+        response = self.client.get(
+            reverse("books_list"), {"fields": "title,author,unknown", "page_size": 2}
+        )
+        first = response.json()["results"][0]
+        self.assertEqual(first, {"author": self.user.pk, "title": "Book One"})
+        next_page = self.client.get(response.json()["next"]).json()
+        self.assertEqual(next_page["results"], [{"author": self.user2.pk, "title": "Book Three"}])
+
+    def test_books_expand_author(self):
+        response = self.client.get(reverse("books_list"), {"fields": "title", "expand": "author"})
+        self.assertEqual(
+            response.json()["results"][0],
+            {
+                "author": {
+                    "id": self.user.pk,
+                    "username": "testuser1",
+                    "email": "testuser1@example.com",
+                    "author_pseudonym": "testpseudonym",
+                },
+                "title": "Book One",
+            },
+        )
+        full = self.client.get(reverse("books_list")).json()
+        self.assertEqual(self.client.get(reverse("books_list"), {"fields": "x"}).json(), full)
+
+    def test_book_detail_sparse_fieldset(self):
+        url = reverse("books_details", args=[self.book1.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"fields": "title,author"})
+        self.assertEqual(response.json(), {"author": self.user.pk, "title": "Book One"})
+        select = next(query["sql"] for query in queries if '"books_book"."title"' in query["sql"])
+        self.assertNotIn("description", select)
+        self.assertNotIn("users_customuser", select)
+
+        response = self.client.get(url, {"fields": "id", "expand": "author"})
+        self.assertEqual(response.json()["author"]["username"], "testuser1")
+        self.assertEqual(self.client.get(url).json(), BookSerializer(self.book1).data)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.user_token["access"])
+        response = self.client.get(reverse("auth_books"), {"fields": "id,version"})
+        self.assertEqual(
+            response.json()["results"],
+            [{"id": self.book1.pk, "version": 1}, {"id": self.book2.pk, "version": 1}],
+        )
+
+    def test_search_ranks_title_matches_first(self):
+        in_description = Book.objects.create(
+            title="Tales",
+            description="A story about a dragon",
+            author=self.user2,
+            price="5.00",
+        )
+        in_title = Book.objects.create(
+            title="Dragon Rider",
+            description="A story",
+            author=self.user2,
+            price="5.00",
+        )
+        response = self.client.get(reverse("books_list"), {"search": "dragon"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [book["id"] for book in response.data["results"]],
+            [in_title.pk, in_description.pk],
+        )
+
+    def test_search_matches_prefixes_and_ignores_operators(self):
+        response = self.client.get(reverse("books_list"), {"search": "Thr"})
+        self.assertEqual(
+            [book["title"] for book in response.data["results"]], ["Book Three"]
+        )
+
+        response = self.client.get(reverse("books_list"), {"search": 'one" OR "two'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 0)
+
+    def test_search_index_follows_updates_and_deletes(self):
+        self.book1.title = "Renamed"
+        self.book1.save()
+        self.book2.delete()
+
+        response = self.client.get(reverse("books_list"), {"search": "renamed"})
+        self.assertEqual(
+            [book["id"] for book in response.data["results"]], [self.book1.pk]
+        )
+        response = self.client.get(reverse("books_list"), {"search": "two"})
+        self.assertEqual(len(response.data["results"]), 0)
+
+    def test_search_cursor_pagination(self):
+        for index in range(7):
+            Book.objects.create(
+                title=f"Saga {index}",
+                description="saga " * index,
+                author=self.user2,
+                price="5.00",
+            )
+
+        response = self.client.get(reverse("books_list"), {"search": "saga"})
+        expected = [book["id"] for book in response.data["results"]]
+        self.assertEqual(len(expected), 7)
+
+        seen_ids = []
+        url = reverse("books_list") + "?search=saga&page_size=3"
+        while url:
+            response = self.client.get(url)
+            seen_ids += [book["id"] for book in response.data["results"]]
+            last_page = response
+            url = response.data["next"]
+        self.assertEqual(seen_ids, expected)
+
+        previous_page = self.client.get(last_page.data["previous"])
+        self.assertEqual(
+            [book["id"] for book in previous_page.data["results"]], expected[3:6]
+        )
+
+    def test_search_without_word_characters_matches_substrings(self):
+        books = [
+            Book.objects.create(
+                title=f"Before -- After {index}",
+                description="",
+                author=self.user2,
+                price="5.00",
+            )
+            for index in range(3)
+        ]
+
+        seen_ids = []
+        url = reverse("books_list") + "?search=--&page_size=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen_ids += [book["id"] for book in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(seen_ids, [book.pk for book in books])
+
+    def test_ensure_search_index_restores_dropped_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER books_book_fts_insert")
+        ensure_search_index(sender=None, using="default")
+
+        book = Book.objects.create(
+            title="Restored", description="", author=self.user2, price="5.00"
+        )
+        response = self.client.get(reverse("books_list"), {"search": "restored"})
+        self.assertEqual(
+            [result["id"] for result in response.data["results"]], [book.pk]
+        )
+
+    def test_books_list_is_served_from_cache(self):
+        response = self.client.get(reverse("books_list"))
+        with self.assertNumQueries(0):
+            cached = self.client.get(reverse("books_list"))
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached["Content-Type"], "application/json")
+
+        xml = self.client.get(reverse("books_list"), HTTP_ACCEPT="application/xml")
+        self.assertTrue(xml["Content-Type"].startswith("application/xml"))
+        with self.assertNumQueries(0):
+            cached_xml = self.client.get(
+                reverse("books_list"), HTTP_ACCEPT="application/xml"
+            )
+        self.assertEqual(cached_xml.content, xml.content)
+
+    def test_cached_responses_expire_with_the_cache_timeout(self):
+        timeout = settings.CACHES["books"]["TIMEOUT"]
+        self.assertEqual(timeout, 60)
+        self.client.get(reverse("books_details", args=[self.book1.pk]))
+
+        # Like a write handled by another process with its own cache.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE books_book SET title = 'Elsewhere' WHERE id = %s", [self.book1.pk]
+            )
+        response = self.client.get(reverse("books_details", args=[self.book1.pk]))
+        self.assertEqual(response.data["title"], "Book One")
+
+        with mock.patch("time.time", return_value=time.time() + timeout + 1):
+            response = self.client.get(reverse("books_details", args=[self.book1.pk]))
+        self.assertEqual(response.data["title"], "Elsewhere")
+
+    def test_cached_responses_are_finalized_once(self):
+        view_class = resolve(reverse("books_list")).func.view_class
+        calls = []
+        finalize_response = view_class.finalize_response
+
+        def count_calls(view, *args, **kwargs):
+            calls.append(view)
+            return finalize_response(view, *args, **kwargs)
+
+        with mock.patch.object(view_class, "finalize_response", count_calls):
+            response = self.client.get(reverse("books_list"))
+            self.assertEqual(len(calls), 1)
+            cached = self.client.get(reverse("books_list"))
+            self.assertEqual(len(calls), 2)
+        self.assertEqual(cached.data, response.data)
+        self.assertEqual(cached["Vary"], response["Vary"])
+
+    def test_book_cache_is_invalidated_by_writes(self):
+        self.client.get(reverse("books_details", args=[self.book1.pk]))
+        self.client.get(reverse("books_list"))
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Bearer " + self.user_token["access"]
+        )
+        self.client.patch(
+            reverse("auth_books_details", args=[self.book1.pk]), {"title": "Patched"}
+        )
+        self.client.credentials()
+
+        detail = self.client.get(reverse("books_details", args=[self.book1.pk]))
+        self.assertEqual(detail.data["title"], "Patched")
+        books = self.client.get(reverse("books_list"))
+        self.assertEqual(books.data["results"][0]["title"], "Patched")
+
+    def test_book_cache_is_invalidated_by_author_changes(self):
+        self.client.get(reverse("books_details", args=[self.book1.pk]))
+        self.client.get(reverse("books_details", args=[self.book3.pk]))
+
+        self.user.author_pseudonym = "renamed"
+        self.user.save()
+
+        detail = self.client.get(reverse("books_details", args=[self.book1.pk]))
+        self.assertEqual(detail.data["author"]["author_pseudonym"], "renamed")
+        # Author changes replace the authors generation, shared by all details.
+        detail = self.client.get(reverse("books_details", args=[self.book3.pk]))
+        self.assertEqual(detail.data["author"]["author_pseudonym"], "test2pseudonym")
+        with self.assertNumQueries(0):
+            self.client.get(reverse("books_details", args=[self.book3.pk]))
+
+    def test_book_detail_conditional_get(self):
+        response = self.client.get(reverse("books_details", args=[self.book1.pk]))
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+
+        not_modified = self.client.get(
+            reverse("books_details", args=[self.book1.pk]),
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+
+        xml = self.client.get(
+            reverse("books_details", args=[self.book1.pk]),
+            HTTP_IF_NONE_MATCH=response["ETag"],
+            HTTP_ACCEPT="application/xml",
+        )
+        self.assertEqual(xml.status_code, 200)
+        self.assertNotEqual(xml["ETag"], response["ETag"])
+
+        self.book1.price = "12.00"
+        self.book1.save()
+        modified = self.client.get(
+            reverse("books_details", args=[self.book1.pk]),
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(modified.data["price"], "12.00")
+        self.assertEqual(modified.data["version"], 2)
+
+    def test_books_list_conditional_get(self):
+        response = self.client.get(reverse("books_list"))
+        not_modified = self.client.get(
+            reverse("books_list"), HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.book3.delete()
+        modified = self.client.get(
+            reverse("books_list"), HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(len(modified.json()["results"]), 2)
+
+    def test_patch_with_if_match(self):
+        etag = self.client.get(reverse("books_details", args=[self.book1.pk]))["ETag"]
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Bearer " + self.user_token["access"]
+        )
+
+        response = self.client.patch(
+            reverse("auth_books_details", args=[self.book1.pk]),
+            {"title": "First Writer"},
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        response = self.client.patch(
+            reverse("auth_books_details", args=[self.book1.pk]),
+            {"title": "Second Writer"},
+            HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 412)
+        self.book1.refresh_from_db()
+        self.assertEqual(self.book1.title, "First Writer")
+
+        response = self.client.delete(
+            reverse("auth_books_details", args=[self.book1.pk]), HTTP_IF_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 412)
+        self.assertTrue(Book.objects.filter(pk=self.book1.pk).exists())
+
+    def test_concurrent_patches_with_same_if_match(self):
+        url = reverse("auth_books_details", args=[self.book1.pk])
+        etag = self.client.get(reverse("books_details", args=[self.book1.pk]))["ETag"]
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.user_token["access"])
+        other_client = APIClient()
+        other_client.credentials(HTTP_AUTHORIZATION="Bearer " + self.user_token["access"])
+        responses = []
+
+        # The other client writes after this request read the state for its precondition.
+        def write_in_between(*args, **kwargs):
+            state = get_book_state(*args, **kwargs)
+            if not responses:
+                responses.append(None)
+                responses[0] = other_client.patch(url, {"title": "Second"}, HTTP_IF_MATCH=etag)
+            return state
+
+        async def awrite_in_between(*args, **kwargs):
+            state = await aget_book_state(*args, **kwargs)
+            if not responses:
+                responses.append(None)
+                responses[0] = await sync_to_async(other_client.patch)(
+                    url, {"title": "Second"}, HTTP_IF_MATCH=etag
+                )
+            return state
+
+        with mock.patch("books.conditional.get_book_state", side_effect=write_in_between):
+            with mock.patch("books.async_views.aget_book_state", side_effect=awrite_in_between):
+                response = self.client.patch(url, {"title": "First"}, HTTP_IF_MATCH=etag)
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(response.status_code, 412)
+        self.book1.refresh_from_db()
+        self.assertEqual(self.book1.title, "Second")
+        self.assertEqual(self.book1.version, 2)
+
+    def test_author_change_changes_book_etag(self):
+        etag = self.client.get(reverse("books_details", args=[self.book1.pk]))["ETag"]
+        self.user.email = "changed@example.com"
+        self.user.save()
+        response = self.client.get(
+            reverse("books_details", args=[self.book1.pk]), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["author"]["email"], "changed@example.com")
+
+    def test_bulk_create_update_delete(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Bearer " + self.user_token["access"]
+        )
+        data = {
+            "create": [
+                {"title": f"Bulk {index}", "description": "Bulk", "price": "1.00"}
+                for index in range(20)
+            ],
+            "update": [{"id": self.book1.pk, "price": "11.00"}],
+            "delete": [self.book2.pk],
+        }
+        with self.assertNumQueries(8):
+            response = self.client.post(reverse("auth_books_bulk"), data, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["create"]), 20)
+        self.assertEqual(response.data["create"][0]["author"]["username"], "testuser1")
+        self.assertEqual(response.data["update"][0]["price"], "11.00")
+        self.assertEqual(response.data["update"][0]["version"], 2)
+        self.assertEqual(response.data["delete"], [{"id": self.book2.pk}])
+
+        self.assertEqual(Book.objects.filter(author=self.user).count(), 21)
+        self.assertFalse(Book.objects.filter(pk=self.book2.pk).exists())
+        search = self.client.get(reverse("books_list"), {"search": "bulk"})
+        self.assertEqual(len(search.json()["results"]), 20)
+
+    def test_bulk_rejects_whole_batch_on_error(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Bearer " + self.user_token["access"]
+        )
+        data = {
+            "create": [
+                {"title": "Valid", "description": "Valid", "price": "1.00"},
+                {"title": "Invalid", "description": "No price"},
+            ],
+            "update": [{"id": self.book3.pk, "price": "1.00"}],
+            "delete": [self.book1.pk],
+        }
+        response = self.client.post(reverse("auth_books_bulk"), data, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["create"][0], {})
+        self.assertIn("price", response.data["create"][1])
+        self.assertEqual(
+            response.data["update"][0]["id"], ["No Book matches the given query."]
+        )
+        self.assertEqual(response.data["delete"], [{}])
+        self.assertEqual(Book.objects.count(), 3)
+
+    def test_vader_tryes_to_bulk_publish(self):
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Bearer " + self.vader_token["access"]
+        )
+        data = {"create": [{"title": "Vader", "description": "Dark", "price": "1.00"}]}
+        response = self.client.post(reverse("auth_books_bulk"), data, format="json")
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Book.objects.filter(author=self.vader).exists())
+
+    def test_export_streams_every_format(self):
+        books = Book.objects.with_author().order_by("id")
+        data = BookSerializer(books, many=True).data
+
+        response = self.client.get(reverse("books_export"), {"format": "ndjson"})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], json.loads(json.dumps(data)))
+
+        response = self.client.get(reverse("books_export"), {"format": "json"})
+        self.assertEqual(
+            b"".join(response.streaming_content), JSONRenderer().render(data)
+        )
+
+        response = self.client.get(
+            reverse("books_export"), HTTP_ACCEPT="application/xml"
+        )
+        self.assertEqual(
+            b"".join(response.streaming_content),
+            XMLRenderer().render(data).encode("utf-8"),
+        )
+
+    async def test_export_streams_under_asgi(self):
+        expected = await sync_to_async(
+            lambda: b"".join(self.client.get(reverse("books_export")).streaming_content)
+        )()
+        response = await self.async_client.get(reverse("books_export"))
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(b"".join(chunks), expected)
+
+    def test_export_query_count_does_not_grow_with_rows(self):
+        for index in range(50):
+            Book.objects.create(
+                title=f"Extra Book {index}",
+                description="Extra description",
+                author=self.user2,
+                price="5.00",
+            )
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("books_export"), {"format": "ndjson"})
+            lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 53)
+
+
+@override_settings(
+    COVER_PROCESSING={"WIDTHS": [16, 64], "FORMATS": ["webp"], "EAGER": True},
+    COVER_CLEANUP={"EAGER": True, "MIN_AGE": 0},
+)
+class CoverProcessingTests(APITestCase):
+
+    def setUp(self):
+        get_response_cache().clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = CustomUser.objects.create_user(
+            username="testuser1",
+            email="testuser1@example.com",
+            password="Testpassword",
+            author_pseudonym="testpseudonym",
+        )
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(refresh.access_token))
+
+    def make_cover(self, name="cover.png", size=(200, 100)):
+        buffer = BytesIO()
+        Image.new("RGB", size, "red").save(buffer, format="PNG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+    def test_uploaded_cover_is_processed_after_commit(self):
+        data = {
+            "title": "Covered",
+            "description": "With a cover",
+            "price": "9.99",
+            "cover_image": self.make_cover(),
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("auth_books"), data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["cover_variants"], {})
+
+        book = Book.objects.get(pk=response.data["id"])
+        self.assertEqual(set(book.cover_variants["webp"]), {"16", "64"})
+        self.assertEqual(book.version, 2)
+        storage = Book._meta.get_field("cover_image").storage
+        with storage.open(book.cover_variants["webp"]["64"]) as variant:
+            self.assertEqual(Image.open(variant).size, (64, 32))
+
+        detail = self.client.get(reverse("books_details", args=[book.pk]))
+        self.assertEqual(
+            detail.data["cover_variants"]["webp"]["16"],
+            storage.url(book.cover_variants["webp"]["16"]),
+        )
+
+    def test_identical_variants_are_stored_once(self):
+        names = []
+        for title in ("First", "Second"):
+            data = {
+                "title": title,
+                "description": "Same cover",
+                "price": "9.99",
+                "cover_image": self.make_cover(),
+            }
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse("auth_books"), data)
+            names.append(Book.objects.get(pk=response.data["id"]).cover_variants)
+        self.assertEqual(names[0], names[1])
+
+    def test_replaced_cover_drops_old_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("auth_books"),
+                {
+                    "title": "Covered",
+                    "description": "With a cover",
+                    "price": "9.99",
+                    "cover_image": self.make_cover(),
+                },
+            )
+        book_id = response.data["id"]
+        old_paths = self.get_file_paths(Book.objects.get(pk=book_id))
+        self.assertTrue(all(os.path.exists(path) for path in old_paths))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse("auth_books_details", args=[book_id]),
+                {"cover_image": self.make_cover(size=(100, 300))},
+            )
+        self.assertEqual(response.data["cover_variants"], {})
+        for path in old_paths:
+            self.assertFalse(os.path.exists(path), path)
+        new_paths = self.get_file_paths(Book.objects.get(pk=book_id))
+        self.assertGreater(len(new_paths), 1)
+        self.assertTrue(all(os.path.exists(path) for path in new_paths))
+
+    def create_book_with_cover(self, title="Covered"):
+        data = {
+            "title": title,
+            "description": "With a cover",
+            "price": "9.99",
+            "cover_image": self.make_cover(),
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("auth_books"), data)
+        return Book.objects.get(pk=response.data["id"])
+
+    def get_file_paths(self, book):
+        storage = Book._meta.get_field("cover_image").storage
+        names = [book.cover_image.name]
+        for widths in book.cover_variants.values():
+            names += widths.values()
+        return [storage.path(name) for name in names]
+
+    def test_deleted_book_files_are_removed_after_commit(self):
+        book = self.create_book_with_cover()
+        paths = self.get_file_paths(book)
+        self.assertEqual(len(paths), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse("auth_books_details", args=[book.pk]))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+    def test_deleting_book_with_missing_cover_file(self):
+        book = self.create_book_with_cover()
+        os.remove(book.cover_image.path)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse("auth_books_details", args=[book.pk]))
+        self.assertEqual(response.status_code, 204)
+
+    def test_identical_covers_are_stored_once(self):
+        first = self.create_book_with_cover("First")
+        second = self.create_book_with_cover("Second")
+        self.assertEqual(first.cover_image.name, second.cover_image.name)
+        self.assertRegex(first.cover_image.name, r"^cover_images/[0-9a-f]{2}/[0-9a-f]{64}\.png$")
+
+    def test_shared_files_are_kept_while_referenced(self):
+        first = self.create_book_with_cover("First")
+        second = self.create_book_with_cover("Second")
+        paths = self.get_file_paths(second)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+    def test_storage_does_not_delete_referenced_files(self):
+        book = self.create_book_with_cover()
+        storage = Book._meta.get_field("cover_image").storage
+        self.assertEqual(storage.get_reference_count(book.cover_image.name), 1)
+
+        storage.delete(book.cover_image.name)
+        self.assertTrue(os.path.exists(book.cover_image.path))
+
+    def test_variant_references_follow_the_variants(self):
+        book = self.create_book_with_cover()
+        storage = Book._meta.get_field("cover_image").storage
+        variant = book.cover_variants["webp"]["16"]
+        self.assertEqual(storage.get_reference_count(variant), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse("auth_books_details", args=[book.pk]),
+                {"cover_image": self.make_cover(size=(100, 300))},
+            )
+        book.refresh_from_db()
+        self.assertEqual(storage.get_reference_count(variant), 0)
+        references = CoverVariantReference.objects.filter(book_id=book.pk)
+        self.assertEqual(
+            set(references.values_list("name", flat=True)),
+            set(book.cover_variants["webp"].values()),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book.delete()
+        self.assertFalse(CoverVariantReference.objects.exists())
+
+    def test_recently_reused_files_are_kept(self):
+        book = self.create_book_with_cover()
+        storage = Book._meta.get_field("cover_image").storage
+        path = book.cover_image.path
+        os.utime(path, (time.time() - 3600, time.time() - 3600))
+
+        # An upload of the same cover whose book is not committed yet.
+        name = storage.save("cover_images/cover.png", self.make_cover())
+        self.assertEqual(name, book.cover_image.name)
+        with self.settings(COVER_CLEANUP={"EAGER": True, "MIN_AGE": 60}):
+            with self.captureOnCommitCallbacks(execute=True):
+                book.delete()
+        self.assertTrue(os.path.exists(path))
+
+        os.utime(path, (time.time() - 3600, time.time() - 3600))
+        storage.delete(book.cover_image.name, min_age=60)
+        self.assertFalse(os.path.exists(path))
+
+    def test_concurrent_identical_saves_store_one_file(self):
+        storage = Book._meta.get_field("cover_image").storage
+        name = storage.save("cover_images/cover.png", self.make_cover())
+        # The other save finds no file, then loses the race to create it.
+        with mock.patch("books.storage.os.utime", side_effect=FileNotFoundError):
+            self.assertEqual(storage.save("cover_images/cover.png", self.make_cover()), name)
+        self.assertEqual(storage.listdir(os.path.dirname(name))[1], [os.path.basename(name)])
+
+    def test_prune_cover_images_command(self):
+        book = self.create_book_with_cover()
+        storage = Book._meta.get_field("cover_image").storage
+        orphan = storage.save("cover_images/orphan.png", self.make_cover(size=(50, 50)))
+        orphan_variant = storage.save(
+            "cover_images/variants/orphan.webp", self.make_cover(size=(60, 60))
+        )
+
+        output = StringIO()
+        call_command("prune_cover_images", "--dry-run", "--min-age=0", stdout=output)
+        self.assertTrue(storage.exists(orphan))
+        self.assertIn("Found 2 orphaned cover files.", output.getvalue())
+
+        call_command("prune_cover_images", "--min-age=0", stdout=StringIO())
+        self.assertFalse(storage.exists(orphan))
+        self.assertFalse(storage.exists(orphan_variant))
+        self.assertTrue(all(os.path.exists(path) for path in self.get_file_paths(book)))
+
+    def test_row_serializer_output_matches_book_serializer(self):
+        self.create_book_with_cover()
+        Book.objects.create(title="Plain", description="No cover", price="5.50", author=self.user)
+        books = BookSerializer(Book.objects.with_author().order_by("id"), many=True).data
+        rows = BookRowSerializer(Book.objects.as_rows().order_by("id"), many=True).data
+        for renderer in (JSONRenderer(), XMLRenderer()):
+            self.assertEqual(renderer.render(rows), renderer.render(books))
+
+
+@override_settings(COVER_CLEANUP={"EAGER": False, "BATCH_DELAY": 0.01, "MIN_AGE": 0})
+class CoverCleanupQueueTests(TransactionTestCase):
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.storage = Book._meta.get_field("cover_image").storage
+        self.user = CustomUser.objects.create(
+            username="testuser1",
+            email="testuser1@example.com",
+            password="Testpassword",
+            author_pseudonym="testpseudonym",
+        )
+
+    def test_cleanup_queue_deletes_unreferenced_files_in_background(self):
+        orphan = self.storage.save("cover_images/orphan.png", ContentFile(b"orphan"))
+        used = self.storage.save("cover_images/used.png", ContentFile(b"used"))
+        Book.objects.create(
+            title="Book One",
+            description="Description for book one",
+            author=self.user,
+            price="10.00",
+            cover_image=used,
+        )
+
+        cleanup_queue.put([orphan, used, "cover_images/missing.png"])
+        cleanup_queue.join()
+        self.assertFalse(self.storage.exists(orphan))
+        self.assertTrue(self.storage.exists(used))
+
+
+@skipUnless(connection.vendor == "sqlite", "The SQLite backend is only used with SQLite.")
+class SQLiteBackendTests(TransactionTestCase):
+
+    def test_connection_pragmas_and_immediate_transactions(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], connection.pragmas["busy_timeout"])
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                Book.objects.exists()
+        self.assertEqual(queries[0]["sql"], "BEGIN IMMEDIATE")
+
+
+@skipUnless(connection.vendor == "sqlite", "Query plans are checked on SQLite.")
+class QueryPlanTests(APITestCase):
+    """
+    Fails if a book query of a view stops using an index.
+
+    Every query reading books_book is run again with EXPLAIN QUERY PLAN. Full
+    table scans and temporary sort trees are rejected. Listings are checked on
+    their second page, as a first page may legitimately read the first rows of
+    the table in order. The ranking query of the full-text search only reads the
+    search index and sorts the matches by relevance, so it is not checked.
+    """
+
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = CustomUser.objects.create(
+            username="testuser1",
+            email="testuser1@example.com",
+            password="Testpassword",
+            author_pseudonym="testpseudonym",
+        )
+        other = CustomUser.objects.create(
+            username="testuser2",
+            email="testuser2@example.com",
+            password="Testpassword",
+            author_pseudonym="test2pseudonym",
+        )
+        Book.objects.bulk_create(
+            Book(
+                title=f"Saga {index}",
+                description="A long saga",
+                author=self.user if index % 2 else other,
+                price=f"{index % 7}.99",
+            )
+            for index in range(20)
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def get_query_plans(self, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+
+        plans = {}
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query["sql"]
+                if sql.startswith("SELECT") and '"books_book"' in sql:
+                    cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                    plans[sql] = [row[-1] for row in cursor.fetchall()]
+        self.assertTrue(plans)
+        return response, plans
+
+    def assertIndexed(self, plans):
+        for sql, plan in plans.items():
+            for step in plan:
+                with self.subTest(sql=sql, step=step):
+                    self.assertFalse(
+                        re.match(r"SCAN books_book\b", step) and "USING" not in step,
+                        "full table scan",
+                    )
+                    self.assertNotIn("TEMP B-TREE", step)
+
+    def assertSecondPageIndexed(self, url, data):
+        next_url = self.client.get(url, data).json()["next"]
+        self.assertIsNotNone(next_url)
+        response, plans = self.get_query_plans(next_url)
+        self.assertIndexed(plans)
+
+    def test_books_list_plan(self):
+        self.assertSecondPageIndexed(reverse("books_list"), {"page_size": 5})
+
+    def test_books_list_by_price_plan(self):
+        for ordering in ("price", "-price"):
+            with self.subTest(ordering=ordering):
+                self.assertSecondPageIndexed(
+                    reverse("books_list"), {"page_size": 5, "ordering": ordering}
+                )
+
+    def test_books_search_plan(self):
+        self.assertSecondPageIndexed(
+            reverse("books_list"), {"page_size": 5, "search": "saga"}
+        )
+
+    def test_book_detail_plan(self):
+        book = Book.objects.filter(author=self.user).first()
+        response, plans = self.get_query_plans(reverse("books_details", args=[book.pk]))
+        self.assertIndexed(plans)
+
+    def test_user_books_plan(self):
+        self.assertSecondPageIndexed(reverse("auth_books"), {"page_size": 3})
+
+    def test_price_ordering(self):
+        response = self.client.get(reverse("books_list"), {"ordering": "-price", "page_size": 20})
+        prices = [float(book["price"]) for book in response.json()["results"]]
+        self.assertEqual(prices, sorted(prices, reverse=True))
+
+
+# The primary stands in for the replica, the routing decision is observed on choose_replica.
+@override_settings(DATABASE_REPLICAS=["default"])
+class ReplicaRoutingTests(APITestCase):
+
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = CustomUser.objects.create_user(
+            username="testuser1",
+            email="testuser1@example.com",
+            password="Testpassword",
+            author_pseudonym="testpseudonym",
+        )
+        self.book = Book.objects.create(
+            title="Book One", description="Description", author=self.user, price="10.00"
+        )
+        patcher = mock.patch("books.routers.choose_replica", return_value="default")
+        self.choose_replica = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Book), "default")
+        self.assertEqual(router.db_for_write(Book), "default")
+        with override_settings(DATABASE_REPLICAS=["replica1"]):
+            self.assertFalse(router.allow_migrate("replica1", "books"))
+            self.assertIsNone(router.allow_migrate("default", "books"))
+        self.choose_replica.assert_not_called()
+
+    def test_anonymous_reads_use_replica(self):
+        response = self.client.get(reverse("books_details", args=[self.book.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.choose_replica.assert_called()
+
+    def test_authenticated_reads_and_writes_use_primary(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.client.get(reverse("books_list"))
+        response = self.client.patch(
+            reverse("auth_books_details", args=[self.book.pk]), {"price": "12.00"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.choose_replica.assert_not_called()
+        self.assertIn(PRIMARY_COOKIE_NAME, response.cookies)
+
+        self.client.credentials()
+        self.client.get(reverse("books_list"))
+        self.choose_replica.assert_not_called()
+
+        self.client.cookies.pop(PRIMARY_COOKIE_NAME)
+        self.client.get(reverse("books_list"), {"page_size": 10})
+        self.choose_replica.assert_called()
+
+    def test_replica_responses_are_cached_once_replicas_caught_up(self):
+        url = reverse("books_list")
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+        with override_settings(REPLICA_MAX_LAG=0):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                self.client.get(url)
+
+
+def get_cursor(link):
+    return parse_qs(urlsplit(link).query)["cursor"][0]
+
+
+@override_settings(CATALOGUE_STORE={"ENABLED": True})
+class CatalogueTests(TransactionTestCase):
+
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = CustomUser.objects.create(
+            username="testuser1",
+            email="testuser1@example.com",
+            password="Testpassword",
+            author_pseudonym="testpseudonym",
+        )
+        for number, price in enumerate(["12.50", "8.00", "12.50", "30.00", "5.99", "8.00"]):
+            Book.objects.create(
+                title=f"Book {number}",
+                description=f"Description of the saga part {number}",
+                author=self.user,
+                price=price,
+            )
+        self.addCleanup(clear_catalogue)
+        load_catalogue()
+
+    def assertServedFromCatalogue(self, params):
+        with override_settings(CATALOGUE_STORE={"ENABLED": False}):
+            expected = self.client.get(reverse("books_list"), params).json()
+        get_response_cache().clear()
+        load_catalogue()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("books_list"), params)
+        self.assertEqual(response.json(), expected)
+        return expected
+
+    def test_catalogue_pages_match_database(self):
+        self.assertServedFromCatalogue({})
+        self.assertServedFromCatalogue({"fields": "id,price", "expand": "author"})
+        page = self.assertServedFromCatalogue({"ordering": "-price", "page_size": 2})
+        cursor = get_cursor(page["next"])
+        page = self.assertServedFromCatalogue(
+            {"ordering": "-price", "page_size": 2, "cursor": cursor}
+        )
+        cursor = get_cursor(page["previous"])
+        self.assertServedFromCatalogue({"ordering": "-price", "page_size": 2, "cursor": cursor})
+
+    def test_catalogue_search_matches_database(self):
+        page = self.assertServedFromCatalogue({"search": "saga book 1", "page_size": 2})
+        self.assertEqual(page["results"][0]["title"], "Book 1")
+        page = self.assertServedFromCatalogue({"search": "sag", "page_size": 4})
+        cursor = get_cursor(page["next"])
+        self.assertServedFromCatalogue({"search": "sag", "page_size": 4, "cursor": cursor})
+
+    def test_searches_use_the_database_without_fts5_ranking(self):
+        with mock.patch("books.catalogue.get_search_backend") as get_search_backend:
+            get_search_backend.return_value = mock.Mock(spec=object)
+            with self.assertNumQueries(2):
+                response = self.client.get(reverse("books_list"), {"search": "saga"})
+            self.assertEqual(len(response.json()["results"]), 6)
+            with self.assertNumQueries(0):
+                self.client.get(reverse("books_list"))
+
+    def test_catalogue_notices_writes_of_other_processes(self):
+        catalogue = load_catalogue()
+        self.assertTrue(verify_catalogue(catalogue))
+
+        # Like a write of another process, whose cache is not shared.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE books_book SET title = 'Elsewhere', updated_at = %s WHERE title = %s",
+                [datetime.now(dt_timezone.utc), "Book 1"],
+            )
+        self.assertFalse(verify_catalogue(catalogue))
+        response = self.client.get(reverse("books_list"), {"search": "elsewhere"})
+        self.assertEqual(len(response.json()["results"]), 1)
+
+        catalogue = load_catalogue()
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM books_book WHERE title = 'Book 2'")
+        self.assertFalse(verify_catalogue(catalogue))
+
+        catalogue = load_catalogue()
+        Book.objects.get(title="Book 3").delete()
+        self.assertTrue(verify_catalogue(catalogue))
+
+    def test_catalogue_follows_writes(self):
+        book = Book.objects.get(title="Book 1")
+        book.title = "Renamed"
+        with transaction.atomic():
+            book.save()
+        Book.objects.filter(title="Book 2").delete()
+        self.user.username = "renamed_author"
+        self.user.save()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("books_list"), {"search": "renamed"})
+        results = response.json()["results"]
+        self.assertEqual([result["id"] for result in results], [book.pk])
+        self.assertEqual(results[0]["author"]["username"], "renamed_author")
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("books_list"))
+        self.assertEqual(len(response.json()["results"]), 5)
+
+    def test_writes_in_one_transaction_refresh_once(self):
+        first, second = Book.objects.filter(title__in=["Book 1", "Book 2"]).order_by("id")
+        with mock.patch("books.catalogue.schedule_catalogue_load") as schedule_load:
+            with transaction.atomic():
+                first.title = "First"
+                first.save()
+                second.title = "Second"
+                second.save()
+            token = CustomRefreshToken.for_user(self.user).access_token
+            response = self.client.post(
+                reverse("auth_books_bulk"),
+                {"update": [{"id": first.pk, "price": "1.00"}], "delete": [second.pk]},
+                content_type="application/json",
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            self.assertEqual(response.status_code, 200)
+        schedule_load.assert_not_called()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("books_list"), {"ordering": "price"})
+        results = response.json()["results"]
+        self.assertEqual(len(results), 5)
+        self.assertEqual((results[0]["title"], results[0]["price"]), ("First", "1.00"))
+
+    def test_author_snapshots_are_counted_once(self):
+        catalogue = load_catalogue()
+        nbytes = catalogue.nbytes
+        for number in range(20):
+            self.user.username = f"renamed{number:02}"
+            self.user.save()
+        self.assertEqual(catalogue.nbytes, nbytes)
+
+        Book.objects.filter(author=self.user).delete()
+        self.assertEqual(catalogue.authors, {})
+        self.assertEqual(catalogue.nbytes, 0)
+
+    def test_bounded_catalogue_holds_lowest_ids(self):
+        catalogue = load_catalogue()
+        usage = catalogue.memory_usage()
+        self.assertEqual(usage["total"], sum(usage.values()) - usage["total"])
+        max_bytes = catalogue.nbytes // 2
+
+        with override_settings(CATALOGUE_STORE={"ENABLED": True, "MAX_BYTES": max_bytes}):
+            catalogue = load_catalogue()
+            self.assertTrue(catalogue.truncated)
+            self.assertLessEqual(catalogue.nbytes, max_bytes)
+            self.assertServedFromCatalogue({"page_size": 1})
+            response = self.client.get(reverse("books_list"), {"ordering": "price"})
+            self.assertEqual(len(response.json()["results"]), 6)
+            response = self.client.get(reverse("books_list"))
+            self.assertEqual(len(response.json()["results"]), 6)
+
+        out = StringIO()
+        call_command("catalogue_stats", max_mb=max_bytes / 1024 / 1024, stdout=out)
+        self.assertIn("truncates the catalogue", out.getvalue())
+
+
+def parse_server_timing(header):
+    timings = {}
+    for entry in header.split(", "):
+        name, duration = entry.split(";")[:2]
+        timings[name] = float(duration.removeprefix("dur="))
+    return timings
+
+
+@override_settings(METRICS={"SAMPLE_RATE": 1.0})
+class MetricsTests(APITestCase):
+
+    def setUp(self):
+        get_response_cache().clear()
+        metrics.registry.clear()
+        self.user = CustomUser.objects.create_user(
+            username="testuser1",
+            email="testuser1@example.com",
+            password="Testpassword",
+            author_pseudonym="testpseudonym",
+        )
+        Book.objects.create(
+            title="Book One", description="Description", author=self.user, price="10.00"
+        )
+
+    def test_sampled_requests_report_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("books_list"))
+        header = response["Server-Timing"]
+        self.assertIn(f'desc="{len(queries)} queries"', header)
+        timings = parse_server_timing(header)
+        self.assertEqual(list(timings), ["db", "auth", "serialize", "render", "total"])
+        self.assertGreater(timings["db"], 0)
+        self.assertGreater(timings["serialize"], 0)
+        self.assertGreater(timings["render"], 0)
+        self.assertGreaterEqual(timings["total"], timings["db"] + timings["render"])
+
+        response = self.client.post(
+            reverse("token_obtain_pair"), {"username": "testuser1", "password": "Testpassword"}
+        )
+        self.assertGreater(parse_server_timing(response["Server-Timing"])["auth"], 0)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse("books_list"))
+        with override_settings(METRICS={"SAMPLE_RATE": 0.0}):
+            response = self.client.get(reverse("books_list"), {"page_size": 10})
+        self.assertNotIn("Server-Timing", response)
+
+        with override_settings(METRICS={"TOKEN": "secret"}):
+            response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response["Content-Type"], metrics.PROMETHEUS_CONTENT_TYPE)
+        content = response.content.decode()
+        view = 'view="AsyncBookListView"' if settings.ASYNC_VIEWS else 'view="BookListView"'
+        self.assertIn(f'book_store_requests_total{{{view},method="GET",status="200"}} 2.0', content)
+        self.assertIn(f"book_store_sampled_requests_total{{{view}}} 1.0", content)
+        self.assertIn(f'book_store_request_duration_seconds_bucket{{{view},le="+Inf"}} 2', content)
+        self.assertIn(f'book_store_phase_duration_seconds_count{{{view},phase="db"}} 1', content)
+        self.assertIn(f"book_store_response_size_bytes_count{{{view}}} 1", content)
+
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 404)
+
+    def test_metrics_endpoint_requires_token_or_staff(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+        with override_settings(METRICS={"TOKEN": "secret"}):
+            for authorization in ["", "Bearer wrong", "Basic secret"]:
+                response = self.client.get(
+                    reverse("metrics"), HTTP_AUTHORIZATION=authorization
+                )
+                self.assertEqual(response.status_code, 404)
+            response = self.client.get(
+                reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret", REMOTE_ADDR="10.0.0.1"
+            )
+            self.assertEqual(response.status_code, 404)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+
+THROTTLING = {
+    "ENABLED": True,
+    "STORE": "memory",
+    "RATES": {
+        "anon": {"CAPACITY": 10, "REFILL_RATE": 0.001},
+        "user": {"CAPACITY": 20, "REFILL_RATE": 0.001},
+        "auth": {"CAPACITY": 2, "REFILL_RATE": 0.001},
+    },
+    "COSTS": {"default": 1, "detail": 1, "list": 2, "search": 5, "export": 20, "bulk": 1},
+}
+
+
+@override_settings(THROTTLING=THROTTLING)
+class ThrottlingTests(APITestCase):
+
+    def setUp(self):
+        get_response_cache().clear()
+        throttling.get_throttle_store().clear()
+        self.user = CustomUser.objects.create_user(
+            username="testuser1", email="testuser1@example.com", password="Testpassword"
+        )
+        self.book = Book.objects.create(
+            title="Book One", description="Description", author=self.user, price="10.00"
+        )
+
+    def test_requests_take_tokens_by_cost(self):
+        for _ in range(2):
+            response = self.client.get(reverse("books_list"), {"search": "book"})
+            self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse("books_list"))
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 1000)
+
+        # The bucket is per address.
+        response = self.client.get(reverse("books_list"), REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 200)
+
+        # Authenticated users have their own, larger bucket.
+        token = CustomRefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        for _ in range(20):
+            response = self.client.get(reverse("books_details", args=[self.book.id]))
+            self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse("books_details", args=[self.book.id]))
+        self.assertEqual(response.status_code, 429)
+
+    def test_bulk_requests_take_tokens_by_operation(self):
+        token = CustomRefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        response = self.client.post(
+            reverse("auth_books_bulk"), {"delete": list(range(1000, 1015))}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            reverse("auth_books_bulk"), {"delete": list(range(1000, 1006))}, format="json"
+        )
+        self.assertEqual(response.status_code, 429)
+        # The 5 tokens left are enough for smaller requests.
+        response = self.client.post(
+            reverse("auth_books_bulk"), {"delete": list(range(1000, 1005))}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("books_details", args=[self.book.id]))
+        self.assertEqual(response.status_code, 429)
+
+    def test_forwarded_for_header_does_not_pick_the_bucket(self):
+        statuses = [
+            self.client.post(
+                reverse("signup"), {}, HTTP_X_FORWARDED_FOR=f"203.0.113.{index}"
+            ).status_code
+            for index in range(3)
+        ]
+        self.assertEqual(statuses, [400, 400, 429])
+
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "NUM_PROXIES": 1}):
+            response = self.client.post(
+                reverse("signup"), {}, HTTP_X_FORWARDED_FOR="203.0.113.9"
+            )
+        self.assertEqual(response.status_code, 400)
+
+    def test_auth_endpoints_share_a_bucket(self):
+        credentials = {"username": "testuser1", "password": "Testpassword"}
+        response = self.client.post(reverse("token_obtain_pair"), credentials)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse("signup"), {})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse("token_obtain_pair"), credentials)
+        self.assertEqual(response.status_code, 429)
+        # Other endpoints are unaffected.
+        self.assertEqual(self.client.get(reverse("books_list")).status_code, 200)
+
+    def test_sqlite_store_is_shared(self):
+        path = os.path.join(tempfile.mkdtemp(), "throttle.sqlite3")
+        options = {**THROTTLING, "SQLITE_PATH": path}
+        # Two stores on one database act like two worker processes.
+        first = throttling.SQLiteBucketStore(options)
+        second = throttling.SQLiteBucketStore(options)
+        self.assertEqual(first.consume("anon:ip:10.0.0.1", 6, 10, 0.001), 0)
+        self.assertGreater(second.consume("anon:ip:10.0.0.1", 6, 10, 0.001), 0)
+        self.assertEqual(second.consume("anon:ip:10.0.0.1", 4, 10, 0.001), 0)
+        self.assertEqual(first.consume("anon:ip:10.0.0.2", 10, 10, 0.001), 0)
+
+        with override_settings(THROTTLING=options | {"STORE": "sqlite"}):
+            response = self.client.get(reverse("books_list"), REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 429)
+
+    async def test_async_views_check_throttles_off_the_sync_thread(self):
+        path = os.path.join(tempfile.mkdtemp(), "throttle.sqlite3")
+        options = {**THROTTLING, "STORE": "sqlite", "SQLITE_PATH": path}
+        threads = []
+        consume = throttling.SQLiteBucketStore.consume
+
+        def record_thread(store, *args):
+            threads.append(threading.current_thread())
+            return consume(store, *args)
+
+        view = AsyncBookListView.as_view()
+        factory = AsyncRequestFactory()
+        with (
+            override_settings(THROTTLING=options),
+            mock.patch.object(throttling.SQLiteBucketStore, "consume", record_thread),
+        ):
+            statuses = [(await view(factory.get("/books/"))).status_code for _ in range(6)]
+        self.assertEqual(statuses, [200] * 5 + [429])
+        self.assertEqual(len(threads), 6)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_memory_store_refills(self):
+        store = throttling.MemoryBucketStore(THROTTLING | {"MAX_ENTRIES": 10})
+        self.assertEqual(store.consume("key", 10, 10, 1000.0), 0)
+        time.sleep(0.01)
+        self.assertEqual(store.consume("key", 5, 10, 1000.0), 0)
+
+
+@override_settings(ALLOWED_HOSTS=["localhost"])
+class BenchmarkTests(APITestCase):
+
+    def test_parse_volume(self):
+        self.assertEqual(parse_volume("10k"), 10_000)
+        self.assertEqual(parse_volume("1M"), 1_000_000)
+        self.assertEqual(parse_volume("250"), 250)
+
+    def test_seed_and_run_in_process(self):
+        self.assertTrue(seed(users=3, books=12, batch_size=5))
+        self.assertFalse(seed(users=3, books=12))
+        self.assertEqual(Book.objects.filter(author__username="bench0").count(), 4)
+
+        results = run_in_process(
+            ["books_list", "books_details", "auth_books", "token"], ["json", "xml"], 3, warmup=1
+        )
+        self.assertEqual(len(results), 8)
+        for result in results.values():
+            self.assertEqual(result["requests"], 3)
+            self.assertEqual(result["errors"], 0)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+        self.assertGreater(results["books_details:json"]["queries_per_request"], 0)
+
+    def test_compare_results(self):
+        baseline = {"results": {"books_list:json": {"p95_ms": 10.0}, "signup:json": {"p95_ms": 5.0}}}
+        current = {"results": {"books_list:json": {"p95_ms": 12.0}, "signup:json": {"p95_ms": 5.1}}}
+        rows = compare_results(baseline, current, threshold=0.1)
+        self.assertEqual([row[0] for row in rows if row[4]], ["books_list:json"])
+
+
+class RendererTests(APITestCase):
+
+    data = {
+        "results": [
+            {"title": "Ünïcode \u2028 <b>&</b>", "price": Decimal("9.99"), "tags": ["a", None]},
+            {"updated_at": datetime(2024, 1, 2, 3, 4, 5, 6000, tzinfo=dt_timezone.utc)},
+            {"empty": "", "count": 0, "flag": True, "nested": {"list": [[1, 2], []]}},
+        ],
+        "next": None,
+    }
+
+    def test_fast_json_renderer_matches_json_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertEqual(FastJSONRenderer().render({1: 2**70}), JSONRenderer().render({1: 2**70}))
+        indented = FastJSONRenderer().render(self.data, "application/json; indent=2")
+        self.assertEqual(indented, JSONRenderer().render(self.data, "application/json; indent=2"))
+
+    def test_fast_json_renderer_formats_floats_like_orjson(self):
+        data = {"large": 1e16, "small": 1.5e-7, "plain": 0.1}
+        fast, stock = FastJSONRenderer().render(data), JSONRenderer().render(data)
+        self.assertEqual(fast, b'{"large":1e16,"small":1.5e-7,"plain":0.1}')
+        self.assertEqual(stock, b'{"large":1e+16,"small":1.5e-07,"plain":0.1}')
+        self.assertEqual(FastJSONRenderer().render({"nan": float("nan")}), b'{"nan":null}')
+        with self.assertRaises(ValueError):
+            JSONRenderer().render({"nan": float("nan")})
+
+    def test_streaming_xml_renderer_matches_xml_renderer(self):
+        renderer = StreamingXMLRenderer()
+        self.assertEqual(renderer.render(self.data), XMLRenderer().render(self.data))
+        items = self.data["results"]
+        self.assertEqual(renderer.render(items), XMLRenderer().render(items))
+        self.assertEqual(len(list(renderer.iter_list(items))), len(items) + 2)
+        with self.assertRaises(UnserializableContentError):
+            renderer.render({"title": "\x07"})
+
+
+class AsyncViewTests(APITestCase):
+
+    def setUp(self):
+        get_response_cache().clear()
+        self.factory = AsyncRequestFactory()
+        self.user = CustomUser.objects.create(
+            username="testuser1",
+            email="testuser1@example.com",
+            password="Testpassword",
+            author_pseudonym="testpseudonym",
+        )
+        self.book = Book.objects.create(
+            title="Book One",
+            description="Description for book one",
+            author=self.user,
+            price="10.00",
+        )
+        token = CustomRefreshToken.for_user(self.user).access_token
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    def test_views_are_async(self):
+        for view in (AsyncBookListView, AsyncBookDetailView, AsyncManageUserBooksView):
+            self.assertTrue(view.view_is_async)
+
+    async def test_async_book_list_and_conditional_get(self):
+        view = AsyncBookListView.as_view()
+        response = await view(self.factory.get("/books/"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["results"][0]["title"], "Book One")
+
+        request = self.factory.get("/books/", headers={"If-None-Match": response["ETag"]})
+        response = await view(request)
+        self.assertEqual(response.status_code, 304)
+
+    async def test_async_book_detail(self):
+        view = AsyncBookDetailView.as_view()
+        response = await view(self.factory.get("/books/"), book_id=self.book.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["author"]["username"], "testuser1")
+
+        response = await view(self.factory.get("/books/"), book_id=0)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_async_cached_response_is_detached(self):
+        view = AsyncBookDetailView.as_view()
+        first = await view(self.factory.get("/books/"), book_id=self.book.pk)
+        cached = await view(self.factory.get("/books/"), book_id=self.book.pk)
+        self.assertIsInstance(cached, CachedHttpResponse)
+        self.assertEqual(cached.content, first.content)
+        self.assertEqual(cached.data["title"], "Book One")
+
+    async def test_async_user_books_with_token_user(self):
+        view = AsyncManageUserBooksView.as_view()
+        request = self.factory.get("/user_books/", headers=self.headers)
+        response = await view(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)["results"]), 1)
+
+    async def test_async_user_books_writes(self):
+        view = AsyncManageUserBooksView.as_view()
+        request = self.factory.post(
+            "/user_books/",
+            {"title": "New Book", "description": "Description", "price": "9.99"},
+            headers=self.headers,
+        )
+        response = await view(request)
+        self.assertEqual(response.status_code, 201)
+        book_id = json.loads(response.content)["id"]
+
+        request = self.factory.patch(
+            "/user_books/",
+            json.dumps({"price": "19.99"}),
+            content_type="application/json",
+            headers={**self.headers, "If-Match": '"outdated"'},
+        )
+        response = await view(request, book_id=book_id)
+        self.assertEqual(response.status_code, 412)
+
+        request = self.factory.delete("/user_books/", headers=self.headers)
+        response = await view(request, book_id=book_id)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(await Book.objects.filter(pk=book_id).aexists())
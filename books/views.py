@@ -1,14 +1,33 @@
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
-from .serializers import BookSerializer
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from .serializers import BookBulkSerializer, BookRowSerializer, BookSerializer
 from .models import Book
-from django.db.models import Q
-from rest_framework.renderers import JSONRenderer
-from rest_framework_xml.renderers import XMLRenderer
 from .permissions import IsNotDathVader
+from users.authentication import get_model_user
+from .renderers import FastJSONRenderer, NDJSONRenderer, StreamingXMLRenderer
+from .export import EXPORTERS, aiter_export
+from .fieldsets import BookFieldset
+from .catalogue import get_catalogue
+from .cleanup import get_file_names, schedule_file_deletion, set_variant_references
+from .covers import schedule_cover_processing
+from .pagination import BookCursorPagination, SearchCursorPagination
+from .search import get_search_backend
+from .cache import (
+    AUTHORS_GENERATION_KEY,
+    cache_response,
+    get_detail_generation_key,
+    get_list_generation_key,
+    invalidate_books,
+)
+from .conditional import book_condition, book_list_condition, lock_book, set_book_validators
+from django.utils.decorators import method_decorator
 
 
 class BookListView(APIView):
@@ -19,43 +38,61 @@ class BookListView(APIView):
 
     Attributes:
     - permission_classes: List of permission classes allowed to access this view (AllowAny in this case).
-    - renderer_classes: List of renderer classes to render the response in JSON or XML format.
+    - replica_reads: Whether anonymous reads may be served from a replica (see books/routers.py).
 
     Methods:
+    - get_throttle_cost(self, request): Names the throttle cost, searches cost more than listings.
     - get(self, request): Retrieves a list of books or filtered books based on search query.
     """
 
     permission_classes = [AllowAny]
-    renderer_classes = [JSONRenderer, XMLRenderer]
+    replica_reads = True
 
+    def get_throttle_cost(self, request):
+        return "search" if request.query_params.get("search") else "list"
+
+    @method_decorator(book_list_condition)
+    @cache_response(get_list_generation_key)
     def get(self, request):
         """
         GET method for retrieving a list of books.
 
         This method retrieves all books or filters books based on the 'search' query parameter.
-        - If 'search' query parameter is provided, it filters books by title or description.
-        - If no 'search' query parameter is provided, it retrieves all books.
+        - If 'search' query parameter is provided, it runs a full-text search on title and description
+          and returns the matching books ranked by relevance, paginated with SearchCursorPagination.
+        - If no 'search' query parameter is provided, it retrieves all books, paginated with BookCursorPagination.
+        Both paginators accept the 'cursor' and 'page_size' query parameters.
+        The 'fields' and 'expand' query parameters select the rendered fields, see BookFieldset.
+        With the catalogue store enabled, pages are read from memory instead (see books/catalogue.py).
+        Rendered responses are cached per URL and renderer until a book or author changes.
+        Requests with a matching If-None-Match or If-Modified-Since header get a 304 response.
 
         Args:
         - request: The HTTP request object.
 
         Returns:
-        - Response: A JSON or XML response containing serialized book data.
+        - Response: A JSON or XML response containing a page of serialized book data
+                    together with the next and previous page links.
         """
 
-        books = Book.objects.all()
+        fieldset = BookFieldset.from_request(request)
         search_query = request.query_params.get("search", None)
-        if search_query:
-            filterd_books = books.filter(
-                Q(title__icontains=search_query)
-                | Q(description__icontains=search_query)
+        paginator = SearchCursorPagination() if search_query else BookCursorPagination()
+        catalogue = get_catalogue(request)
+        page = None
+        if catalogue is not None:
+            page = catalogue.paginate(paginator, search_query, request, self)
+        if page is None and search_query:
+            books = Book.objects.as_rows(fieldset.get_row_fields())
+            page = paginator.paginate_search(
+                get_search_backend(books.db), search_query, books, request
             )
-            serializer = BookSerializer(filterd_books, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-
-        else:
-            serializer = BookSerializer(books, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        elif page is None:
+            ordering = paginator.get_ordering(request, None, self)
+            books = Book.objects.as_rows(fieldset.get_row_fields(ordering))
+            page = paginator.paginate_queryset(books, request, view=self)
+        serializer = BookRowSerializer(page, many=True, fieldset=fieldset)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class BookDetailView(APIView):
@@ -66,19 +103,27 @@ class BookDetailView(APIView):
 
     Attributes:
     - permission_classes: List of permission classes allowed to access this view (AllowAny in this case).
+    - replica_reads: Whether anonymous reads may be served from a replica (see books/routers.py).
+    - throttle_cost: The throttle cost of a request (see book_store/throttling.py).
 
     Methods:
     - get(self, request, book_id): Retrieves details of a book identified by its ID.
     """
 
     permission_classes = [AllowAny]
-    renderer_classes = [JSONRenderer, XMLRenderer]
+    replica_reads = True
+    throttle_cost = "detail"
 
+    @method_decorator(book_condition)
+    @cache_response(get_detail_generation_key, AUTHORS_GENERATION_KEY)
     def get(self, request, book_id):
         """
         GET method for retrieving details of a book.
 
         This method retrieves details of a specific book identified by its ID.
+        The 'fields' and 'expand' query parameters select the rendered fields, see BookFieldset.
+        Rendered responses are cached per URL and renderer until the book or its author changes.
+        Requests with a matching If-None-Match or If-Modified-Since header get a 304 response.
 
         Args:
         - request: The HTTP request object.
@@ -88,12 +133,58 @@ class BookDetailView(APIView):
         - Response: A JSON response containing serialized book data.
         """
 
-        book = get_object_or_404(Book, pk=book_id)
-        serializer = BookSerializer(book)
+        fieldset = BookFieldset.from_request(request)
+        book = get_object_or_404(fieldset.narrow(Book.objects.all()), pk=book_id)
+        serializer = BookSerializer(book, fieldset=fieldset)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class BookExportView(APIView):
+    """
+    API view for exporting the full catalogue.
+
+    This view supports GET requests streaming every book as newline delimited JSON,
+    as a JSON array or as XML. The format is negotiated like for the other views,
+    from the Accept header or the 'format' query parameter ('ndjson', 'json' or 'xml').
+
+    Attributes:
+    - permission_classes: List of permission classes allowed to access this view (AllowAny in this case).
+    - renderer_classes: List of renderer classes used to negotiate the export format.
+    - throttle_cost: The throttle cost of a request (see book_store/throttling.py).
+
+    Methods:
+    - get(self, request): Streams all books in the negotiated format.
+    """
+
+    permission_classes = [AllowAny]
+    throttle_cost = "export"
+    renderer_classes = [NDJSONRenderer, FastJSONRenderer, StreamingXMLRenderer]
+
+    def get(self, request):
+        """
+        GET method for exporting all books.
+
+        This method streams the books with StreamingHttpResponse while reading them from
+        the database in chunks, so memory use does not depend on the size of the catalogue.
+        Under ASGI the chunks are streamed from an async iterator, see aiter_export().
+
+        Args:
+        - request: The HTTP request object.
+
+        Returns:
+        - StreamingHttpResponse: The streamed NDJSON, JSON or XML document.
+        """
+
+        renderer = request.accepted_renderer
+        chunks = EXPORTERS[renderer.format](Book.objects.order_by("id"))
+        if isinstance(request._request, ASGIRequest):
+            chunks = aiter_export(chunks)
+        response = StreamingHttpResponse(chunks, content_type=request.accepted_media_type)
+        response["Content-Disposition"] = f'attachment; filename="books.{renderer.format}"'
+        return response
+
+
 class ManageUserBooksView(APIView):
     """
     API view for managing books of the authenticated user.
@@ -112,25 +203,34 @@ class ManageUserBooksView(APIView):
     """
 
     permission_classes = [IsNotDathVader]
-    renderer_classes = [JSONRenderer, XMLRenderer]
 
+    @method_decorator(book_list_condition)
     def get(self, request):
         """
         GET method for retrieving books authored by the authenticated user.
 
         This method retrieves books filtered by the authenticated user as author.
+        The result is paginated with BookCursorPagination ('cursor' and 'page_size' query parameters).
+        The 'fields' and 'expand' query parameters select the rendered fields, see BookFieldset.
+        Requests with a matching If-None-Match or If-Modified-Since header get a 304 response.
 
         Args:
         - request: The HTTP request object.
 
         Returns:
-        - Response: A JSON response containing serialized book data.
+        - Response: A JSON response containing a page of serialized book data
+                    together with the next and previous page links.
         """
 
-        books = Book.objects.filter(author=request.user)
-        serializer = BookSerializer(books, many=True)
+        fieldset = BookFieldset.from_request(request)
+        paginator = BookCursorPagination()
+        ordering = paginator.get_ordering(request, None, self)
+        books = Book.objects.filter(author_id=request.user.pk)
+        books = books.as_rows(fieldset.get_row_fields(ordering))
+        page = paginator.paginate_queryset(books, request, view=self)
+        serializer = BookRowSerializer(page, many=True, fieldset=fieldset)
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         """
@@ -147,17 +247,21 @@ class ManageUserBooksView(APIView):
 
         serializer = BookSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(author=request.user)
+            serializer.save(author=get_model_user(request.user))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @method_decorator(book_condition)
     def patch(self, request, book_id):
         """
         PATCH method for updating details of a book authored by the authenticated user.
 
         This method updates details of a specific book identified by its ID,
         authored by the authenticated user.
+        If an If-Match or If-Unmodified-Since header is sent and the book has changed
+        since, the update is rejected with a 412 response. The book is locked while it
+        is written, so of two requests sending the same tag only the first succeeds.
 
         Args:
         - request: The HTTP request object containing updated book data.
@@ -168,18 +272,23 @@ class ManageUserBooksView(APIView):
                     or errors if validation fails or book not found.
         """
 
-        book = get_object_or_404(Book, pk=book_id, author=request.user)
-        serializer = BookSerializer(book, data=request.data, partial=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            book = lock_book(request, Book.objects.with_author(), book_id)
+            serializer = BookSerializer(book, data=request.data, partial=True)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            book = serializer.save()
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+        return set_book_validators(response, request, book)
 
+    @method_decorator(book_condition)
     def delete(self, request, book_id):
         """
         DELETE method for deleting a book authored by the authenticated user.
 
         This method deletes a specific book identified by its ID, authored by the authenticated user.
+        If an If-Match or If-Unmodified-Since header is sent and the book has changed
+        since, the deletion is rejected with a 412 response.
 
         Args:
         - request: The HTTP request object.
@@ -189,9 +298,159 @@ class ManageUserBooksView(APIView):
         - Response: A JSON response indicating successful deletion of the book.
         """
 
-        book = get_object_or_404(Book, pk=book_id, author=request.user)
-        if book:
+        with transaction.atomic():
+            book = lock_book(request, Book.objects.all(), book_id)
             book.delete()
-            return Response(
-                {"message": "Book deleted."}, status=status.HTTP_204_NO_CONTENT
+        return Response({"message": "Book deleted."}, status=status.HTTP_204_NO_CONTENT)
+
+
+class ManageUserBooksBulkView(APIView):
+    """
+    API view for creating, updating and deleting many books of the authenticated user at once.
+
+    This view supports POST requests with lists of books to create, partial updates
+    and IDs of books to delete. All operations of a request are validated first and
+    then written in one transaction with bulk queries, so either all of them are
+    applied or none.
+
+    Attributes:
+    - permission_classes: List of permission classes allowed to access this view
+      (IsAuthenticated and IsNotDathVader in this case).
+    - bulk_batch_size: Number of rows written per INSERT or UPDATE query.
+    - throttle_cost: The throttle cost of an operation (see book_store/throttling.py).
+
+    Methods:
+    - get_throttle_units(self, request): Returns the number of operations of the request.
+    - post(self, request): Applies the operations of the request.
+    """
+
+    permission_classes = [IsAuthenticated, IsNotDathVader]
+    bulk_batch_size = 500
+    throttle_cost = "bulk"
+
+    def get_throttle_units(self, request):
+        data = request.data
+        if not isinstance(data, dict):
+            return 1
+        operations = [data.get(name) for name in ("create", "update", "delete")]
+        return max(1, sum(len(items) for items in operations if isinstance(items, list)))
+
+    def post(self, request):
+        """
+        POST method for applying bulk operations to books of the authenticated user.
+
+        This method validates every operation, the books to create and the updates
+        with BookSerializer, and checks that updated and deleted books belong to the
+        authenticated user. If any operation is invalid, nothing is written.
+
+        Args:
+        - request: The HTTP request object containing the 'create', 'update' and 'delete' lists.
+
+        Returns:
+        - Response: A JSON response with the result of every operation if successful,
+                    or the errors of every operation if validation fails.
+        """
+
+        bulk = BookBulkSerializer(data=request.data)
+        if not bulk.is_valid():
+            return Response(bulk.errors, status=status.HTTP_400_BAD_REQUEST)
+        creates = bulk.validated_data.get("create", [])
+        updates = bulk.validated_data.get("update", [])
+        deletes = bulk.validated_data.get("delete", [])
+
+        create_serializer = BookSerializer(data=creates, many=True)
+        create_valid = create_serializer.is_valid()
+
+        books = Book.objects.with_author().filter(author_id=request.user.pk)
+        owned = books.in_bulk([item["id"] for item in updates] + deletes)
+        update_serializers = []
+        update_errors = []
+        for item in updates:
+            book = owned.get(item["id"])
+            if book is None:
+                update_serializers.append(None)
+                update_errors.append({"id": ["No Book matches the given query."]})
+                continue
+            serializer = BookSerializer(book, data=item, partial=True)
+            update_serializers.append(serializer)
+            update_errors.append({} if serializer.is_valid() else serializer.errors)
+        delete_errors = [
+            {} if book_id in owned else {"id": ["No Book matches the given query."]}
+            for book_id in deletes
+        ]
+
+        if not create_valid or any(update_errors) or any(delete_errors):
+            errors = {
+                "create": create_serializer.errors if not create_valid else [{} for _ in creates],
+                "update": update_errors,
+                "delete": delete_errors,
+            }
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        author = get_model_user(request.user) if creates else None
+        with transaction.atomic():
+            created = Book.objects.bulk_create(
+                [
+                    Book(author=author, **validated_data)
+                    for validated_data in create_serializer.validated_data
+                ],
+                batch_size=self.bulk_batch_size,
             )
+            updated = self.bulk_update_books(update_serializers)
+            if deletes:
+                books.filter(id__in=deletes).delete()
+            invalidate_books([book.pk for book in created + updated])
+            for book in created:
+                schedule_cover_processing(book)
+
+        return Response(
+            {
+                "create": BookSerializer(created, many=True).data,
+                "update": BookSerializer(updated, many=True).data,
+                "delete": [{"id": book_id} for book_id in deletes],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    def bulk_update_books(self, serializers):
+        """
+        Writes validated partial updates with bulk UPDATE queries.
+
+        bulk_update bypasses Book.save, so the version and update time are set and
+        uploaded covers are stored here.
+
+        Args:
+        - serializers: The validated BookSerializer instances of the updates.
+
+        Returns:
+        - list: The updated Book instances.
+        """
+
+        if not serializers:
+            return []
+
+        now = timezone.now()
+        fields = {"version", "updated_at"}
+        books = []
+        for serializer in serializers:
+            book = serializer.instance
+            new_cover = "cover_image" in serializer.validated_data
+            if new_cover:
+                schedule_file_deletion(get_file_names(book))
+                if book.cover_variants:
+                    set_variant_references(book.pk, {})
+                book.cover_variants = {}
+                fields.add("cover_variants")
+            for field, value in serializer.validated_data.items():
+                setattr(book, field, value)
+                fields.add(field)
+            if new_cover:
+                # Stores the uploaded file, which Book.save would otherwise do.
+                Book._meta.get_field("cover_image").pre_save(book, add=False)
+                schedule_cover_processing(book)
+            book.version += 1
+            book.updated_at = now
+            books.append(book)
+
+        Book.objects.bulk_update(books, fields, batch_size=self.bulk_batch_size)
+        return books
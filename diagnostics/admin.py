@@ -0,0 +1,127 @@
+import json
+from django.contrib import admin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+from .models import ProfileReport, SlowQuery
+from .profiling import get_profiler_class
+
+
+class ReadOnlyAdmin(admin.ModelAdmin):
+    """
+    Admin for entries written by the diagnostics, which may be viewed and deleted only.
+    """
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class SlowQuery_Admin(ReadOnlyAdmin):
+    list_display = ("created_at", "duration_ms", "alias", "method", "path", "short_sql")
+    list_filter = ("alias", "method")
+    search_fields = ("sql", "path")
+    date_hierarchy = "created_at"
+    fields = ("created_at", "duration_ms", "alias", "method", "path", "formatted_sql", "params")
+    readonly_fields = fields
+
+    @admin.display(description="SQL")
+    def short_sql(self, obj):
+        return obj.sql[:120]
+
+    @admin.display(description="SQL")
+    def formatted_sql(self, obj):
+        return format_html("<pre>{}</pre>", obj.sql)
+
+
+class ProfileReport_Admin(ReadOnlyAdmin):
+    list_display = (
+        "created_at",
+        "method",
+        "path",
+        "status_code",
+        "duration_ms",
+        "query_count",
+        "query_time_ms",
+        "user",
+        "download_link",
+    )
+    list_filter = ("profiler", "method", "status_code")
+    search_fields = ("path",)
+    date_hierarchy = "created_at"
+    fields = (
+        "created_at",
+        "user",
+        "method",
+        "path",
+        "status_code",
+        "duration_ms",
+        "query_count",
+        "query_time_ms",
+        "profiler",
+        "download_link",
+        "formatted_profile",
+        "formatted_queries",
+    )
+    readonly_fields = fields
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer("profile_data")
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:report_id>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="diagnostics_profilereport_download",
+            ),
+            *super().get_urls(),
+        ]
+
+    def download_view(self, request, report_id):
+        """
+        Returns the profile of a report as a file download.
+        """
+
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        report = get_object_or_404(ProfileReport, pk=report_id)
+        profiler = get_profiler_class(report.profiler)
+        response = HttpResponse(bytes(report.profile_data), content_type=profiler.content_type)
+        response["Content-Disposition"] = (
+            f'attachment; filename="profile-{report.pk}.{profiler.extension}"'
+        )
+        return response
+
+    @admin.display(description="Profile")
+    def download_link(self, obj):
+        url = reverse("admin:diagnostics_profilereport_download", args=[obj.pk])
+        return format_html('<a href="{}">Download</a>', url)
+
+    @admin.display(description="Summary")
+    def formatted_profile(self, obj):
+        return format_html("<pre>{}</pre>", obj.profile_text)
+
+    @admin.display(description="Queries")
+    def formatted_queries(self, obj):
+        return format_html_join(
+            "\n",
+            "<p>{} ms on {}</p><pre>{}</pre><p>Parameters: {}</p><pre>{}</pre>",
+            (
+                (
+                    query["duration_ms"],
+                    query["alias"],
+                    query["sql"],
+                    json.dumps(query["params"]),
+                    query.get("explain") or query.get("explain_error", ""),
+                )
+                for query in obj.queries
+            ),
+        )
+
+
+admin.site.register(SlowQuery, SlowQuery_Admin)
+admin.site.register(ProfileReport, ProfileReport_Admin)
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class DiagnosticsConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "diagnostics"
+
+    def ready(self):
+        from book_store.metrics import add_query_observer
+        from .queries import observe_query
+
+        add_query_observer(observe_query)
@@ -0,0 +1,184 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+from django.urls import reverse
+from rest_framework.exceptions import APIException
+from book_store.metrics import install_query_recorder
+from users.authentication import CustomJWTAuthentication, get_model_user
+from users.models import CustomUser
+from .models import ProfileReport
+from .profiling import PROFILERS, explain_queries, get_profiler
+from .queries import (
+    captured_queries,
+    current_request,
+    get_diagnostics_settings,
+)
+
+
+def get_staff_user(request):
+    """
+    Returns the active staff member making a request, if any.
+
+    Staff members are recognized by their admin session or by the access
+    token of the request.
+
+    Args:
+    - request: The HTTP request object.
+
+    Returns:
+    - CustomUser | None: The staff member, None for everyone else.
+    """
+
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        try:
+            result = CustomJWTAuthentication().authenticate(request)
+            user = get_model_user(result[0]) if result is not None else None
+        except (APIException, CustomUser.DoesNotExist):
+            return None
+    if user is None or not user.is_active or not user.is_staff:
+        return None
+    return user
+
+
+class DiagnosticsMiddleware:
+    """
+    Middleware profiling requests of staff members on demand.
+
+    A request is profiled when it has the PROFILE_HEADER header or the
+    PROFILE_PARAM query parameter, e.g. '?profile=1', and is made by a staff
+    member. The value may name the profiler, 'cprofile' or 'pyinstrument' if
+    it is installed. The profile and every SQL query of the request, with its
+    EXPLAIN output, are stored as a ProfileReport. The response carries its
+    ID in an X-Profile-Id header and the admin URL to download the profile in
+    X-Profile-Url. Requests of everyone else are handled as if the flag was
+    not there.
+
+    Async requests are profiled as well, but cProfile only sees the event
+    loop thread, not the queries run in worker threads.
+
+    Also tells the slow-query log which request a query belongs to. Must come
+    after AuthenticationMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = current_request.set((request.method, request.get_full_path()))
+        try:
+            profiler_name = self.get_profiler_name(request)
+            if profiler_name is None:
+                return self.get_response(request)
+            user = get_staff_user(request)
+            if user is None:
+                return self.get_response(request)
+
+            profiler, queries, queries_token = self.start_profile(profiler_name)
+            start = time.perf_counter()
+            try:
+                response = self.get_response(request)
+            finally:
+                duration = time.perf_counter() - start
+                profiler.stop()
+                captured_queries.reset(queries_token)
+            report = self.save_report(request, response, user, profiler, queries, duration)
+            return self.add_headers(response, report)
+        finally:
+            current_request.reset(token)
+
+    async def __acall__(self, request):
+        token = current_request.set((request.method, request.get_full_path()))
+        try:
+            profiler_name = self.get_profiler_name(request)
+            if profiler_name is None:
+                return await self.get_response(request)
+            user = await sync_to_async(get_staff_user)(request)
+            if user is None:
+                return await self.get_response(request)
+
+            profiler, queries, queries_token = self.start_profile(profiler_name)
+            start = time.perf_counter()
+            try:
+                response = await self.get_response(request)
+            finally:
+                duration = time.perf_counter() - start
+                profiler.stop()
+                captured_queries.reset(queries_token)
+            report = await sync_to_async(self.save_report)(
+                request, response, user, profiler, queries, duration
+            )
+            return self.add_headers(response, report)
+        finally:
+            current_request.reset(token)
+
+    def get_profiler_name(self, request):
+        """
+        Returns the profiler a request asks for.
+
+        Returns:
+        - str | None: The name of the profiler, None unless profiling was asked for.
+        """
+
+        options = get_diagnostics_settings()
+        value = request.headers.get(options["PROFILE_HEADER"])
+        if value is None:
+            value = request.GET.get(options["PROFILE_PARAM"])
+        if value is None or value.lower() in ("0", "false", "no"):
+            return None
+        return value.lower() if value.lower() in PROFILERS else options["PROFILER"]
+
+    def start_profile(self, profiler_name):
+        # Connections opened before the first profiled request have no recorder yet.
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection=connection)
+        queries = []
+        queries_token = captured_queries.set(queries)
+        profiler = get_profiler(profiler_name)
+        profiler.start()
+        return profiler, queries, queries_token
+
+    def save_report(self, request, response, user, profiler, queries, duration):
+        """
+        Stores the profile of a request and deletes the oldest beyond MAX_PROFILE_REPORTS.
+
+        Returns:
+        - ProfileReport: The stored report.
+        """
+
+        options = get_diagnostics_settings()
+        report = ProfileReport.objects.create(
+            user=user,
+            method=request.method,
+            path=request.get_full_path()[:2000],
+            status_code=response.status_code,
+            duration_ms=duration * 1000,
+            query_count=len(queries),
+            query_time_ms=sum(query["duration_ms"] for query in queries),
+            profiler=profiler.name,
+            profile_text=profiler.get_text(options["PROFILE_LINES"]),
+            profile_data=profiler.get_data(),
+            queries=explain_queries(queries, options["EXPLAIN"]),
+        )
+        limit = options["MAX_PROFILE_REPORTS"]
+        oldest_kept = ProfileReport.objects.order_by("-id").values_list("id", flat=True)[
+            limit - 1 : limit
+        ]
+        if oldest_kept:
+            ProfileReport.objects.filter(id__lt=oldest_kept[0]).delete()
+        return report
+
+    def add_headers(self, response, report):
+        response["X-Profile-Id"] = str(report.pk)
+        response["X-Profile-Url"] = reverse(
+            "admin:diagnostics_profilereport_download", args=[report.pk]
+        )
+        return response
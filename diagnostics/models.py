@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.db import models
+
+
+class SlowQuery(models.Model):
+    """
+    A query that took longer than the SLOW_QUERY_MS threshold.
+
+    Written in the background by diagnostics.queries.SlowQueryLog. The request
+    fields are empty for queries made outside of requests, e.g. by commands.
+    The parameters are stored as their types unless LOG_PARAMS is set.
+    """
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    duration_ms = models.FloatField()
+    alias = models.CharField(max_length=100)
+    sql = models.TextField()
+    params = models.JSONField(default=list, blank=True)
+    method = models.CharField(max_length=10, blank=True)
+    path = models.CharField(max_length=2000, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name_plural = "slow queries"
+
+    def __str__(self):
+        return f"{self.duration_ms:.0f} ms: {self.sql[:80]}"
+
+
+class ProfileReport(models.Model):
+    """
+    The profile and queries of a request profiled on demand by a staff member.
+
+    Attributes:
+    - profiler: The profiler used, 'cprofile' or 'pyinstrument'.
+    - profile_text: The readable summary of the profile.
+    - profile_data: The downloadable profile, a pstats dump or pyinstrument HTML.
+    - queries: The queries of the request, with their duration and EXPLAIN output.
+    """
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL, related_name="+"
+    )
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    query_time_ms = models.FloatField()
+    profiler = models.CharField(max_length=20)
+    profile_text = models.TextField()
+    profile_data = models.BinaryField()
+    queries = models.JSONField(default=list)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
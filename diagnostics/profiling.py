@@ -0,0 +1,174 @@
+import cProfile
+import io
+import marshal
+import pstats
+from django.db import connections, transaction
+from .queries import log_params, logging_enabled
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+
+class CProfileProfiler:
+    """
+    Profiles a request with cProfile.
+
+    The profile is stored as a pstats dump, which can be loaded with
+    pstats.Stats or viewers like snakeviz.
+
+    Methods:
+    - start(self): Starts profiling.
+    - stop(self): Stops profiling.
+    - get_text(self, lines): Returns the functions with the highest cumulative time.
+    - get_data(self): Returns the pstats dump.
+    """
+
+    name = "cprofile"
+    extension = "prof"
+    content_type = "application/octet-stream"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def get_text(self, lines):
+        output = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=output)
+        stats.strip_dirs().sort_stats("cumulative").print_stats(lines)
+        return output.getvalue()
+
+    def get_data(self):
+        return marshal.dumps(pstats.Stats(self.profile).stats)
+
+
+class PyinstrumentProfiler:
+    """
+    Profiles a request with pyinstrument, if it is installed.
+
+    The profile is stored as pyinstrument's interactive HTML page.
+
+    Methods:
+    - start(self): Starts profiling.
+    - stop(self): Stops profiling.
+    - get_text(self, lines): Returns the call tree as text.
+    - get_data(self): Returns the HTML page.
+    """
+
+    name = "pyinstrument"
+    extension = "html"
+    content_type = "text/html"
+
+    def __init__(self):
+        self.profiler = pyinstrument.Profiler(async_mode="enabled")
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def get_text(self, lines):
+        return self.profiler.output_text(unicode=True)
+
+    def get_data(self):
+        return self.profiler.output_html().encode()
+
+
+PROFILERS = {CProfileProfiler.name: CProfileProfiler}
+if pyinstrument is not None:
+    PROFILERS[PyinstrumentProfiler.name] = PyinstrumentProfiler
+
+# Every profiler by name, including those not installed here, so stored reports
+# are served in their own format.
+PROFILER_CLASSES = {
+    profiler.name: profiler for profiler in (CProfileProfiler, PyinstrumentProfiler)
+}
+
+
+def get_profiler(name):
+    """
+    Returns a new profiler by name.
+
+    Args:
+    - name: The name of the profiler, see PROFILERS.
+
+    Returns:
+    - CProfileProfiler | PyinstrumentProfiler: The profiler, cProfile for unknown names.
+    """
+
+    return PROFILERS.get(name, CProfileProfiler)()
+
+
+def get_profiler_class(name):
+    """
+    Returns the profiler class that wrote a stored profile.
+
+    Unlike get_profiler(), this works for profilers that are not installed,
+    e.g. for pyinstrument reports copied from another machine.
+
+    Args:
+    - name: The profiler field of a ProfileReport.
+
+    Returns:
+    - type: The profiler class, CProfileProfiler for unknown names.
+    """
+
+    return PROFILER_CLASSES.get(name, CProfileProfiler)
+
+
+def explain_queries(queries, explain=True):
+    """
+    Prepares the captured queries of a request for a ProfileReport.
+
+    The SELECT queries are explained on the connection that ran them.
+    Queries that cannot be explained keep the error instead.
+
+    Args:
+    - queries: The queries captured by diagnostics.queries.observe_query().
+    - explain: Whether to run EXPLAIN.
+
+    Returns:
+    - list: The queries, as dicts with JSON serializable values.
+    """
+
+    token = logging_enabled.set(False)
+    try:
+        return [explain_query(query, explain) for query in queries]
+    finally:
+        logging_enabled.reset(token)
+
+
+def explain_query(query, explain):
+    entry = {
+        "alias": query["alias"],
+        "sql": query["sql"],
+        "params": [] if query["many"] else log_params(query["params"]),
+        "duration_ms": round(query["duration_ms"], 3),
+    }
+    if not explain or query["many"] or not is_select(query["sql"]):
+        return entry
+
+    connection = connections[query["alias"]]
+    try:
+        # The savepoint keeps a failing EXPLAIN from breaking an open transaction.
+        with transaction.atomic(using=query["alias"]), connection.cursor() as cursor:
+            cursor.execute(
+                f"{connection.ops.explain_query_prefix()} {query['sql']}", query["params"]
+            )
+            entry["explain"] = "\n".join(
+                " ".join(str(value) for value in row) for row in cursor.fetchall()
+            )
+    except Exception as error:
+        entry["explain_error"] = str(error)
+    return entry
+
+
+def is_select(sql):
+    return sql.lstrip()[:6].upper() in ("SELECT", "WITH ")
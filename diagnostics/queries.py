@@ -0,0 +1,217 @@
+import logging
+import queue
+import threading
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIAGNOSTICS = {
+    # Queries taking longer are logged as SlowQuery, None disables the log.
+    "SLOW_QUERY_MS": 200,
+    # Number of slow queries kept, older ones are deleted.
+    "MAX_SLOW_QUERIES": 10000,
+    # Maximum number of slow queries written per batch.
+    "BATCH_SIZE": 100,
+    # Number of profile reports kept, older ones are deleted.
+    "MAX_PROFILE_REPORTS": 500,
+    # Request header and query parameter asking for a profile of the request.
+    "PROFILE_HEADER": "X-Profile",
+    "PROFILE_PARAM": "profile",
+    # Profiler used unless the request asks for another one.
+    "PROFILER": "cprofile",
+    # Store the values of query parameters. Off by default, as they include
+    # password hashes and personal data; only their types are stored then.
+    "LOG_PARAMS": False,
+    # Run EXPLAIN for the SELECT queries of profiled requests.
+    "EXPLAIN": True,
+    # Number of functions listed in the summary of a cProfile profile.
+    "PROFILE_LINES": 60,
+    # Write slow queries in the querying thread instead of the background worker.
+    "EAGER": False,
+}
+
+# The (method, path) of the request being handled, set by DiagnosticsMiddleware.
+current_request = ContextVar("current_request", default=("", ""))
+
+# The list collecting the queries of a profiled request.
+captured_queries = ContextVar("captured_queries", default=None)
+
+# Disabled while slow queries are written, so the log does not log itself.
+logging_enabled = ContextVar("logging_enabled", default=True)
+
+
+def get_diagnostics_settings():
+    return {**DEFAULT_DIAGNOSTICS, **getattr(settings, "DIAGNOSTICS", {})}
+
+
+def to_json(params):
+    """
+    Converts query parameters into JSON serializable values.
+
+    Args:
+    - params: The parameters, a sequence or a mapping.
+
+    Returns:
+    - list | dict: The parameters, with values other than numbers, strings and None as strings.
+    """
+
+    def convert(value):
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        return str(value)
+
+    if isinstance(params, dict):
+        return {name: convert(value) for name, value in params.items()}
+    return [convert(value) for value in params or ()]
+
+
+def redact(params):
+    """
+    Replaces query parameters by their type names, keeping None.
+
+    Args:
+    - params: The parameters, a sequence or a mapping.
+
+    Returns:
+    - list | dict: The parameters as strings like '<str>'.
+    """
+
+    def convert(value):
+        return None if value is None else f"<{type(value).__name__}>"
+
+    if isinstance(params, dict):
+        return {name: convert(value) for name, value in params.items()}
+    return [convert(value) for value in params or ()]
+
+
+def log_params(params):
+    """
+    Returns query parameters the way the diagnostics store them, see LOG_PARAMS.
+
+    Args:
+    - params: The parameters, a sequence or a mapping.
+
+    Returns:
+    - list | dict: The JSON serializable parameters, redacted unless LOG_PARAMS is set.
+    """
+
+    if get_diagnostics_settings()["LOG_PARAMS"]:
+        return to_json(params)
+    return redact(params)
+
+
+def observe_query(sql, params, many, context, duration):
+    """
+    Query observer logging slow queries and capturing those of profiled requests.
+
+    Registered with book_store.metrics.add_query_observer(), so queries are
+    timed once by the execute wrapper of the metrics. Queries are logged as
+    SlowQuery once they take longer than SLOW_QUERY_MS. While a request is
+    profiled, every query is collected with its parameters and duration.
+    """
+
+    duration_ms = duration * 1000
+    captured = captured_queries.get()
+    if captured is not None:
+        captured.append(
+            {
+                "alias": context["connection"].alias,
+                "sql": sql,
+                "params": params,
+                "many": many,
+                "duration_ms": duration_ms,
+            }
+        )
+    threshold = get_diagnostics_settings()["SLOW_QUERY_MS"]
+    if threshold is not None and duration_ms > threshold and logging_enabled.get():
+        method, path = current_request.get()
+        slow_query_log.put(
+            {
+                "duration_ms": duration_ms,
+                "alias": context["connection"].alias,
+                "sql": sql,
+                "params": [] if many else log_params(params),
+                "method": method,
+                "path": path[:2000],
+            }
+        )
+
+
+def write_slow_queries(entries):
+    """
+    Stores slow queries and deletes the oldest beyond MAX_SLOW_QUERIES.
+
+    Args:
+    - entries: The field values of the SlowQuery instances.
+    """
+
+    from .models import SlowQuery
+
+    token = logging_enabled.set(False)
+    try:
+        SlowQuery.objects.bulk_create([SlowQuery(**entry) for entry in entries])
+        limit = get_diagnostics_settings()["MAX_SLOW_QUERIES"]
+        oldest_kept = SlowQuery.objects.order_by("-id").values_list("id", flat=True)[
+            limit - 1 : limit
+        ]
+        if oldest_kept:
+            SlowQuery.objects.filter(id__lt=oldest_kept[0]).delete()
+    finally:
+        logging_enabled.reset(token)
+
+
+class SlowQueryLog:
+    """
+    Background queue writing slow queries in batches.
+
+    Queries are handed over by record_query() and written by a single daemon
+    thread, so logging does not slow down the request any further and never
+    writes inside the request's transaction.
+
+    Methods:
+    - put(self, entry): Queues a slow query.
+    - join(self): Blocks until all queued queries have been written.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def put(self, entry):
+        if get_diagnostics_settings()["EAGER"]:
+            write_slow_queries([entry])
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="slow-query-log", daemon=True)
+                self.thread.start()
+        self.queue.put(entry)
+
+    def join(self):
+        self.queue.join()
+
+    def run(self):
+        logging_enabled.set(False)
+        while True:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < get_diagnostics_settings()["BATCH_SIZE"]:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            try:
+                write_slow_queries(batch)
+            except Exception:
+                logger.exception("Writing %d slow queries failed.", len(batch))
+            finally:
+                connections.close_all()
+                for _ in batch:
+                    self.queue.task_done()
+
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,177 @@
+import marshal
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+from books.cache import get_response_cache
+from books.models import Book
+from users.models import CustomUser
+from users.tokens import CustomRefreshToken
+from book_store.metrics import record_query
+from book_store.testing import APITestCase
+from .models import ProfileReport, SlowQuery
+
+
+class SlowQueryLogTests(APITestCase):
+
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = CustomUser.objects.create_user(
+            username="testuser1", email="testuser1@example.com", password="Testpassword"
+        )
+        Book.objects.create(
+            title="Book One", description="Description", author=self.user, price="10.00"
+        )
+
+    def test_slow_queries_are_logged(self):
+        with override_settings(DIAGNOSTICS={"SLOW_QUERY_MS": 0, "EAGER": True}):
+            self.client.get(reverse("books_list"), {"page_size": 5})
+        entry = SlowQuery.objects.filter(sql__contains="books_book").first()
+        self.assertIsNotNone(entry)
+        self.assertEqual(entry.method, "GET")
+        self.assertEqual(entry.path, reverse("books_list") + "?page_size=5")
+        self.assertEqual(entry.alias, "default")
+        # The log does not log its own queries.
+        self.assertFalse(SlowQuery.objects.filter(sql__contains="diagnostics_slowquery").exists())
+
+    def test_query_params_are_redacted(self):
+        self.user.set_password("Newpassword")
+        with override_settings(DIAGNOSTICS={"SLOW_QUERY_MS": 0, "EAGER": True}):
+            self.user.save()
+        entry = SlowQuery.objects.get(sql__startswith='UPDATE "users_customuser"')
+        self.assertNotIn(self.user.password, entry.params)
+        self.assertIn("<str>", entry.params)
+
+        with override_settings(
+            DIAGNOSTICS={"SLOW_QUERY_MS": 0, "EAGER": True, "LOG_PARAMS": True}
+        ):
+            self.user.save()
+        entry = SlowQuery.objects.filter(sql__startswith='UPDATE "users_customuser"').first()
+        self.assertIn(self.user.password, entry.params)
+
+    def test_queries_are_timed_by_one_wrapper(self):
+        with override_settings(DIAGNOSTICS={"SLOW_QUERY_MS": 0, "EAGER": True}):
+            self.client.get(reverse("books_list"))
+        self.assertEqual(connection.execute_wrappers, [record_query])
+        self.assertTrue(SlowQuery.objects.filter(sql__contains="books_book").exists())
+
+    def test_fast_queries_are_not_logged(self):
+        with override_settings(DIAGNOSTICS={"SLOW_QUERY_MS": 10000, "EAGER": True}):
+            self.client.get(reverse("books_list"))
+        with override_settings(DIAGNOSTICS={"SLOW_QUERY_MS": None, "EAGER": True}):
+            self.client.get(reverse("books_list"))
+        self.assertEqual(SlowQuery.objects.count(), 0)
+
+    def test_old_slow_queries_are_deleted(self):
+        with override_settings(
+            DIAGNOSTICS={"SLOW_QUERY_MS": 0, "EAGER": True, "MAX_SLOW_QUERIES": 3}
+        ):
+            for page_size in range(1, 6):
+                self.client.get(reverse("books_list"), {"page_size": page_size})
+        self.assertEqual(SlowQuery.objects.count(), 3)
+        self.assertEqual(SlowQuery.objects.first().path, reverse("books_list") + "?page_size=5")
+
+
+class ProfilingTests(APITestCase):
+
+    def setUp(self):
+        get_response_cache().clear()
+        self.staff = CustomUser.objects.create_user(
+            username="staff", email="staff@example.com", password="Testpassword", is_staff=True
+        )
+        self.user = CustomUser.objects.create_user(
+            username="testuser1", email="testuser1@example.com", password="Testpassword"
+        )
+        Book.objects.create(
+            title="Book One", description="Description", author=self.user, price="10.00"
+        )
+
+    def authenticate(self, user):
+        token = CustomRefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_staff_requests_are_profiled(self):
+        self.authenticate(self.staff)
+        response = self.client.get(reverse("books_list"), {"profile": "1"})
+        self.assertEqual(response.status_code, 200)
+        report = ProfileReport.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual(report.user, self.staff)
+        self.assertEqual(report.profiler, "cprofile")
+        self.assertEqual(report.status_code, 200)
+        self.assertGreater(report.query_count, 0)
+        self.assertEqual(report.query_count, len(report.queries))
+        self.assertTrue(any("books_book" in query["sql"] for query in report.queries))
+        self.assertTrue(any(query.get("explain") for query in report.queries))
+        params = [param for query in report.queries for param in query["params"]]
+        self.assertTrue(all(param is None or param.startswith("<") for param in params))
+        self.assertIn("cumulative", report.profile_text)
+        self.assertIsInstance(marshal.loads(bytes(report.profile_data)), dict)
+
+        response = self.client.get(reverse("books_list"), HTTP_X_PROFILE="cprofile")
+        self.assertIn("X-Profile-Id", response)
+
+    def test_other_requests_are_not_profiled(self):
+        response = self.client.get(reverse("books_list"), {"profile": "1"})
+        self.assertNotIn("X-Profile-Id", response)
+        self.authenticate(self.user)
+        response = self.client.get(reverse("books_list"), {"profile": "1"})
+        self.assertNotIn("X-Profile-Id", response)
+        self.authenticate(self.staff)
+        response = self.client.get(reverse("books_list"), {"profile": "0"})
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(ProfileReport.objects.count(), 0)
+
+    def test_old_reports_are_deleted(self):
+        self.authenticate(self.staff)
+        with override_settings(DIAGNOSTICS={"MAX_PROFILE_REPORTS": 2}):
+            for page_size in range(1, 5):
+                response = self.client.get(
+                    reverse("books_list"), {"profile": "1", "page_size": page_size}
+                )
+        self.assertEqual(ProfileReport.objects.count(), 2)
+        self.assertEqual(ProfileReport.objects.latest("id").pk, int(response["X-Profile-Id"]))
+
+    def test_reports_download_in_their_format(self):
+        self.staff.is_superuser = True
+        self.staff.save()
+        self.client.force_login(self.staff)
+        report = ProfileReport.objects.create(
+            user=self.staff,
+            method="GET",
+            path="/books/",
+            status_code=200,
+            duration_ms=1,
+            query_count=0,
+            query_time_ms=0,
+            profiler="pyinstrument",
+            profile_text="",
+            profile_data=b"<html></html>",
+            queries=[],
+        )
+        response = self.client.get(
+            reverse("admin:diagnostics_profilereport_download", args=[report.pk])
+        )
+        self.assertEqual(response["Content-Type"], "text/html")
+        self.assertIn(f'profile-{report.pk}.html"', response["Content-Disposition"])
+
+    def test_reports_in_admin(self):
+        self.staff.is_superuser = True
+        self.staff.save()
+        self.authenticate(self.staff)
+        response = self.client.get(reverse("books_list"), {"profile": "1"})
+        download_url = response["X-Profile-Url"]
+
+        self.client.credentials()
+        self.assertEqual(self.client.get(download_url).status_code, 302)
+        self.client.force_login(self.staff)
+        response = self.client.get(download_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("attachment;", response["Content-Disposition"])
+        self.assertIsInstance(marshal.loads(response.content), dict)
+
+        report_id = ProfileReport.objects.get().pk
+        response = self.client.get(
+            reverse("admin:diagnostics_profilereport_change", args=[report_id])
+        )
+        self.assertContains(response, "books_book")
+        response = self.client.get(reverse("admin:diagnostics_slowquery_changelist"))
+        self.assertEqual(response.status_code, 200)
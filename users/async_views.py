@@ -0,0 +1,44 @@
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from rest_framework.response import Response
+from book_store.async_views import AsyncAPIView, get_request_data
+from .serializers import CustomUserSerializer
+from .views import CreateCustomUser, TokenObtainPairView
+
+
+class AsyncCreateCustomUser(AsyncAPIView, CreateCustomUser):
+    """
+    Async version of CreateCustomUser.
+
+    The password is hashed in the worker pool of users/hashers.py while the
+    request waits on the event loop, so a signup does not hold the thread that
+    runs the sync views and the ORM under ASGI.
+
+    Methods:
+    - post(self, request): Creates a new user with the provided data.
+    """
+
+    async def post(self, request):
+        serializer = CustomUserSerializer(data=await get_request_data(request))
+        if not await sync_to_async(serializer.is_valid)():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        await serializer.acreate()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class AsyncTokenObtainPairView(AsyncAPIView, TokenObtainPairView):
+    """
+    Async version of TokenObtainPairView.
+
+    The password is verified in the worker pool of users/hashers.py while the
+    request waits on the event loop, so concurrent logins are hashed in
+    parallel instead of one after the other, and do not delay other requests.
+
+    Methods:
+    - post(self, request): Returns a token pair for valid credentials.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=await get_request_data(request))
+        attrs = serializer.to_internal_value(serializer.initial_data)
+        return Response(await serializer.avalidate(attrs), status=status.HTTP_200_OK)
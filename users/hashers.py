@@ -0,0 +1,192 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    ScryptPasswordHasher,
+    make_password,
+    verify_password,
+)
+
+
+DEFAULT_PASSWORD_HASHING = {
+    # Cost parameters of scrypt, n (a power of 2), r and p.
+    "SCRYPT": {"WORK_FACTOR": 2**14, "BLOCK_SIZE": 8, "PARALLELISM": 1},
+    # Cost parameters of Argon2id, memory in KiB.
+    "ARGON2": {"TIME_COST": 2, "MEMORY_COST": 19456, "PARALLELISM": 1},
+    # Upper bound in bytes for the memory scrypt may use to verify a hash.
+    "MAXMEM": 256 * 1024 * 1024,
+    # Number of passwords hashed at the same time, defaults to the number of CPUs.
+    "WORKERS": None,
+}
+
+THREAD_NAME_PREFIX = "password-hashing"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_password_hashing_settings():
+    options = getattr(settings, "PASSWORD_HASHING", {})
+    return {
+        **DEFAULT_PASSWORD_HASHING,
+        **options,
+        "SCRYPT": {**DEFAULT_PASSWORD_HASHING["SCRYPT"], **options.get("SCRYPT", {})},
+        "ARGON2": {**DEFAULT_PASSWORD_HASHING["ARGON2"], **options.get("ARGON2", {})},
+    }
+
+
+def get_executor():
+    """
+    Returns the worker pool hashing passwords, creating it on first use.
+
+    Returns:
+    - ThreadPoolExecutor: The worker pool.
+    """
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_password_hashing_settings()["WORKERS"] or os.cpu_count(),
+                thread_name_prefix=THREAD_NAME_PREFIX,
+            )
+        return _executor
+
+
+def run_in_pool(task, *args):
+    """
+    Runs a hashing task in the bounded worker pool and waits for its result.
+
+    Hashing releases the GIL, so the pool bounds the CPU time spent on it: under
+    a burst of signups or logins, requests queue for a worker instead of all
+    hashing at once, and requests that do not hash are not starved. The calling
+    thread is blocked until the hash is done, so async code uses arun_in_pool()
+    instead.
+
+    Args:
+    - task: The hashing function.
+    - *args: The arguments of the function.
+
+    Returns:
+    - The result of the task.
+    """
+
+    if threading.current_thread().name.startswith(THREAD_NAME_PREFIX):
+        return task(*args)
+    return get_executor().submit(task, *args).result()
+
+
+async def arun_in_pool(task, *args):
+    """
+    Async version of run_in_pool().
+
+    The coroutine awaits the worker without occupying a thread, in particular
+    not the single thread that runs thread sensitive sync code under ASGI, so
+    other requests are served while a password is hashed.
+    """
+
+    return await asyncio.wrap_future(get_executor().submit(task, *args))
+
+
+async def amake_password(password):
+    """
+    Hashes a password with the preferred hasher in the worker pool.
+
+    Args:
+    - password: The raw password.
+
+    Returns:
+    - str: The encoded password.
+    """
+
+    return await arun_in_pool(make_password, password)
+
+
+async def acheck_password(user, password):
+    """
+    Async version of user.check_password(), verifying the password in the worker pool.
+
+    Like check_password(), an outdated hash of a correct password is replaced
+    with a hash of the preferred hasher and saved.
+
+    Args:
+    - user: The user to check the password of.
+    - password: The raw password.
+
+    Returns:
+    - bool: Whether the password is correct.
+    """
+
+    is_correct, must_update = await arun_in_pool(verify_password, password, user.password)
+    if is_correct and must_update:
+        user.password = await amake_password(password)
+        await user.asave(update_fields=["password"])
+    return is_correct
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """
+    Scrypt password hasher with cost parameters from the PASSWORD_HASHING setting.
+
+    Stored hashes whose parameters differ from the settings are upgraded the next
+    time the user logs in, like hashes of any other than the preferred hasher.
+
+    Attributes:
+    - work_factor: The scrypt n parameter.
+    - block_size: The scrypt r parameter.
+    - parallelism: The scrypt p parameter.
+    - maxmem: The memory limit for hashing.
+    """
+
+    @property
+    def work_factor(self):
+        return get_password_hashing_settings()["SCRYPT"]["WORK_FACTOR"]
+
+    @property
+    def block_size(self):
+        return get_password_hashing_settings()["SCRYPT"]["BLOCK_SIZE"]
+
+    @property
+    def parallelism(self):
+        return get_password_hashing_settings()["SCRYPT"]["PARALLELISM"]
+
+    @property
+    def maxmem(self):
+        return get_password_hashing_settings()["MAXMEM"]
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        return run_in_pool(super().encode, password, salt, n, r, p)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2id password hasher with cost parameters from the PASSWORD_HASHING setting.
+
+    Requires the argon2-cffi package.
+
+    Attributes:
+    - time_cost: The number of iterations.
+    - memory_cost: The memory used in KiB.
+    - parallelism: The number of lanes.
+    """
+
+    @property
+    def time_cost(self):
+        return get_password_hashing_settings()["ARGON2"]["TIME_COST"]
+
+    @property
+    def memory_cost(self):
+        return get_password_hashing_settings()["ARGON2"]["MEMORY_COST"]
+
+    @property
+    def parallelism(self):
+        return get_password_hashing_settings()["ARGON2"]["PARALLELISM"]
+
+    def encode(self, password, salt):
+        return run_in_pool(super().encode, password, salt)
+
+    def verify(self, password, encoded):
+        return run_in_pool(super().verify, password, encoded)
@@ -1,8 +1,16 @@
-from rest_framework import serializers
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+from rest_framework import exceptions, serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from book_store.metrics import TimedSerializerMixin, timer
+from .hashers import acheck_password, amake_password
 from .models import CustomUser
+from .tokens import CustomRefreshToken
 
 
-class CustomUserSerializer(serializers.ModelSerializer):
+class CustomUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     CustomUserSerializer class for serializing and deserializing CustomUser instances.
 
@@ -12,6 +20,7 @@ class CustomUserSerializer(serializers.ModelSerializer):
 
     Methods:
     - create: Creates a new CustomUser instance with hashed password.
+    - acreate: Async version of create, hashing the password without blocking a thread.
     """
 
     class Meta:
@@ -24,7 +33,8 @@ class CustomUserSerializer(serializers.ModelSerializer):
         Creates a new CustomUser instance.
 
         This method overrides the default create method to ensure that
-        the password is hashed before saving the user instance.
+        the password is hashed before saving the user instance. A password
+        already hashed by acreate() is passed as 'password_hash'.
 
         Args:
         - validated_data: Dictionary containing the validated data for the user.
@@ -33,10 +43,71 @@ class CustomUserSerializer(serializers.ModelSerializer):
         - CustomUser: The newly created CustomUser instance.
         """
 
-        user = CustomUser.objects.create_user(
-            username=validated_data["username"],
-            email=validated_data["email"],
-            password=validated_data["password"],
+        user = CustomUser(
+            username=CustomUser.normalize_username(validated_data["username"]),
+            email=CustomUser.objects.normalize_email(validated_data["email"]),
             author_pseudonym=validated_data["author_pseudonym"],
         )
+        user.password = validated_data.get("password_hash") or make_password(
+            validated_data["password"]
+        )
+        user.save()
         return user
+
+    async def acreate(self):
+        """
+        Saves the validated user, hashing the password in the worker pool first.
+
+        Returns:
+        - CustomUser: The newly created CustomUser instance.
+        """
+
+        password_hash = await amake_password(self.validated_data["password"])
+        return await sync_to_async(self.save)(password_hash=password_hash)
+
+
+class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Token pair serializer issuing tokens that carry the user claims.
+
+    The access tokens include the username and author pseudonym, which lets
+    CustomJWTAuthentication authenticate requests without a user query.
+
+    Attributes:
+    - token_class: The refresh token class adding the user claims.
+
+    Methods:
+    - validate(self, attrs): Checks the credentials, measured as the 'auth' phase.
+    - avalidate(self, attrs): Async version of validate, verifying the password in the worker pool.
+    - aauthenticate(self, username, password): Async version of ModelBackend.authenticate.
+    """
+
+    token_class = CustomRefreshToken
+
+    def validate(self, attrs):
+        with timer("auth"):
+            return super().validate(attrs)
+
+    async def avalidate(self, attrs):
+        with timer("auth"):
+            self.user = await self.aauthenticate(attrs[self.username_field], attrs["password"])
+        if not api_settings.USER_AUTHENTICATION_RULE(self.user):
+            raise exceptions.AuthenticationFailed(
+                self.error_messages["no_active_account"], "no_active_account"
+            )
+
+        refresh = self.get_token(self.user)
+        if api_settings.UPDATE_LAST_LOGIN:
+            self.user.last_login = timezone.now()
+            await self.user.asave(update_fields=["last_login"])
+        return {"refresh": str(refresh), "access": str(refresh.access_token)}
+
+    async def aauthenticate(self, username, password):
+        user = await CustomUser.objects.filter(**{self.username_field: username}).afirst()
+        if user is None:
+            # Hashes the password anyway, so unknown usernames take as long as wrong passwords.
+            await amake_password(password)
+            return None
+        if await acheck_password(user, password) and user.is_active:
+            return user
+        return None
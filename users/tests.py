@@ -1,5 +1,17 @@
-from rest_framework.test import APITestCase
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import ScryptPasswordHasher, make_password
+from django.test import AsyncRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from django.urls import reverse
+from book_store.testing import APITestCase
+from . import hashers
+from .async_views import AsyncCreateCustomUser, AsyncTokenObtainPairView
+from .authentication import token_cache
 from .models import CustomUser
 
 
@@ -18,3 +30,190 @@ class UserTests(APITestCase):
         )
         self.assertEqual(response.status_code, 201)
         self.assertEqual(CustomUser.objects.count(), 1)
+
+
+class TokenAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username="testuser1",
+            email="testuser1@example.com",
+            password="Testpassword",
+            author_pseudonym="testpseudonym",
+        )
+
+    def obtain_access_token(self, username="testuser1"):
+        response = self.client.post(
+            reverse("token_obtain_pair"),
+            {"username": username, "password": "Testpassword"},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data["access"]
+
+    def test_access_token_carries_user_claims(self):
+        token = AccessToken(self.obtain_access_token())
+        self.assertEqual(token["username"], "testuser1")
+        self.assertEqual(token["author_pseudonym"], "testpseudonym")
+
+    def test_token_user_needs_no_user_query(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.obtain_access_token())
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("auth_books"))
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(
+            reverse("auth_books"),
+            {"title": "New Book", "description": "Description", "price": "9.99"},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["author"]["username"], "testuser1")
+
+    def test_token_without_claims_loads_user(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("auth_books"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_user_is_checked_by_permissions(self):
+        CustomUser.objects.create_user(
+            username="darthvader",
+            email="darthvader@example.com",
+            password="Testpassword",
+            author_pseudonym="SithLord",
+        )
+        token = self.obtain_access_token("darthvader")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + token)
+        response = self.client.post(
+            reverse("auth_books"),
+            {"title": "New Book", "description": "Description", "price": "9.99"},
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_validated_tokens_are_cached_until_expiry(self):
+        raw_token = self.obtain_access_token()
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + raw_token)
+        self.client.get(reverse("auth_books"))
+        self.assertIsNotNone(token_cache.get(raw_token.encode()))
+
+        expired = AccessToken(raw_token)
+        expired.set_exp(lifetime=timedelta(seconds=-1))
+        token_cache.set(b"expired", expired)
+        self.assertIsNone(token_cache.get(b"expired"))
+
+
+class PasswordHashingTests(APITestCase):
+
+    def obtain_token(self, username, password="Testpassword"):
+        return self.client.post(
+            reverse("token_obtain_pair"), {"username": username, "password": password}
+        )
+
+    def test_new_passwords_use_scrypt(self):
+        user = CustomUser.objects.create_user(
+            username="testuser1", password="Testpassword", author_pseudonym="test"
+        )
+        self.assertTrue(user.password.startswith("scrypt$16384$"))
+        self.assertEqual(self.obtain_token("testuser1").status_code, 200)
+        self.assertEqual(self.obtain_token("testuser1", "wrong").status_code, 401)
+
+    def test_pbkdf2_password_is_rehashed_on_login(self):
+        user = CustomUser.objects.create(
+            username="testuser1",
+            password=make_password("Testpassword", hasher="pbkdf2_sha256"),
+            author_pseudonym="test",
+        )
+        self.assertEqual(self.obtain_token("testuser1").status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("scrypt$"))
+
+    def test_changed_cost_is_applied_on_login(self):
+        user = CustomUser.objects.create_user(
+            username="testuser1", password="Testpassword", author_pseudonym="test"
+        )
+        with self.settings(PASSWORD_HASHING={"SCRYPT": {"WORK_FACTOR": 2**12}}):
+            self.assertEqual(self.obtain_token("testuser1").status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("scrypt$4096$"))
+        self.assertTrue(user.check_password("Testpassword"))
+
+
+class AsyncPasswordHashingTests(APITestCase):
+
+    def setUp(self):
+        for username in ("testuser1", "testuser2"):
+            CustomUser.objects.create_user(
+                username=username, password="Testpassword", author_pseudonym="test"
+            )
+
+    def post(self, view, path, data):
+        request = AsyncRequestFactory().post(path, data, content_type="application/json")
+        return view.as_view()(request)
+
+    async def test_concurrent_logins_are_hashed_in_parallel(self):
+        events = []
+        encode = ScryptPasswordHasher.encode
+
+        def slow_encode(hasher, *args):
+            time.sleep(0.3)
+            return encode(hasher, *args)
+
+        async def login(username):
+            data = {"username": username, "password": "Testpassword"}
+            response = await self.post(AsyncTokenObtainPairView, "/api/token/", data)
+            events.append("login")
+            return response
+
+        async def sync_request():
+            await asyncio.sleep(0.05)
+            await sync_to_async(events.append)("sync")
+
+        executor = ThreadPoolExecutor(2, thread_name_prefix=hashers.THREAD_NAME_PREFIX)
+        with (
+            mock.patch.object(hashers, "_executor", executor),
+            mock.patch.object(ScryptPasswordHasher, "encode", slow_encode),
+        ):
+            start = time.perf_counter()
+            responses = await asyncio.gather(
+                login("testuser1"), login("testuser2"), sync_request()
+            )
+            elapsed = time.perf_counter() - start
+        executor.shutdown()
+
+        self.assertEqual([response.status_code for response in responses[:2]], [200, 200])
+        # Thread sensitive sync code runs while the passwords are hashed, and
+        # the two hashes take about as long as one.
+        self.assertEqual(events, ["sync", "login", "login"])
+        self.assertLess(elapsed, 0.55)
+
+    async def test_async_login_rejects_wrong_password(self):
+        data = {"username": "testuser1", "password": "wrong"}
+        response = await self.post(AsyncTokenObtainPairView, "/api/token/", data)
+        self.assertEqual(response.status_code, 401)
+        data = {"username": "unknown", "password": "Testpassword"}
+        response = await self.post(AsyncTokenObtainPairView, "/api/token/", data)
+        self.assertEqual(response.status_code, 401)
+
+    async def test_async_login_rehashes_outdated_password(self):
+        user = await CustomUser.objects.aget(username="testuser1")
+        user.password = make_password("Testpassword", hasher="pbkdf2_sha256")
+        await user.asave()
+        data = {"username": "testuser1", "password": "Testpassword"}
+        response = await self.post(AsyncTokenObtainPairView, "/api/token/", data)
+        self.assertEqual(response.status_code, 200)
+        await user.arefresh_from_db()
+        self.assertTrue(user.password.startswith("scrypt$"))
+
+    async def test_async_signup_hashes_password(self):
+        data = {
+            "username": "testuser3",
+            "password": "Testpassword",
+            "email": "test@test.de",
+            "author_pseudonym": "testpseudonym",
+        }
+        response = await self.post(AsyncCreateCustomUser, "/signup/", data)
+        self.assertEqual(response.status_code, 201)
+        user = await CustomUser.objects.aget(username="testuser3")
+        self.assertTrue(user.password.startswith("scrypt$"))
+        self.assertTrue(await hashers.acheck_password(user, "Testpassword"))
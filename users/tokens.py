@@ -0,0 +1,24 @@
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+# Claims identifying the user without a database query, see CustomJWTAuthentication.
+USER_CLAIMS = ("username", "author_pseudonym")
+
+
+class CustomRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the username and author pseudonym of its user.
+
+    The claims are copied into every access token created from the refresh
+    token, so authenticated requests can build the user from the token alone.
+
+    Methods:
+    - for_user(cls, user): Returns a refresh token for the user, including the user claims.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from .models import CustomUser
 from .serializers import CustomUserSerializer
 from rest_framework.permissions import AllowAny
+from rest_framework_simplejwt import views as jwt_views
 
 
 class CreateCustomUser(APIView):
@@ -12,12 +13,14 @@ class CreateCustomUser(APIView):
 
     This view supports the POST method for creating a new user.
     The view does not require authentication, allowing any user to register.
+    Signups are throttled per client address with the 'auth' scope.
 
     Methods:
     - post: Creates a new user with the provided data.
     """
 
     permission_classes = [AllowAny]
+    throttle_scope = "auth"
 
     def post(self, request):
         """
@@ -39,3 +42,19 @@ class CreateCustomUser(APIView):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class TokenObtainPairView(jwt_views.TokenObtainPairView):
+    """
+    Token endpoint of simplejwt, throttled per client address with the 'auth' scope.
+    """
+
+    throttle_scope = "auth"
+
+
+class TokenRefreshView(jwt_views.TokenRefreshView):
+    """
+    Token refresh endpoint of simplejwt, throttled per client address with the 'auth' scope.
+    """
+
+    throttle_scope = "auth"